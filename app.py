@@ -1,23 +1,38 @@
 # create a fastapi app with two endpoints list running streams and list upcoming streams
 
-import asyncio
-from typing import List
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import select, func
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
+from internal.async_redis import AsyncRedisClient
 from internal.database import init_db
 from internal.dependencies import get_session
 from internal.env import Env
+from internal.redis import TRW_STREAM_CHAT_MAXLEN
 from internal.models.hurawatch import HuraWatchMovie, HuraWatchGenre
 from internal.models.libgen import LibgenBook, LibgenTopic
-from internal.redis import RedisClient
-from internal.schemas import TRWStream, TRWUpcomingStream, DudestreamStream, HurawatchMoviesResponse, HurawatchMovieSchema, LibgenBookSchema, LibgenBooksResponse
-from internal.websocket import ConnectionManager
+from internal.schemas import MessageParserStats, RedisCommandStats, TRWStream, TRWCaptureSchedulerState, TRWCaptureSlotsResponse, TRWDiscoverySweep, TRWUpcomingStream, TRWCampus, DudestreamStream, HurawatchMoviesResponse, HurawatchMovieSchema, LibgenBookSchema, LibgenBooksResponse, CatalogSource, SearchResultSchema, SearchResponse
+from internal.search import search_catalog
+from internal.websocket import CHAT_REPLAY_COUNT, ConnectionManager
+
+redis_client = AsyncRedisClient(host=Env.REDIS_HOST, port=Env.REDIS_PORT)
+init_db()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await redis_client.migrate_trw_running_streams()
+    await redis_client.migrate_trw_upcoming_streams()
+    yield
+    await redis_client.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS allow all origins
 origins = ["*"]
@@ -30,39 +45,128 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-redis_client = RedisClient(host=Env.REDIS_HOST, port=Env.REDIS_PORT)
-init_db()
+RECORDS_PER_PAGE = 12
+
+
+async def get_cached_count(key: str, count_query, session: Session) -> int:
+    """Total rows for a catalog filter, cached in redis so pages don't recount the table."""
+    total_records = await redis_client.get_catalog_count(key)
+    if total_records is None:
+        total_records = session.execute(count_query).scalar_one()
+        await redis_client.set_catalog_count(key, total_records)
+    return total_records
+
+
+async def get_libgen_topic_counts(session: Session) -> Dict[int, int]:
+    """Books per subtopic, cached in redis so filtered totals are a sum instead of a COUNT."""
+    topic_counts = await redis_client.get_libgen_topic_counts()
+    if topic_counts is None:
+        topic_counts = dict(
+            session.execute(
+                select(LibgenBook.topic_id, func.count(LibgenBook.id)).group_by(LibgenBook.topic_id)
+            ).all()
+        )
+        await redis_client.set_libgen_topic_counts(topic_counts)
+    return topic_counts
+
+
+def get_libgen_topics(session: Session) -> Dict[int, LibgenTopic]:
+    return {libgen_topic.id: libgen_topic for libgen_topic in session.scalars(select(LibgenTopic)).all()}
+
+
+def hurawatch_movie_schema(movie: HuraWatchMovie) -> HurawatchMovieSchema:
+    return HurawatchMovieSchema(
+        id=movie.id,
+        title=movie.title,
+        movie_embed_url=movie.movie_embed_url,
+        thumbnail_url=movie.thumbnail_url,
+        storyline=movie.storyline,
+        directors=movie.directors,
+        writers=movie.writers,
+        stars=movie.stars,
+        is_movie=movie.is_movie,
+        genres=[genre.name for genre in movie.genres],
+        episode_embed_urls=[episode.embed_url for episode in movie.episodes],
+    )
+
+
+def libgen_book_schema(book: LibgenBook, topics: Dict[int, LibgenTopic]) -> LibgenBookSchema:
+    book_topic = topics[book.topic_id]
+    return LibgenBookSchema(
+        id=book.id,
+        topic_name=topics[book_topic.parent_id].name,
+        subtopic_name=book_topic.name,
+        authors=book.authors,
+        title=book.title,
+        publisher=book.publisher,
+        year=book.year,
+        pages=book.pages,
+        size=book.size,
+        extension=book.extension,
+        language=book.language,
+        download_link=book.download_link
+    )
 
 
 @app.get("/trw-running-streams", response_model=List[TRWStream])
 async def get_trw_running_streams():
-    return redis_client.get_trw_running_streams()
+    streams = await redis_client.get_trw_running_streams()
+    relay_stats = await redis_client.get_trw_relay_stats()
+    for stream in streams:
+        stream.relay_stats = relay_stats.get(stream.id)
+    return streams
 
 
-@app.get("/trw-upcoming-streams", response_model=List[TRWUpcomingStream])
-async def get_trw_upcoming_streams():
-    upcoming_streams = redis_client.get_trw_upcoming_streams()
+@app.get("/trw-capture-slots", response_model=TRWCaptureSlotsResponse)
+async def get_trw_capture_slots():
+    return TRWCaptureSlotsResponse(
+        slots=await redis_client.get_trw_capture_slots(),
+        startup=await redis_client.get_trw_capture_startup(),
+    )
+
+
+@app.get("/trw-capture-scheduler", response_model=TRWCaptureSchedulerState | None)
+async def get_trw_capture_scheduler():
+    return await redis_client.get_trw_capture_scheduler_state()
+
+
+@app.get("/message-parser-stats", response_model=MessageParserStats)
+async def get_message_parser_stats():
+    return await redis_client.get_message_parser_stats()
+
 
-    upcoming_streams_to_return = []
-    # remove old streams
-    for upcoming_stream in upcoming_streams:
-        if upcoming_stream.is_expired():
-            redis_client.delete_trw_upcoming_stream(upcoming_stream)
-            continue
-        upcoming_streams_to_return.append(upcoming_stream)
-    
-    return upcoming_streams_to_return
+@app.get("/redis-command-stats", response_model=RedisCommandStats)
+async def get_redis_command_stats():
+    return await redis_client.get_redis_command_stats()
+
+
+@app.get("/trw-discovery-sweep", response_model=TRWDiscoverySweep | None)
+async def get_trw_discovery_sweep():
+    return await redis_client.get_trw_discovery_sweep()
+
+
+@app.get("/trw-upcoming-streams", response_model=List[TRWUpcomingStream])
+async def get_trw_upcoming_streams(
+    start: datetime = Query(None, alias="from"),
+    to: datetime = None,
+    campus: TRWCampus = None,
+):
+    # expired streams are never returned, the range always starts at the current time or later
+    return await redis_client.get_trw_upcoming_streams(start, to, campus)
 
 
 @app.get("/dudestream-streams", response_model=List[DudestreamStream])
 async def get_dudestream_streams():
-    return redis_client.get_dudestream_streams()
+    return await redis_client.get_dudestream_streams()
 
 
 @app.get("/hurawatch-movies", response_model=HurawatchMoviesResponse)
-async def get_hurawatch_movies(page: int = None, is_movie: bool = None, genre: str = None, session: Session = Depends(get_session)):
+async def get_hurawatch_movies(page: int = None, is_movie: bool = None, genre: str = None, after_id: int = None, session: Session = Depends(get_session)):
 
-    query = select(HuraWatchMovie)
+    query = select(HuraWatchMovie).options(
+        selectinload(HuraWatchMovie.genres),
+        selectinload(HuraWatchMovie.episodes),
+    )
     count_query = select(func.count(HuraWatchMovie.id))
     if is_movie is not None:
         query = query.where(HuraWatchMovie.is_movie == is_movie)
@@ -71,105 +175,143 @@ async def get_hurawatch_movies(page: int = None, is_movie: bool = None, genre: s
         query = query.join(HuraWatchGenre, HuraWatchMovie.genres).where(HuraWatchGenre.name == genre)
         count_query = count_query.join(HuraWatchGenre, HuraWatchMovie.genres).where(HuraWatchGenre.name == genre)
 
-    if page > 0:
+    if page and page > 0:
         page = page
     else:
         page = 1
-    
-    records_per_page = 12
-    total_records = session.execute(count_query).scalar_one()
-    total_pages = (total_records + records_per_page - 1) // records_per_page
-    query = query.offset((page - 1) * records_per_page).limit(records_per_page)   
-    movies = session.scalars(query).all()
 
-    response_movies = []
-    for movie in movies:
-        episode_embed_urls = []
-        for episode in movie.episodes:
-            episode_embed_urls.append(episode.embed_url)
-        response_movies.append(HurawatchMovieSchema(
-            id=movie.id,
-            title=movie.title,
-            movie_embed_url=movie.movie_embed_url,
-            thumbnail_url=movie.thumbnail_url,
-            storyline=movie.storyline,
-            directors=movie.directors,
-            writers=movie.writers,
-            stars=movie.stars,
-            is_movie=movie.is_movie,
-            genres=[genre.name for genre in movie.genres],
-            episode_embed_urls=episode_embed_urls
-        ))
+    total_records = await get_cached_count(f"hurawatch_movies_{is_movie}_{genre}", count_query, session)
+    total_pages = (total_records + RECORDS_PER_PAGE - 1) // RECORDS_PER_PAGE
+    query = query.order_by(HuraWatchMovie.id)
+    if after_id is not None:
+        # keyset pagination, constant cost however deep the page is
+        query = query.where(HuraWatchMovie.id > after_id)
+    else:
+        query = query.offset((page - 1) * RECORDS_PER_PAGE)
+    query = query.limit(RECORDS_PER_PAGE)
+    movies = session.scalars(query).all()
 
     return HurawatchMoviesResponse(
-        hurawatch_movies=response_movies,
+        hurawatch_movies=[hurawatch_movie_schema(movie) for movie in movies],
         page=page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_after_id=movies[-1].id if len(movies) == RECORDS_PER_PAGE else None,
     )
 
 @app.get("/libgen-books", response_model=LibgenBooksResponse)
-async def get_libgen_movies(page: int = None, topic: str = None, subtopic: str = None, session: Session = Depends(get_session)):
+async def get_libgen_movies(page: int = None, topic: str = None, subtopic: str = None, after_id: int = None, session: Session = Depends(get_session)):
+    # the topic tree is small, resolve it once instead of joining or lazy loading per book
+    topics = get_libgen_topics(session)
+    topic_ids = [
+        libgen_topic.id
+        for libgen_topic in topics.values()
+        if libgen_topic.parent_id is not None
+        and (not topic or topics[libgen_topic.parent_id].name == topic)
+        and (not subtopic or libgen_topic.name == subtopic)
+    ]
+
     query = select(LibgenBook)
-    count_query = select(func.count(LibgenBook.id))
-    if topic:
-        query = query.join(LibgenTopic).where(LibgenTopic.parent.has(name=topic))
-        count_query = count_query.join(LibgenTopic).where(LibgenTopic.parent.has(name=topic))
-    if subtopic:
-        query = query.join(LibgenTopic).where(LibgenTopic.name == subtopic)
-        count_query = count_query.join(LibgenTopic).where(LibgenTopic.name == subtopic)
-
-    if page > 0:
+    if topic or subtopic:
+        query = query.where(LibgenBook.topic_id.in_(topic_ids))
+
+    if page and page > 0:
         page = page
     else:
         page = 1
-    
-    records_per_page = 12
-    total_records = session.execute(count_query).scalar_one()
-    total_pages = (total_records + records_per_page - 1) // records_per_page
-    query = query.offset((page - 1) * records_per_page).limit(records_per_page)   
-    books = session.scalars(query).all()
 
-    response_books = []
-    for book in books:
-        response_books.append(
-            LibgenBookSchema(
-                id=book.id,
-                topic_name=book.topic.parent.name,
-                subtopic_name=book.topic.name,
-                authors=book.authors,
-                title=book.title,
-                publisher=book.publisher,
-                year=book.year,
-                pages=book.pages,
-                size=book.size,
-                extension=book.extension,
-                language=book.language,
-                download_link=book.download_link
-            )
-        )
+    topic_counts = await get_libgen_topic_counts(session)
+    total_records = sum(topic_counts.get(topic_id, 0) for topic_id in topic_ids)
+    total_pages = (total_records + RECORDS_PER_PAGE - 1) // RECORDS_PER_PAGE
+    query = query.order_by(LibgenBook.id)
+    if after_id is not None:
+        query = query.where(LibgenBook.id > after_id)
+    else:
+        query = query.offset((page - 1) * RECORDS_PER_PAGE)
+    query = query.limit(RECORDS_PER_PAGE)
+    books = session.scalars(query).all()
 
     return LibgenBooksResponse(
-        libgen_books=response_books,
+        libgen_books=[libgen_book_schema(book, topics) for book in books],
         page=page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_after_id=books[-1].id if len(books) == RECORDS_PER_PAGE else None,
+    )
+
+
+@app.get("/search", response_model=SearchResponse)
+async def search(
+    q: str,
+    source: CatalogSource = None,
+    is_movie: bool = None,
+    genre: str = None,
+    topic: str = None,
+    subtopic: str = None,
+    page: int = None,
+    session: Session = Depends(get_session),
+):
+    if page and page > 0:
+        page = page
+    else:
+        page = 1
+
+    matches = search_catalog(
+        session,
+        q,
+        source=source,
+        is_movie=is_movie,
+        genre=genre,
+        topic=topic,
+        subtopic=subtopic,
+        limit=RECORDS_PER_PAGE,
+        offset=(page - 1) * RECORDS_PER_PAGE,
     )
 
+    movie_ids = [ref_id for match_source, ref_id, _ in matches if match_source == CatalogSource.HURAWATCH]
+    book_ids = [ref_id for match_source, ref_id, _ in matches if match_source == CatalogSource.LIBGEN]
+    movies = {}
+    if movie_ids:
+        movies = {
+            movie.id: movie
+            for movie in session.scalars(
+                select(HuraWatchMovie)
+                .where(HuraWatchMovie.id.in_(movie_ids))
+                .options(selectinload(HuraWatchMovie.genres), selectinload(HuraWatchMovie.episodes))
+            ).all()
+        }
+    books = {}
+    topics = {}
+    if book_ids:
+        books = {book.id: book for book in session.scalars(select(LibgenBook).where(LibgenBook.id.in_(book_ids))).all()}
+        topics = get_libgen_topics(session)
+
+    results = []
+    for match_source, ref_id, rank in matches:
+        if match_source == CatalogSource.HURAWATCH and ref_id in movies:
+            results.append(SearchResultSchema(source=match_source, rank=rank, hurawatch_movie=hurawatch_movie_schema(movies[ref_id])))
+        elif match_source == CatalogSource.LIBGEN and ref_id in books:
+            results.append(SearchResultSchema(source=match_source, rank=rank, libgen_book=libgen_book_schema(books[ref_id], topics)))
+
+    return SearchResponse(results=results, page=page)
+
 
-manager = ConnectionManager()
+manager = ConnectionManager(redis_client)
 
 
 @app.websocket("/ws/stream-messages/{stream_id}")
-async def get_stream_messages(websocket: WebSocket, stream_id: str):
-    await manager.connect(websocket)
+async def get_stream_messages(
+    websocket: WebSocket,
+    stream_id: str,
+    # entry_id of the last message received before a reconnect, everything after it is sent first
+    last_id: str | None = Query(None, pattern=r"^\d+-\d+$"),
+    # recent messages sent to a viewer without a last_id
+    replay: int = Query(CHAT_REPLAY_COUNT, ge=0, le=TRW_STREAM_CHAT_MAXLEN),
+):
+    await manager.connect(stream_id, websocket, last_id, replay)
     try:
+        # messages are pushed by the stream's subscriber, we only wait for the client to leave
         while True:
-            # Dequeue message from Redis
-            message = redis_client.dequeue_trw_stream_message(stream_id)
-            if message:
-                # Broadcast the message to all connected clients
-                await manager.broadcast(message)
-            await asyncio.sleep(0.1)
+            await websocket.receive_text()
     except WebSocketDisconnect:
         print(f"Client disconnected from stream {stream_id}")
     finally:
-        manager.disconnect(websocket)
+        manager.disconnect(stream_id, websocket)
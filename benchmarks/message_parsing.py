@@ -0,0 +1,101 @@
+"""Accuracy and latency of stream-announcement parsing on a labelled chat corpus.
+
+Runs the local path (keyword pre-filter and rule-based extractor) over
+benchmarks/fixtures/stream_announcements.json and reports precision, recall,
+how many messages it would still send to the LLM and the time per message.
+With --llm the same corpus also goes through MessageParser.parse, which needs
+a real OPENAI_API_KEY.
+
+A stream counts as found when its start time matches and one name contains
+the other, ignoring case.
+
+Usage: python -m benchmarks.message_parsing [--llm]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+
+from internal.announcement_extractor import CONFIDENCE_THRESHOLD, extract_announcements
+from internal.message_parser import MessageParser, might_announce_stream
+from internal.schemas import TRWCampus
+
+CORPUS = Path(__file__).parent / "fixtures" / "stream_announcements.json"
+
+
+def matches(found, expected: dict) -> bool:
+    name, expected_name = found.name.lower(), expected["name"].lower()
+    return found.start_time == datetime.fromisoformat(expected["start_time"]) and (
+        name in expected_name or expected_name in name
+    )
+
+
+def score(results: list) -> tuple[float, float]:
+    """Precision and recall over (found streams, expected streams) pairs."""
+    found_total = sum(len(found) for found, _ in results)
+    expected_total = sum(len(expected) for _, expected in results)
+    correct = sum(
+        sum(1 for stream in expected if any(matches(f, stream) for f in found))
+        for found, expected in results
+    )
+    precision = correct / found_total if found_total else 1.0
+    recall = correct / expected_total if expected_total else 1.0
+    return precision, recall
+
+
+def parse_local(case: dict) -> tuple[list, bool]:
+    """Streams found locally and whether the LLM would still be asked."""
+    if not might_announce_stream(case["message"]):
+        return [], False
+    now = datetime.fromisoformat(case["posted_at"])
+    upcoming_streams, confidence = extract_announcements(case["message"], TRWCampus.STOCKS, now)
+    return upcoming_streams, confidence < CONFIDENCE_THRESHOLD
+
+
+def report(label: str, results: list, latencies: list) -> None:
+    precision, recall = score(results)
+    print(
+        f"{label:<14} precision {precision:6.1%}  recall {recall:6.1%}  "
+        f"median {statistics.median(latencies):9.3f} ms  max {max(latencies):9.3f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm", action="store_true", help="also run the OpenAI parser")
+    args = parser.parse_args()
+    cases = json.loads(CORPUS.read_text())
+
+    local_results, confident_results, latencies = [], [], []
+    deferred = 0
+    for case in cases:
+        started = time.perf_counter()
+        upcoming_streams, needs_llm = parse_local(case)
+        latencies.append((time.perf_counter() - started) * 1000)
+        local_results.append((upcoming_streams, case["expected"]))
+        if needs_llm:
+            deferred += 1
+        else:
+            confident_results.append((upcoming_streams, case["expected"]))
+    print(f"{len(cases)} messages, {deferred} deferred to the LLM by the local path")
+    report("local (all)", local_results, latencies)
+    report("local (sure)", confident_results, latencies)
+
+    if not args.llm:
+        return
+    message_parser = MessageParser(os.environ["OPENAI_API_KEY"])
+    llm_results, latencies = [], []
+    for case in cases:
+        now = datetime.fromisoformat(case["posted_at"])
+        started = time.perf_counter()
+        upcoming_streams = message_parser.parse(case["message"], TRWCampus.STOCKS, now)
+        latencies.append((time.perf_counter() - started) * 1000)
+        llm_results.append((upcoming_streams, case["expected"]))
+    report("llm", llm_results, latencies)
+
+
+if __name__ == "__main__":
+    main()
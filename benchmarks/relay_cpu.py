@@ -0,0 +1,87 @@
+"""Encoder CPU per relayed stream for the capture modes of build_relay_command.
+
+Starts an Xvfb display, renders a mostly static page with a small moving box
+(a presenter's slide with a cursor) and runs the real relay command against it
+for each mode, writing every rendition to a temporary directory. Audio comes from a silent source instead
+of a PulseAudio sink. CPU is read from /proc/<pid>/stat.
+
+Usage: python -m benchmarks.relay_cpu [--seconds 20] [--display :150]
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from internal.utils import RENDITIONS, build_relay_command, start_xvfb
+
+MODES = {
+    "full screen": {},
+    "cropped 960x540": {"capture_region": (160, 90, 960, 540)},
+    "decimated": {"decimate": True},
+    "cropped + decimated": {"capture_region": (160, 90, 960, 540), "decimate": True},
+}
+
+# x11 content with a little motion, mostly static like a slide deck
+CONTENT_COMMAND = [
+    "ffplay", "-loglevel", "quiet", "-noborder", "-left", "0", "-top", "0",
+    "-f", "lavfi", "color=c=white:s=1280x720:r=24,drawbox=x='mod(t*40,1200)':y=300:w=16:h=16:c=black:t=fill",
+]
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime are fields 14 and 15 of the line, 12 and 13 after the ")"
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def relay_command(output_dir: str, display: str, mode: dict) -> list:
+    # the other renditions are written next to this file with a _<name> suffix
+    command = build_relay_command(
+        os.path.join(output_dir, "relay.flv"), "unused", display, [RENDITIONS["720p"], RENDITIONS["480p"]], **mode,
+    )
+    # silent audio instead of the PulseAudio sink monitor
+    pulse = command.index("pulse")
+    command[pulse] = "lavfi"
+    command[pulse + 2] = "anullsrc=r=48000:cl=stereo"
+    return command
+
+
+def measure(display: str, mode: dict, seconds: int) -> float:
+    with tempfile.TemporaryDirectory() as output_dir:
+        process = subprocess.Popen(
+            relay_command(output_dir, display, mode), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            # skip ffmpeg's startup
+            time.sleep(2)
+            started_cpu, started = cpu_seconds(process.pid), time.monotonic()
+            time.sleep(seconds)
+            return (cpu_seconds(process.pid) - started_cpu) / (time.monotonic() - started)
+        finally:
+            process.kill()
+            process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=20)
+    parser.add_argument("--display", default=":150")
+    args = parser.parse_args()
+
+    start_xvfb(args.display)
+    content = subprocess.Popen(CONTENT_COMMAND, env={**os.environ, "DISPLAY": args.display})
+    try:
+        results = {name: measure(args.display, mode, args.seconds) for name, mode in MODES.items()}
+    finally:
+        content.kill()
+
+    baseline = results["full screen"]
+    print(f"cores: {os.cpu_count()}")
+    for name, cpu in results.items():
+        print(f"{name:22} {cpu * 100:6.1f}% of a core, {baseline / cpu:5.1f}x streams per host vs full screen")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Chat latency and missed messages of TRW chat polling against a live fixture feed.
+
+Compares the old full scan every 0.5 s (get_chat_message_payloads) with the
+MutationObserver capture drained every CHAT_POLL_INTERVAL. The fixture keeps only
+the newest --keep nodes, like TRW's virtualized scroller, so a slow poll misses messages.
+
+Usage: python -m benchmarks.trw_chat_capture [--rate 50] [--keep 30] [--seconds 10]
+"""
+import argparse
+import statistics
+import time
+
+from internal.stream_sources.trw import (
+    CHAT_POLL_INTERVAL,
+    drain_chat_capture,
+    get_chat_message_payloads,
+    install_chat_capture,
+)
+from benchmarks.trw_chat_extraction import FIXTURE, start_driver
+
+
+def poll_full_scan(driver, seen: dict) -> None:
+    for payload in get_chat_message_payloads(driver):
+        seen.setdefault(payload["id"], time.time() * 1000)
+
+
+def poll_capture(driver, seen: dict) -> None:
+    payloads = drain_chat_capture(driver)
+    if payloads is None:
+        install_chat_capture(driver)
+        payloads = drain_chat_capture(driver) or []
+    for payload in payloads:
+        seen.setdefault(payload["id"], time.time() * 1000)
+
+
+def run(driver, poll, interval: float, args) -> tuple[float, int, int]:
+    driver.get(f"{FIXTURE.as_uri()}?keep={args.keep}")
+    install_chat_capture(driver)
+    driver.execute_script("startChatFeed(arguments[0])", args.rate)
+    seen = {}
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        poll(driver, seen)
+        time.sleep(interval)
+    created = driver.execute_script("return chatMessageTimes")
+    latencies = [seen[id] - created[id] for id in seen if id in created]
+    return statistics.median(latencies) if latencies else 0.0, len(created) - len(seen), len(created)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=50)
+    parser.add_argument("--keep", type=int, default=30)
+    parser.add_argument("--seconds", type=int, default=10)
+    args = parser.parse_args()
+
+    driver = start_driver()
+    try:
+        full_scan = run(driver, poll_full_scan, 0.5, args)
+        capture = run(driver, poll_capture, CHAT_POLL_INTERVAL, args)
+    finally:
+        driver.quit()
+
+    print(f"messages/sec: {args.rate}, nodes kept: {args.keep}")
+    for name, (latency, missed, total) in (("full scan (before)", full_scan), ("observer capture", capture)):
+        print(f"{name:20} median latency {latency:7.0f} ms, missed {missed}/{total}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Messages/sec of TRW chat extraction against the local fixture chat page.
+
+Compares the per-element WebDriver path (get_chat_messages + parse_message_element)
+with the single execute_script path (get_chat_message_payloads + parse_message_payload).
+
+Usage: python -m benchmarks.trw_chat_extraction [--messages 500] [--rounds 3]
+"""
+import argparse
+import pathlib
+import time
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from internal.stream_sources.trw import (
+    get_chat_messages,
+    get_chat_message_payloads,
+    parse_message_element,
+    parse_message_payload,
+)
+
+FIXTURE = pathlib.Path(__file__).parent / "fixtures" / "trw_chat.html"
+
+
+def start_driver() -> webdriver.Chrome:
+    chrome_opt = Options()
+    chrome_opt.add_argument("--headless=new")
+    chrome_opt.add_argument("--no-sandbox")
+    chrome_opt.add_argument("--disable-dev-shm-usage")
+    return webdriver.Chrome(options=chrome_opt, service=Service(ChromeDriverManager().install()))
+
+
+def extract_per_element(driver: webdriver.Chrome) -> int:
+    parsed = 0
+    for element in get_chat_messages(driver):
+        parse_message_element(element)
+        parsed += 1
+    return parsed
+
+
+def extract_single_script(driver: webdriver.Chrome) -> int:
+    parsed = 0
+    for payload in get_chat_message_payloads(driver):
+        parse_message_payload(payload)
+        parsed += 1
+    return parsed
+
+
+def measure(driver: webdriver.Chrome, extract, rounds: int) -> float:
+    best = 0.0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        parsed = extract(driver)
+        best = max(best, parsed / (time.perf_counter() - started))
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    driver = start_driver()
+    try:
+        driver.get(f"{FIXTURE.as_uri()}?messages={args.messages}")
+        per_element = measure(driver, extract_per_element, args.rounds)
+        single_script = measure(driver, extract_single_script, args.rounds)
+    finally:
+        driver.quit()
+
+    print(f"messages on page:          {args.messages}")
+    print(f"per element (before):      {per_element:10.0f} messages/sec")
+    print(f"single execute_script:     {single_script:10.0f} messages/sec")
+    print(f"speedup:                   {single_script / per_element:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Tuple
+
+from internal.schemas import TRWCampus, TRWUpcomingStream
+from internal.utils import round_to_nearest_15_minutes
+
+# results at or above this are used without asking the LLM
+CONFIDENCE_THRESHOLD = 0.75
+
+TIMEZONE_OFFSETS = {
+    "utc": 0, "gmt": 0, "bst": 1, "cet": 1, "cest": 2, "est": -5, "edt": -4,
+    "cst": -6, "cdt": -5, "mst": -7, "mdt": -6, "pst": -8, "pdt": -7,
+}
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = [
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december",
+]
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "five": 5, "ten": 10, "fifteen": 15, "thirty": 30}
+
+RELATIVE_TIME = re.compile(
+    r"\bin\s+(\d+|an?|one|two|three|five|ten|fifteen|thirty)\s*(minutes?|mins?|hours?|hrs?)\b",
+    re.IGNORECASE,
+)
+CLOCK_TIME = re.compile(
+    r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\s*(" + "|".join(TIMEZONE_OFFSETS) + r")?\b(?!\s*(?:minutes?|mins?|hours?|hrs?|days?|th|st|nd|rd))",
+    re.IGNORECASE,
+)
+NAMED_TIME = re.compile(r"\b(noon|midnight)\b", re.IGNORECASE)
+STARTING_NOW = re.compile(
+    r"\b(?:starting|starts|start|going\s+live|live|begins|beginning)\s+(?:right\s+)?now\b", re.IGNORECASE
+)
+DAY_WORD = re.compile(r"\b(today|tonight|tomorrow|" + "|".join(WEEKDAYS) + r")\b", re.IGNORECASE)
+PAST_MARKER = re.compile(
+    r"\b(was|were|yesterday|last night'?s?|earlier today|thank(s| you) (guys )?for joining|missed)\b",
+    re.IGNORECASE,
+)
+FUTURE_MARKER = re.compile(r"\b(next|will|upcoming|join|starting|starts|tomorrow|tonight|today|in\s+\d+)\b", re.IGNORECASE)
+
+MONTH = r"(" + "|".join(MONTHS) + r")"
+EXPLICIT_DATE = re.compile(
+    r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?" + MONTH + r"\b(?:,?\s+(\d{4})\b)?"
+    r"|\b" + MONTH + r"\s+(\d{1,2})(?:st|nd|rd|th)?\b(?!\s*(?::|am\b|pm\b))(?:,?\s+(\d{4})\b)?",
+    re.IGNORECASE,
+)
+# a line that is only a title case name and a date, like "Crypto Investing Analysis 20th January 2025"
+DATED_TITLE = re.compile(
+    r"^[ \t]*((?:[A-Z0-9][\w'&-]*[ \t]+){1,8}?)\d{1,2}(?:st|nd|rd|th)?[ \t]+(?i:" + "|".join(MONTHS) + r")(?:[ \t]+\d{4})?[ \t]*$",
+    re.MULTILINE,
+)
+HEADING = re.compile(
+    r"^\s*([A-Z][A-Z0-9&' ]+?)\s+(?:LIVE\s+PREMIERE|LIVE\s*STREAM|LIVE)\b",
+    re.MULTILINE,
+)
+NAMED_SESSION = re.compile(
+    r"\b(?i:for|of|on|to|join)\s+(?i:the\s+new\s+|the\s+|today'?s\s+|tonight'?s\s+|tomorrow'?s\s+|our\s+)?"
+    r"((?:[A-Z][\w'&-]*\s+){1,5}?)(series|streams?|calls?|CALL|STREAM|sessions?|AMA)\b",
+)
+# announcement headlines that are not stream names
+GENERIC_NAMES = {"live stream", "livestream", "live", "stream", "the stream", "live streams"}
+
+
+def extract_announcements(
+    message: str, campus: TRWCampus, now: datetime | None = None
+) -> Tuple[List[TRWUpcomingStream], float]:
+    """Upcoming streams announced in a message and how sure the rules are about them.
+
+    Handles the common forms: a relative start ("LIVE STREAM IN 5 MINUTES", "STARTING NOW"), a
+    clock time with a time zone ("starting at 3pm EST", optionally with a day or date)
+    and a name taken from a dated title, an announcement heading or the session
+    the message invites to. Anything else gets a low confidence so the caller
+    can ask the LLM.
+    """
+    now = now or datetime.now(timezone.utc)
+    start_time, time_confident = extract_start_time(message, now)
+    if start_time is None:
+        # the message passed the pre-filter, so a time the rules can't read, like "soon", is left to the LLM
+        return [], 0.4
+    if PAST_MARKER.search(message) and not FUTURE_MARKER.search(message):
+        return [], 0.8
+
+    name = extract_name(message)
+    if name is None:
+        return [], 0.3
+
+    upcoming_stream = TRWUpcomingStream(
+        name=name,
+        start_time=round_to_nearest_15_minutes(start_time),
+        campus=campus,
+    )
+    return [upcoming_stream], 0.9 if time_confident else 0.5
+
+
+def extract_start_time(message: str, now: datetime) -> Tuple[datetime | None, bool]:
+    """Start time in UTC and whether it is unambiguous."""
+    relative = RELATIVE_TIME.search(message)
+    if relative:
+        amount = relative.group(1).lower()
+        amount = int(amount) if amount.isdigit() else NUMBER_WORDS[amount]
+        unit = relative.group(2).lower()
+        delta = timedelta(hours=amount) if unit.startswith("h") else timedelta(minutes=amount)
+        start_time = now + delta
+        try:
+            explicit_day = resolve_date(message, now.date())
+        except ValueError:
+            return start_time, False
+        # a dated title from another day is an old announcement posted again, the title's day is local
+        return start_time, explicit_day is None or abs((explicit_day - start_time.date()).days) <= 1
+
+    clock_times = []
+    for match in CLOCK_TIME.finditer(message):
+        hour, minute, meridiem, zone = match.groups()
+        # a bare number is a count, not a time
+        if minute is None and meridiem is None:
+            continue
+        clock_times.append((int(hour), int(minute or 0), meridiem, zone))
+    if not clock_times:
+        named = NAMED_TIME.search(message)
+        if not named:
+            if STARTING_NOW.search(message):
+                return now, True
+            return None, False
+        clock_times.append((12 if named.group(1).lower() == "noon" else 0, 0, None, None))
+    if len(clock_times) > 1 and len({zone for *_, zone in clock_times if zone}) < 2:
+        # several different times, like two streams, are left to the LLM
+        return None, False
+
+    # the same time given in several zones, prefer UTC
+    hour, minute, meridiem, zone = min(
+        clock_times, key=lambda time: (time[3] or "").lower() not in ("utc", "gmt")
+    )
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower() == "pm" else 0)
+    if hour > 23 or minute > 59:
+        return None, False
+    offset = timedelta(hours=TIMEZONE_OFFSETS[zone.lower()]) if zone else timedelta(0)
+
+    local_now = now.astimezone(timezone(offset))
+    try:
+        explicit_day = resolve_date(message, local_now.date())
+    except ValueError:
+        return None, False
+    day = resolve_day(message, local_now.date())
+    # 24 hour times and am/pm are unambiguous, only the zone can be missing
+    confident = zone is not None
+    if explicit_day is not None:
+        if DAY_WORD.search(message) and day != explicit_day:
+            confident = False
+        day = explicit_day
+    start_time = datetime(day.year, day.month, day.day, hour, minute, tzinfo=timezone(offset))
+    if start_time < local_now - timedelta(hours=1):
+        if explicit_day is not None:
+            # a stream on a day that is over can't be upcoming
+            confident = False
+        elif day == local_now.date() and not DAY_WORD.search(message):
+            # a time that already passed without a day means the next one
+            start_time += timedelta(days=1)
+    return start_time.astimezone(timezone.utc), confident
+
+
+def resolve_day(message: str, today: date) -> date:
+    day_word = DAY_WORD.search(message)
+    if not day_word:
+        return today
+    word = day_word.group(1).lower()
+    if word == "tomorrow":
+        return today + timedelta(days=1)
+    if word in WEEKDAYS:
+        return today + timedelta(days=(WEEKDAYS.index(word) - today.weekday()) % 7)
+    return today
+
+
+def resolve_date(message: str, today: date) -> date | None:
+    """The date a message names, like "25th January 2025" or "May 1st".
+
+    Without a year it is the one closest to today. Raises ValueError for a day
+    that doesn't exist.
+    """
+    match = EXPLICIT_DATE.search(message)
+    if not match:
+        return None
+    day, month, year = (match.group(1), match.group(2), match.group(3)) if match.group(1) else match.group(5, 4, 6)
+    month = MONTHS.index(month.lower()) + 1
+    if year:
+        return date(int(year), month, int(day))
+    explicit_day = date(today.year, month, int(day))
+    if explicit_day < today - timedelta(days=183):
+        # "3rd January" posted in late December
+        explicit_day = date(today.year + 1, month, int(day))
+    return explicit_day
+
+
+def extract_name(message: str) -> str | None:
+    for pattern in (DATED_TITLE, HEADING):
+        for match in pattern.finditer(message):
+            name = clean_name(match.group(1))
+            if name:
+                return name
+    for match in NAMED_SESSION.finditer(message):
+        name, suffix = match.group(1).strip(), match.group(2)
+        # headline style names keep their suffix, like "POWER UP CALL"
+        if name.isupper() and suffix.isupper():
+            name = f"{name} {suffix}"
+        name = clean_name(name)
+        if name:
+            return name
+    return None
+
+
+def clean_name(name: str) -> str | None:
+    name = re.sub(r"\s+", " ", name).strip(" -:|")
+    if not name or name.lower() in GENERIC_NAMES or len(name) > 80:
+        return None
+    if name.isupper() and not re.search(r"\b(CALL|STREAM|AMA)\b", name):
+        name = name.title()
+    return name
@@ -0,0 +1,345 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from redis.asyncio import ConnectionPool, Redis
+
+from internal.redis import (
+    TRW_RUNNING_STREAMS,
+    TRW_UPCOMING_STREAMS,
+    TRW_CAMPUS_UPCOMING_STREAMS,
+    TRW_STREAM_CHAT,
+    TRW_STREAM_CHAT_MAXLEN,
+    TRW_STREAM_CHAT_TTL,
+    DUDESTREAM_STREAMS,
+    CATALOG_COUNT,
+    CATALOG_COUNT_TTL,
+    LIBGEN_TOPIC_COUNTS,
+    TRW_CAPTURE_SLOTS,
+    TRW_CAPTURE_STARTUP,
+    TRW_CAPTURE_STARTUP_KINDS,
+    TRW_DISCOVERY_SWEEP,
+    TRW_RELAY_STATS,
+    TRW_CAPTURE_SCHEDULER,
+    PARSED_MESSAGE,
+    PARSED_MESSAGE_TTL,
+    MESSAGE_PARSER_STATS,
+    REDIS_COMMAND_STATS,
+    STREAM_KEYS,
+    UPCOMING_STREAMS_ADAPTER,
+    chat_entry,
+    upcoming_stream_score,
+)
+from internal.schemas import MessageParserStats, RedisCommandStats, RelayStats, TRWCaptureSchedulerState, TRWCaptureSlot, TRWCaptureStartup, TRWDiscoverySweep, TRWStream, TRWStreamChatMessage, TRWUpcomingStream, DudestreamStream, TRWCampus
+
+
+class AsyncRedisClient:
+    """asyncio counterpart of RedisClient for use inside the FastAPI event loop.
+
+    All commands go through a single connection pool shared by every request
+    and WebSocket handled by the worker.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.pool = ConnectionPool(host=host, port=port)
+        self.redis = Redis(connection_pool=self.pool)
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+        await self.pool.disconnect()
+
+    async def migrate_trw_running_streams(self) -> None:
+        """Move running streams stored as JSON set members into the id keyed hash."""
+        if await self.redis.type(TRW_RUNNING_STREAMS) != b"set":
+            return
+        pipeline = self.redis.pipeline()
+        pipeline.delete(TRW_RUNNING_STREAMS)
+        for member in await self.redis.smembers(TRW_RUNNING_STREAMS):
+            stream = TRWStream.model_validate_json(member)
+            pipeline.hset(TRW_RUNNING_STREAMS, stream.id, stream.model_dump_json())
+        await pipeline.execute()
+
+    async def get_trw_running_stream(self, stream_id: str) -> TRWStream | None:
+        stream = await self.redis.hget(TRW_RUNNING_STREAMS, stream_id)
+        if stream:
+            return TRWStream.model_validate_json(stream)
+        return None
+
+    async def add_trw_running_stream(self, stream: TRWStream) -> None:
+        await self.redis.hset(TRW_RUNNING_STREAMS, stream.id, stream.model_dump_json())
+
+    async def migrate_trw_upcoming_streams(self) -> None:
+        """Move upcoming streams stored as JSON set members into the start time sorted sets."""
+        if await self.redis.type(TRW_UPCOMING_STREAMS) != b"set":
+            return
+        pipeline = self.redis.pipeline()
+        pipeline.delete(TRW_UPCOMING_STREAMS)
+        for member in await self.redis.smembers(TRW_UPCOMING_STREAMS):
+            stream = TRWUpcomingStream.model_validate_json(member)
+            member = stream.model_dump_json()
+            score = upcoming_stream_score(stream.start_time)
+            pipeline.zadd(TRW_UPCOMING_STREAMS, {member: score})
+            pipeline.zadd(TRW_CAMPUS_UPCOMING_STREAMS % stream.campus.value, {member: score})
+        await pipeline.execute()
+
+    async def add_trw_upcoming_stream(self, stream: TRWUpcomingStream) -> None:
+        member = stream.model_dump_json()
+        score = upcoming_stream_score(stream.start_time)
+        now = upcoming_stream_score(datetime.now(timezone.utc))
+        pipeline = self.redis.pipeline()
+        pipeline.zadd(TRW_UPCOMING_STREAMS, {member: score})
+        pipeline.zadd(TRW_CAMPUS_UPCOMING_STREAMS % stream.campus.value, {member: score})
+        # expire streams that already started, so reads never have to
+        pipeline.zremrangebyscore(TRW_UPCOMING_STREAMS, "-inf", f"({now}")
+        pipeline.zremrangebyscore(TRW_CAMPUS_UPCOMING_STREAMS % stream.campus.value, "-inf", f"({now}")
+        await pipeline.execute()
+
+    async def get_trw_running_streams(self) -> List[TRWStream]:
+        running_streams = []
+        for value in await self.redis.hvals(TRW_RUNNING_STREAMS):
+            stream = TRWStream.model_validate_json(value)
+            running_streams.append(stream)
+        return running_streams
+
+    async def get_trw_upcoming_streams(
+        self,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        campus: TRWCampus | None = None,
+    ) -> List[TRWUpcomingStream]:
+        now = datetime.now(timezone.utc)
+        if start is None or upcoming_stream_score(start) < upcoming_stream_score(now):
+            start = now
+        key = TRW_CAMPUS_UPCOMING_STREAMS % campus.value if campus else TRW_UPCOMING_STREAMS
+        upcoming_streams = []
+        for member in await self.redis.zrangebyscore(
+            key,
+            upcoming_stream_score(start),
+            upcoming_stream_score(end) if end else "+inf",
+        ):
+            upcoming_stream = TRWUpcomingStream.model_validate_json(member)
+            upcoming_streams.append(upcoming_stream)
+        return upcoming_streams
+
+    async def delete_all_streams(self) -> None:
+        chat_keys = [TRW_STREAM_CHAT % stream_id.decode() for stream_id in await self.redis.hkeys(TRW_RUNNING_STREAMS)]
+        await self.redis.delete(*STREAM_KEYS, *chat_keys)
+
+    async def delete_trw_stream_by_id(self, stream_id: str) -> None:
+        # the chat of an ended stream is not replayed, so it goes with the stream
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.hdel(TRW_RELAY_STATS, stream_id)
+        pipeline.delete(TRW_STREAM_CHAT % stream_id)
+        pipeline.hdel(TRW_RUNNING_STREAMS, stream_id)
+        if (await pipeline.execute())[-1]:
+            return
+
+        for member in await self.redis.zrange(TRW_UPCOMING_STREAMS, 0, -1):
+            stream = TRWUpcomingStream.model_validate_json(member)
+            if stream.name == stream_id:
+                await self.delete_trw_upcoming_stream(stream)
+                return
+
+    async def delete_trw_upcoming_stream(self, stream: TRWUpcomingStream) -> None:
+        member = stream.model_dump_json()
+        pipeline = self.redis.pipeline()
+        pipeline.zrem(TRW_UPCOMING_STREAMS, member)
+        pipeline.zrem(TRW_CAMPUS_UPCOMING_STREAMS % stream.campus.value, member)
+        await pipeline.execute()
+
+    async def add_trw_stream_message(
+        self, stream_id: str, message: TRWStreamChatMessage
+    ) -> None:
+        await self.add_trw_stream_messages(stream_id, [message])
+
+    async def add_trw_stream_messages(
+        self, stream_id: str, messages: List[TRWStreamChatMessage]
+    ) -> None:
+        key = TRW_STREAM_CHAT % stream_id
+        pipeline = self.redis.pipeline(transaction=False)
+        for message in messages:
+            pipeline.xadd(
+                key, {"message": message.model_dump_json()}, maxlen=TRW_STREAM_CHAT_MAXLEN, approximate=True
+            )
+        pipeline.expire(key, TRW_STREAM_CHAT_TTL)
+        await pipeline.execute()
+
+    async def get_trw_stream_messages(
+        self, stream_id: str, count: int, after_id: str | None = None
+    ) -> List[Tuple[str, TRWStreamChatMessage]]:
+        key = TRW_STREAM_CHAT % stream_id
+        if after_id:
+            entries = await self.redis.xrange(key, f"({after_id}", "+", count=count)
+        else:
+            entries = reversed(await self.redis.xrevrange(key, "+", "-", count=count))
+        return [chat_entry(entry_id, fields) for entry_id, fields in entries]
+
+    async def get_trw_stream_last_message_id(self, stream_id: str) -> str:
+        """Entry id of the newest message, "0-0" when there is none yet."""
+        entries = await self.redis.xrevrange(TRW_STREAM_CHAT % stream_id, "+", "-", count=1)
+        return entries[0][0].decode() if entries else "0-0"
+
+    async def read_trw_stream_messages(
+        self, stream_id: str, after_id: str, block_ms: int, count: int = 100
+    ) -> List[Tuple[str, TRWStreamChatMessage]]:
+        """Messages after after_id, waits up to block_ms for the first one to arrive."""
+        key = TRW_STREAM_CHAT % stream_id
+        response = await self.redis.xread({key: after_id}, count=count, block=block_ms)
+        if not response:
+            return []
+        return [chat_entry(entry_id, fields) for entry_id, fields in response[0][1]]
+
+    async def set_trw_relay_stats(self, stream_id: str, stats: RelayStats) -> None:
+        await self.redis.hset(TRW_RELAY_STATS, stream_id, stats.model_dump_json())
+
+    async def get_trw_relay_stats(self) -> Dict[str, RelayStats]:
+        return {
+            stream_id.decode(): RelayStats.model_validate_json(value)
+            for stream_id, value in (await self.redis.hgetall(TRW_RELAY_STATS)).items()
+        }
+
+    async def set_trw_capture_slot(self, slot: TRWCaptureSlot) -> None:
+        await self.redis.hset(TRW_CAPTURE_SLOTS, slot.number, slot.model_dump_json())
+
+    async def get_trw_capture_slots(self) -> List[TRWCaptureSlot]:
+        slots = [
+            TRWCaptureSlot.model_validate_json(value)
+            for value in await self.redis.hvals(TRW_CAPTURE_SLOTS)
+        ]
+        return sorted(slots, key=lambda slot: slot.number)
+
+    async def record_trw_capture_startup(self, kind: str, seconds: float) -> None:
+        key = TRW_CAPTURE_STARTUP % kind
+        pipeline = self.redis.pipeline()
+        pipeline.hincrby(key, "count", 1)
+        pipeline.hincrbyfloat(key, "total_seconds", seconds)
+        pipeline.hset(key, "last_seconds", seconds)
+        await pipeline.execute()
+
+    async def get_trw_capture_startup(self) -> List[TRWCaptureStartup]:
+        startup = []
+        for kind in TRW_CAPTURE_STARTUP_KINDS:
+            stats = await self.redis.hgetall(TRW_CAPTURE_STARTUP % kind)
+            if not stats:
+                continue
+            count = int(stats[b"count"])
+            startup.append(TRWCaptureStartup(
+                kind=kind,
+                count=count,
+                average_seconds=float(stats[b"total_seconds"]) / count,
+                last_seconds=float(stats[b"last_seconds"]),
+            ))
+        return startup
+
+    async def set_trw_capture_scheduler_state(self, state: TRWCaptureSchedulerState) -> None:
+        await self.redis.set(TRW_CAPTURE_SCHEDULER, state.model_dump_json())
+
+    async def get_trw_capture_scheduler_state(self) -> TRWCaptureSchedulerState | None:
+        state = await self.redis.get(TRW_CAPTURE_SCHEDULER)
+        if state:
+            return TRWCaptureSchedulerState.model_validate_json(state)
+        return None
+
+    async def record_trw_discovery_sweep(self, seconds: float) -> None:
+        pipeline = self.redis.pipeline()
+        pipeline.hincrby(TRW_DISCOVERY_SWEEP, "count", 1)
+        pipeline.hincrbyfloat(TRW_DISCOVERY_SWEEP, "total_seconds", seconds)
+        pipeline.hset(TRW_DISCOVERY_SWEEP, mapping={
+            "last_seconds": seconds,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        })
+        await pipeline.execute()
+        # only the discovery loop writes this hash, so read-then-set is safe for the max
+        max_seconds = await self.redis.hget(TRW_DISCOVERY_SWEEP, "max_seconds")
+        if max_seconds is None or seconds > float(max_seconds):
+            await self.redis.hset(TRW_DISCOVERY_SWEEP, "max_seconds", seconds)
+
+    async def get_trw_discovery_sweep(self) -> TRWDiscoverySweep | None:
+        stats = await self.redis.hgetall(TRW_DISCOVERY_SWEEP)
+        if not stats:
+            return None
+        count = int(stats[b"count"])
+        return TRWDiscoverySweep(
+            count=count,
+            average_seconds=float(stats[b"total_seconds"]) / count,
+            last_seconds=float(stats[b"last_seconds"]),
+            max_seconds=float(stats[b"max_seconds"]),
+            finished_at=stats[b"finished_at"].decode(),
+        )
+
+    async def get_parsed_message(self, key: str) -> List[TRWUpcomingStream] | None:
+        upcoming_streams = await self.redis.get(PARSED_MESSAGE % key)
+        if upcoming_streams is None:
+            return None
+        return UPCOMING_STREAMS_ADAPTER.validate_json(upcoming_streams)
+
+    async def set_parsed_message(self, key: str, upcoming_streams: List[TRWUpcomingStream]) -> None:
+        await self.redis.set(
+            PARSED_MESSAGE % key,
+            UPCOMING_STREAMS_ADAPTER.dump_json(upcoming_streams),
+            ex=PARSED_MESSAGE_TTL,
+        )
+
+    async def get_redis_command_stats(self) -> RedisCommandStats:
+        stats = await self.redis.hgetall(REDIS_COMMAND_STATS)
+        round_trips = int(stats.get(b"round_trips", 0))
+        total_seconds = float(stats.get(b"total_seconds", 0))
+        return RedisCommandStats(
+            round_trips=round_trips,
+            commands=int(stats.get(b"commands", 0)),
+            average_latency_ms=total_seconds * 1000 / round_trips if round_trips else 0,
+        )
+
+    async def increment_message_parser_stat(self, counter: str) -> None:
+        await self.redis.hincrby(MESSAGE_PARSER_STATS, counter, 1)
+
+    async def get_message_parser_stats(self) -> MessageParserStats:
+        stats = await self.redis.hgetall(MESSAGE_PARSER_STATS)
+        return MessageParserStats(**{counter.decode(): int(value) for counter, value in stats.items()})
+
+    async def get_catalog_count(self, key: str) -> int | None:
+        count = await self.redis.get(CATALOG_COUNT % key)
+        return int(count) if count is not None else None
+
+    async def set_catalog_count(self, key: str, count: int) -> None:
+        await self.redis.set(CATALOG_COUNT % key, count, ex=CATALOG_COUNT_TTL)
+
+    async def get_libgen_topic_counts(self) -> Dict[int, int] | None:
+        counts = await self.redis.hgetall(LIBGEN_TOPIC_COUNTS)
+        if not counts:
+            return None
+        return {int(topic_id): int(count) for topic_id, count in counts.items()}
+
+    async def set_libgen_topic_counts(self, counts: Dict[int, int]) -> None:
+        if not counts:
+            return
+        pipeline = self.redis.pipeline()
+        pipeline.delete(LIBGEN_TOPIC_COUNTS)
+        pipeline.hset(LIBGEN_TOPIC_COUNTS, mapping=counts)
+        pipeline.expire(LIBGEN_TOPIC_COUNTS, CATALOG_COUNT_TTL)
+        await pipeline.execute()
+
+    async def add_dudestream_stream(self, stream: DudestreamStream) -> None:
+        await self.redis.sadd(DUDESTREAM_STREAMS, stream.model_dump_json())
+
+    async def get_dudestream_streams(self) -> List[DudestreamStream]:
+        streams = []
+        for member in await self.redis.smembers(DUDESTREAM_STREAMS):
+            stream = DudestreamStream.model_validate_json(member)
+            streams.append(stream)
+        return streams
+
+    async def delete_dudestream_category_streams(self, category: str) -> None:
+        await self.replace_dudestream_category_streams(category, [])
+
+    async def replace_dudestream_category_streams(self, category: str, streams: List[DudestreamStream]) -> None:
+        members = [
+            member
+            for member in await self.redis.smembers(DUDESTREAM_STREAMS)
+            if DudestreamStream.model_validate_json(member).category == category
+        ]
+        pipeline = self.redis.pipeline()
+        if members:
+            pipeline.srem(DUDESTREAM_STREAMS, *members)
+        if streams:
+            pipeline.sadd(DUDESTREAM_STREAMS, *(stream.model_dump_json() for stream in streams))
+        await pipeline.execute()
@@ -0,0 +1,129 @@
+import heapq
+import itertools
+import os
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from internal.schemas import ScheduledCapture, TRWCampus, TRWCaptureSchedulerState
+
+# campuses without a configured priority, lower numbers are admitted first
+DEFAULT_CAMPUS_PRIORITY = 100
+
+
+def parse_campus_priorities(value: str) -> Dict[TRWCampus, int]:
+    """Parse "STOCKS:0,CRYPTO_TRADING:1" into campus priorities."""
+    priorities = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        campus, _, priority = item.partition(":")
+        priorities[TRWCampus(campus.strip())] = int(priority)
+    return priorities
+
+
+def host_resources() -> Tuple[float, float]:
+    """1 minute load average per CPU and available memory in MB."""
+    load_per_cpu = os.getloadavg()[0] / (os.cpu_count() or 1)
+    available_memory_mb = 0.0
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemAvailable:"):
+                available_memory_mb = int(line.split()[1]) / 1024
+                break
+    return load_per_cpu, available_memory_mb
+
+
+class CaptureScheduler:
+    """Decides when a detected stream may start capturing.
+
+    Streams wait in a queue ordered by campus priority and detection time.
+    One is admitted when fewer than max_concurrent captures run and the host
+    has CPU and memory headroom. A cold start needs the memory for a new
+    browser, a warm pool slot already has one. Cold captures get their
+    display and sink number from numbers, which are reused once they finish.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        numbers: Iterable[int],
+        max_load_per_cpu: float = 0.85,
+        min_free_memory_mb: float = 1500,
+        campus_priorities: Dict[TRWCampus, int] | None = None,
+        resources: Callable[[], Tuple[float, float]] = host_resources,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.free_numbers = sorted(numbers)
+        self.max_load_per_cpu = max_load_per_cpu
+        self.min_free_memory_mb = min_free_memory_mb
+        self.campus_priorities = campus_priorities or {}
+        self.resources = resources
+        self.queue: List[Tuple[int, float, int, ScheduledCapture]] = []
+        self.counter = itertools.count()
+        self.active: Dict[str, ScheduledCapture] = {}
+        self.load_per_cpu = 0.0
+        self.available_memory_mb = 0.0
+
+    def enqueue(self, stream_id: str, channel: str, campus: TRWCampus) -> ScheduledCapture:
+        capture = ScheduledCapture(
+            stream_id=stream_id,
+            channel=channel,
+            campus=campus,
+            priority=self.campus_priorities.get(campus, DEFAULT_CAMPUS_PRIORITY),
+            queued_at=datetime.now(timezone.utc),
+        )
+        heapq.heappush(
+            self.queue, (capture.priority, capture.queued_at.timestamp(), next(self.counter), capture)
+        )
+        return capture
+
+    def drop(self, channel: str) -> None:
+        """Forget a queued stream of the channel, it ended before it could start."""
+        queue = [entry for entry in self.queue if entry[3].channel != channel]
+        if len(queue) != len(self.queue):
+            self.queue = queue
+            heapq.heapify(self.queue)
+
+    def is_active(self, channel: str) -> bool:
+        return any(capture.channel == channel for capture in self.active.values())
+
+    def is_queued(self, channel: str) -> bool:
+        return any(entry[3].channel == channel for entry in self.queue)
+
+    def admit(self, warm_slot: int | None = None) -> ScheduledCapture | None:
+        """Pop the next stream if there is capacity for it.
+
+        With a warm_slot the stream runs in that pool slot, otherwise it gets
+        a number for a cold start.
+        """
+        self.load_per_cpu, self.available_memory_mb = self.resources()
+        if not self.queue or len(self.active) >= self.max_concurrent:
+            return None
+        if self.load_per_cpu > self.max_load_per_cpu:
+            return None
+        if warm_slot is None:
+            if not self.free_numbers or self.available_memory_mb < self.min_free_memory_mb:
+                return None
+
+        capture = heapq.heappop(self.queue)[3]
+        capture.warm = warm_slot is not None
+        capture.number = warm_slot if warm_slot is not None else self.free_numbers.pop(0)
+        capture.started_at = datetime.now(timezone.utc)
+        self.active[capture.stream_id] = capture
+        return capture
+
+    def finish(self, stream_id: str) -> None:
+        capture = self.active.pop(stream_id, None)
+        if capture is not None and not capture.warm:
+            self.free_numbers.append(capture.number)
+            self.free_numbers.sort()
+
+    def state(self) -> TRWCaptureSchedulerState:
+        return TRWCaptureSchedulerState(
+            max_concurrent=self.max_concurrent,
+            load_per_cpu=self.load_per_cpu,
+            available_memory_mb=self.available_memory_mb,
+            active=list(self.active.values()),
+            queued=[entry[3] for entry in sorted(self.queue)],
+            updated_at=datetime.now(timezone.utc),
+        )
@@ -1,7 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import Connection, Engine, Index, Table, create_engine, delete, func, inspect, select
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
 from internal.models.base import Base
 from internal.env import Env
+from internal.search import init_search_index
 
 # Create the SQLAlchemy engine
 engine = create_engine(Env.DATABASE_URL, echo=False)
@@ -10,5 +12,28 @@ engine = create_engine(Env.DATABASE_URL, echo=False)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Initialize the database
-def init_db():
-    Base.metadata.create_all(bind=engine)
+def init_db(bind: Engine = engine):
+    Base.metadata.create_all(bind=bind)
+    # create_all skips existing tables, add indexes introduced after they were created
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                with bind.begin() as connection:
+                    if index.unique:
+                        remove_duplicates(connection, table, index)
+                    index.create(bind=connection)
+            except SQLAlchemyError as e:
+                print(f"Could not create index {index.name}: {e}")
+    init_search_index(bind)
+
+
+def remove_duplicates(connection: Connection, table: Table, index: Index) -> None:
+    """Delete the rows a new unique index would reject, the newest row of each group is kept."""
+    newest = select(func.max(table.c.id)).group_by(*index.columns)
+    removed = connection.execute(delete(table).where(table.c.id.not_in(newest))).rowcount
+    if removed:
+        print(f"Removed {removed} duplicate rows from {table.name} before creating {index.name}")
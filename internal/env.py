@@ -27,8 +27,32 @@ class AppEnv:
     OPENAI_API_KEY: str
     OTP_EMAIL: str
     OTP_EMAIL_PASSWORD: str
+    OTP_IMAP_HOST: str = "imap.gmail.com"
+    OTP_IMAP_PORT: int = 993
+    OTP_IMAP_SSL: bool = True
+    # only mails from this address are searched for the 2FA code, empty for any sender
+    OTP_SENDER: str = ""
     DEBUG: bool = False
     DATABASE_URL: str
+    TRW_SESSION_FILE: str = ".trw_session.json"
+    TRW_CAPTURE_POOL_SIZE: int = 2
+    # comma separated names from internal.utils.RENDITIONS, the first one is the main stream.
+    # Each extra rendition is published at <destination>_<name> and costs another encode,
+    # e.g. "720p,480p,audio" adds a 480p and an audio only stream.
+    TRW_RELAY_RENDITIONS: str = "720p"
+    # directory for a local HLS copy of the main rendition, empty to disable
+    TRW_HLS_DIR: str = ""
+    # capture only the video element instead of making it full screen
+    TRW_RELAY_CROP_TO_VIDEO: bool = False
+    # drop duplicate frames of static content to save encoder CPU
+    TRW_RELAY_DECIMATE: bool = False
+    TRW_MAX_CONCURRENT_CAPTURES: int = 4
+    # new captures wait while the 1 minute load per CPU is above this
+    TRW_MAX_LOAD_PER_CPU: float = 0.85
+    # cold captures wait while less memory than this is available
+    TRW_MIN_FREE_MEMORY_MB: int = 1500
+    # "CAMPUS:priority,..." lower priorities start first, unlisted campuses last
+    TRW_CAMPUS_PRIORITIES: str = ""
 
     """
     Map environment variables to class fields according to these rules:
@@ -1,18 +1,165 @@
+import asyncio
+import hashlib
 import json
+import re
 from datetime import datetime, timedelta, timezone
-from typing import List
+from typing import Dict, List, Tuple
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
-from internal.schemas import TRWUpcomingStream, TRWCampus
+from internal.announcement_extractor import CONFIDENCE_THRESHOLD, extract_announcements
+from internal.redis import RedisClient
+from internal.schemas import TRWUpcomingStream, TRWCampus, TRWStreamChatMessage
+from internal.utils import round_to_nearest_15_minutes
+
+# an announcement names some kind of live session...
+STREAM_KEYWORDS = re.compile(
+    r"\b(live|stream(ing|s)?|premiere|call|session|webinar|ama|q\s*&\s*a|watch[- ]?party|broadcast|going on air)\b",
+    re.IGNORECASE,
+)
+# ...and says when it happens
+TIME_CUES = re.compile(
+    r"\b(\d{1,2}(:\d{2})?\s*(am|pm)|\d{1,2}:\d{2}|in\s+(a\s+few|half\s+an?|\d+|an?|one|two|few)\s*(m|min(ute)?s?|h|hours?|hrs?)"
+    r"|today|tonight|tomorrow|noon|midnight|now|soon|starting|utc|gmt|est|edt|cet|pst|pdt"
+    r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+    re.IGNORECASE,
+)
+
+
+def might_announce_stream(message: str) -> bool:
+    """Cheap check that a message could announce a stream, only those go to the LLM."""
+    return bool(STREAM_KEYWORDS.search(message)) and bool(TIME_CUES.search(message))
+
+
+def parse_cache_key(message: TRWStreamChatMessage) -> str:
+    # relative times like "in 5 minutes" depend on when a message was posted, so
+    # the same text under another id is parsed again
+    return hashlib.sha256(f"{message.id}\0{message.message}".encode()).hexdigest()
+
+
+# candidate messages sent to the LLM in one request
+LLM_BATCH_SIZE = 20
+# seconds before an LLM request is given up
+LLM_TIMEOUT = 30
+LLM_MAX_CONCURRENT_REQUESTS = 4
 
 
 class MessageParser:
 
-    def __init__(self, openai_api_key: str):
-        self.client = OpenAI(api_key=openai_api_key)
+    def __init__(
+        self,
+        openai_api_key: str,
+        redis_client: RedisClient | None = None,
+        timeout: float = LLM_TIMEOUT,
+        max_concurrent_requests: int = LLM_MAX_CONCURRENT_REQUESTS,
+    ):
+        self.openai_api_key = openai_api_key
+        self.client = OpenAI(api_key=openai_api_key, timeout=timeout)
+        self.redis_client = redis_client
+        self.timeout = timeout
+        self.max_concurrent_requests = max_concurrent_requests
+
+    def parse_chat_message(
+        self, message: TRWStreamChatMessage, campus: TRWCampus
+    ) -> List[TRWUpcomingStream]:
+        """parse with a keyword pre-filter, a Redis cache and local rules in front of the LLM.
+
+        The LLM only sees messages the local extractor is not sure about. If
+        it fails, the extractor's best guess is returned without caching it.
+        """
+        key, upcoming_streams, local_streams = self.__parse_locally(message, campus)
+        if upcoming_streams is not None:
+            return upcoming_streams
+
+        self.__count("llm_calls")
+        self.__count("llm_requests")
+        try:
+            upcoming_streams = self.parse(message.message, campus)
+        except Exception as e:
+            print(f"[MessageParser] LLM parse failed, using local result: {e}")
+            return local_streams
+        self.__cache(key, upcoming_streams)
+        return upcoming_streams
+
+    def parse_chat_messages(
+        self, messages: List[Tuple[TRWStreamChatMessage, TRWCampus]]
+    ) -> Dict[str, List[TRWUpcomingStream]]:
+        """parse_chat_message for many messages at once, results are keyed by message id.
+
+        Messages that need the LLM are sent LLM_BATCH_SIZE at a time in one
+        request each, with at most max_concurrent_requests in flight, so a
+        discovery sweep costs about one round-trip instead of one per message.
+        """
+        results: Dict[str, List[TRWUpcomingStream]] = {}
+        pending = []
+        for message, campus in messages:
+            key, upcoming_streams, local_streams = self.__parse_locally(message, campus)
+            # the local guess stays if the LLM fails or skips the message
+            results[message.id] = upcoming_streams if upcoming_streams is not None else local_streams
+            if upcoming_streams is None:
+                self.__count("llm_calls")
+                pending.append((key, message, campus))
+        if not pending:
+            return results
+
+        batches = [pending[i : i + LLM_BATCH_SIZE] for i in range(0, len(pending), LLM_BATCH_SIZE)]
+        for batch, batch_results in zip(batches, asyncio.run(self.__parse_batches(batches))):
+            self.__count("llm_requests")
+            if isinstance(batch_results, Exception):
+                print(f"[MessageParser] LLM batch of {len(batch)} failed, using local results: {batch_results}")
+                continue
+            for key, message, _ in batch:
+                if message.id in batch_results:
+                    results[message.id] = batch_results[message.id]
+                    self.__cache(key, batch_results[message.id])
+        return results
+
+    async def __parse_batches(self, batches: list) -> list:
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        async with AsyncOpenAI(
+            api_key=self.openai_api_key, timeout=self.timeout, max_retries=1
+        ) as client:
+
+            async def parse_batch(batch: list) -> Dict[str, List[TRWUpcomingStream]]:
+                async with semaphore:
+                    return await self.parse_batch(client, [(message, campus) for _, message, campus in batch])
+
+            return await asyncio.gather(*(parse_batch(batch) for batch in batches), return_exceptions=True)
 
-    def parse(self, message: str, campus: TRWCampus) -> List[TRWUpcomingStream]:
+    def __parse_locally(
+        self, message: TRWStreamChatMessage, campus: TRWCampus
+    ) -> Tuple[str, List[TRWUpcomingStream] | None, List[TRWUpcomingStream]]:
+        """cache key, the streams if no LLM is needed and the local extractor's guess."""
+        key = parse_cache_key(message)
+        if not might_announce_stream(message.message):
+            self.__count("prefilter_skipped")
+            return key, [], []
+
+        if self.redis_client:
+            cached = self.redis_client.get_parsed_message(key)
+            if cached is not None:
+                self.__count("cache_hits")
+                return key, cached, cached
+
+        local_streams, confidence = extract_announcements(message.message, campus)
+        if confidence >= CONFIDENCE_THRESHOLD:
+            self.__count("local_parses")
+            self.__cache(key, local_streams)
+            return key, local_streams, local_streams
+        return key, None, local_streams
+
+    def __cache(self, key: str, upcoming_streams: List[TRWUpcomingStream]) -> None:
+        if self.redis_client:
+            self.redis_client.set_parsed_message(key, upcoming_streams)
+
+    def __count(self, counter: str) -> None:
+        if self.redis_client:
+            self.redis_client.increment_message_parser_stat(counter)
+
+    def parse(
+        self, message: str, campus: TRWCampus, now: datetime | None = None
+    ) -> List[TRWUpcomingStream]:
+        now = now or datetime.now(timezone.utc)
         prompt = """Your task is to extract information about an upcoming live stream from the provided message. The task involves identifying upcoming live streams and extracting their starting time information.
 
 ### Steps:
@@ -48,7 +195,7 @@ For your reference, today's date is %s
 Message: 
 \"\"\"%s\"\"\"
 """ % (
-            datetime.now().strftime("%d %B %Y"),
+            now.strftime("%d %B %Y"),
             message,
         )
         response = self.client.chat.completions.create(
@@ -68,35 +215,106 @@ Message:
         except json.JSONDecodeError:
             return []
 
-        upcoming_streams = []
-        for stream in json_content["streams"]:
-            start_time = datetime.now(timezone.utc)
-            if "start_time_absolute" in stream:
-                start_time = datetime.fromisoformat(stream["start_time_absolute"])
-            elif "start_time_relative" in stream:
-                start_time += timedelta(seconds=int(stream["start_time_relative"]))
-            upcoming_stream = TRWUpcomingStream(
-                name=stream["name"],
-                start_time=round_to_nearest_15_minutes(start_time),
-                campus=campus,
-            )
-            upcoming_streams.append(upcoming_stream)
-        return upcoming_streams
+        return streams_from_json(json_content["streams"], campus, now)
 
+    async def parse_batch(
+        self,
+        client: AsyncOpenAI,
+        messages: List[Tuple[TRWStreamChatMessage, TRWCampus]],
+        now: datetime | None = None,
+    ) -> Dict[str, List[TRWUpcomingStream]]:
+        """parse several messages in one request, results are keyed by message id.
 
-def round_to_nearest_15_minutes(dt: datetime) -> datetime:
-    minute = round(dt.minute / 15) * 15
-    if minute == 60:
-        dt += timedelta(hours=1)
-        minute = 0
-    return datetime(
-        dt.year,
-        dt.month,
-        dt.day,
-        dt.hour,
-        minute,
-        tzinfo=timezone.utc,
-    )
+        Messages the response leaves out are left out of the results too.
+        """
+        now = now or datetime.now(timezone.utc)
+        campuses = {message.id: campus for message, campus in messages}
+        prompt = BATCH_PROMPT % (
+            now.strftime("%d %B %Y"),
+            json.dumps([{"id": message.id, "message": message.message} for message, _ in messages], indent=1),
+        )
+        response = await client.chat.completions.create(
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                }
+            ],
+            model="gpt-4o-mini",
+            response_format={"type": "json_object"},
+            temperature=0.00000000001,
+        )
+        try:
+            json_content = json.loads(response.choices[0].message.content)
+        except json.JSONDecodeError:
+            return {}
+
+        results = {}
+        for result in json_content.get("messages", []):
+            message_id = str(result.get("id"))
+            if message_id in campuses:
+                results[message_id] = streams_from_json(result.get("streams", []), campuses[message_id], now)
+        return results
+
+
+BATCH_PROMPT = """Your task is to extract information about upcoming live streams from each of the provided chat messages. The task involves identifying upcoming live streams and extracting their starting time information.
+
+### Steps:
+For every message:
+1. **Determine if the message mentions a live stream**:
+   - Look for phrases such as "live stream," "starting in," or other temporal cues.
+
+2. **Extract the following details if a live stream is mentioned**:
+   - The name of the stream.
+   - One of the following:
+    - The start time of the stream in **ISO format**.
+    - A relative offset from the current time (e.g., "in 5 minutes") in seconds.
+
+### Output Format:
+Return a JSON object with one entry per message id, structured like this:
+```json
+{
+    "messages": [
+        {
+            "id": "message id",
+            "streams": [
+                {
+                    "name": "Stream Name",
+                    "start_time_absolute": "YYYY-MM-DDTHH:MM:00Z",
+                    or
+                    "start_time_relative": "300"
+                }
+            ]
+        }
+    ]
+}```
+
+Make sure only one of "start_time_absolute" or "start_time_relative" is included for each stream.
+
+If a message mentions no live stream, its "streams" is an empty array.
+
+For your reference, today's date is %s
+
+Messages:
+%s
+"""
+
+
+def streams_from_json(streams: List[dict], campus: TRWCampus, now: datetime) -> List[TRWUpcomingStream]:
+    upcoming_streams = []
+    for stream in streams:
+        start_time = now
+        if "start_time_absolute" in stream:
+            start_time = datetime.fromisoformat(stream["start_time_absolute"])
+        elif "start_time_relative" in stream:
+            start_time += timedelta(seconds=int(stream["start_time_relative"]))
+        upcoming_stream = TRWUpcomingStream(
+            name=stream["name"],
+            start_time=round_to_nearest_15_minutes(start_time),
+            campus=campus,
+        )
+        upcoming_streams.append(upcoming_stream)
+    return upcoming_streams
 
 
 def current_timezone():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Table, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Table, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 from internal.models.base import Base
@@ -21,6 +21,10 @@ class HuraWatchGenre(Base):
 
 class HuraWatchEpisode(Base):
     __tablename__ = 'hurawatch_episodes'
+    __table_args__ = (
+        # lets episodes be upserted with ON CONFLICT
+        Index('hurawatch_episodes_show_number_idx', 'tv_show_id', 'episode_number', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     tv_show_id = Column(Integer, ForeignKey('hurawatch_movies.id'), nullable=False)
@@ -44,4 +48,4 @@ class HuraWatchMovie(Base):
     stars = Column(String, nullable=True)
     is_movie = Column(Boolean, default=True)  # True for movies, False for TV shows
     genres = relationship('HuraWatchGenre', secondary=movie_genre_association, back_populates='movies')
-    episodes = relationship('HuraWatchEpisode', back_populates='tv_show', cascade='all, delete-orphan')
\ No newline at end of file
+    episodes = relationship('HuraWatchEpisode', back_populates='tv_show', cascade='all, delete-orphan', order_by='HuraWatchEpisode.episode_number')
\ No newline at end of file
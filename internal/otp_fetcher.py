@@ -1,21 +1,140 @@
+import base64
 import imaplib
+import quopri
 import re
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+OTP_PATTERN = re.compile(r"\b\d{6}\b")
+# seconds between searches on servers without IDLE
+OTP_POLL_INTERVAL = 1
+# the mail server's clock may be a little behind ours
+OTP_CLOCK_SKEW = 10
+
 
 class OTPFetcher:
-    def __init__(self, email, password):
+    """Waits for the 2FA code mailed after a login attempt.
+
+    Only unread mails since the attempt, optionally from one sender, are
+    searched and only their first text part is downloaded. Between searches
+    the connection IDLEs, so a new mail is seen as soon as the server has it.
+    """
+
+    def __init__(
+        self,
+        email: str,
+        password: str,
+        host: str = "imap.gmail.com",
+        port: int = 993,
+        use_ssl: bool = True,
+        sender: str = "",
+    ):
         self.email = email
         self.password = password
-        self.mail = imaplib.IMAP4_SSL('imap.gmail.com')
-        self.mail.login(email, password)
-        self.mail.select('inbox')
-
-    def fetch_otp(self):
-        self.mail.select('inbox')
-        _, data = self.mail.search(None, 'ALL')
-        latest_email_id = data[0].split()[-1]
-        _, data = self.mail.fetch(latest_email_id, '(RFC822)')
-        raw_email = str(data[0][1])
-        
-        # find 6 digit otp using regex
-        otp = re.search(r'\b\d{6}\b', raw_email)
-        return otp.group() if otp else None
\ No newline at end of file
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.sender = sender
+
+    def wait_for_otp(self, since: datetime, timeout: float) -> str | None:
+        """The code of the first mail received at or after since, None after timeout seconds."""
+        deadline = time.monotonic() + timeout
+        mail = self.__connect()
+        try:
+            while True:
+                otp = self.__find_otp(mail, since)
+                if otp:
+                    return otp
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                if "IDLE" in mail.capabilities:
+                    if not wait_for_new_mail(mail, remaining):
+                        return None
+                else:
+                    time.sleep(min(OTP_POLL_INTERVAL, remaining))
+        finally:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+
+    def __connect(self) -> imaplib.IMAP4:
+        if self.use_ssl:
+            mail = imaplib.IMAP4_SSL(self.host, self.port)
+        else:
+            mail = imaplib.IMAP4(self.host, self.port)
+        mail.login(self.email, self.password)
+        # read only, so a code that gets rejected stays unread for the next attempt
+        mail.select("inbox", readonly=True)
+        return mail
+
+    def __find_otp(self, mail: imaplib.IMAP4, since: datetime) -> str | None:
+        # SINCE only compares dates in the server's time zone, the exact time is checked below
+        criteria = ["UNSEEN", "SINCE", (since - timedelta(days=1)).strftime("%d-%b-%Y")]
+        if self.sender:
+            criteria += ["FROM", f'"{self.sender}"']
+        _, data = mail.search(None, *criteria)
+        earliest = since.timestamp() - OTP_CLOCK_SKEW
+        for mail_id in reversed(data[0].split()):
+            _, data = mail.fetch(mail_id, "(INTERNALDATE)")
+            received = imaplib.Internaldate2tuple(data[0])
+            if received is None or time.mktime(received) < earliest:
+                # ids are in arrival order, everything before is older
+                break
+            _, data = mail.fetch(mail_id, "(BODY.PEEK[1])")
+            otp = find_otp(message_part(data))
+            if otp:
+                return otp
+        return None
+
+
+def wait_for_new_mail(mail: imaplib.IMAP4, timeout: float) -> bool:
+    """IDLE until the server announces a new mail, False if timeout seconds pass first.
+
+    The connection can't be used anymore after a timeout.
+    """
+    mail.send(b"OTP IDLE\r\n")
+    # untagged responses can come before the continuation, like a mail that arrived after the search
+    new_mail = False
+    while True:
+        line = mail.readline()
+        if line.startswith(b"+"):
+            break
+        if not line.startswith(b"* "):
+            raise imaplib.IMAP4.error("IDLE was not accepted")
+        new_mail = new_mail or line.rstrip().endswith(b"EXISTS")
+    if not new_mail:
+        deadline = time.monotonic() + timeout
+        try:
+            # servers send keepalives while idling, only EXISTS means a new mail
+            while True:
+                mail.sock.settimeout(max(deadline - time.monotonic(), 0.01))
+                if mail.readline().rstrip().endswith(b"EXISTS"):
+                    break
+        except TimeoutError:
+            return False
+        mail.sock.settimeout(None)
+    mail.send(b"DONE\r\n")
+    while not mail.readline().startswith(b"OTP "):
+        pass
+    return True
+
+
+def message_part(fetch_data: List) -> bytes:
+    return b"".join(item[1] for item in fetch_data if isinstance(item, tuple))
+
+
+def find_otp(part: bytes) -> str | None:
+    """The 6 digit code in a text part, which can be quoted-printable or base64 encoded."""
+    texts = [quopri.decodestring(part)]
+    try:
+        texts.append(base64.b64decode(b"".join(part.split()), validate=True))
+    except ValueError:
+        pass
+    for text in texts:
+        otp = OTP_PATTERN.search(text.decode(errors="ignore"))
+        if otp:
+            return otp.group()
+    return None
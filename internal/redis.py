@@ -1,79 +1,440 @@
-from typing import List
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
 
-from redis import Redis
+from pydantic import TypeAdapter
+from redis import ConnectionPool, Redis
+from redis.client import Pipeline
 
-from internal.schemas import TRWStream, TRWStreamChatMessage, TRWUpcomingStream, DudestreamStream
+from internal.schemas import MessageParserStats, RedisCommandStats, RelayStats, TRWCaptureSchedulerState, TRWCaptureSlot, TRWCaptureStartup, TRWDiscoverySweep, TRWStream, TRWStreamChatMessage, TRWUpcomingStream, DudestreamStream, TRWCampus
 
 TRW_RUNNING_STREAMS = "trw_running_streams"
 TRW_UPCOMING_STREAMS = "trw_upcoming_streams"
-TRW_STREAM_CHAT_MESSAGES = "trw_stream_%s_chat_messages"
+TRW_CAMPUS_UPCOMING_STREAMS = "trw_upcoming_streams_%s"
+TRW_STREAM_CHAT = "trw_stream_%s_chat"
+# chat is kept in a Redis Stream trimmed to about this many messages...
+TRW_STREAM_CHAT_MAXLEN = 1000
+# ...that expires this many seconds after its last message
+TRW_STREAM_CHAT_TTL = 3600
 DUDESTREAM_STREAMS = "dudestream_streams"
+CATALOG_COUNT = "catalog_count_%s"
+CATALOG_COUNT_TTL = 600
+LIBGEN_TOPIC_COUNTS = "libgen_topic_counts"
+TRW_CAPTURE_SLOTS = "trw_capture_slots"
+TRW_CAPTURE_STARTUP = "trw_capture_startup_%s"
+TRW_CAPTURE_STARTUP_KINDS = ("warm", "cold")
+TRW_DISCOVERY_SWEEP = "trw_discovery_sweep"
+TRW_RELAY_STATS = "trw_relay_stats"
+TRW_CAPTURE_SCHEDULER = "trw_capture_scheduler"
+PARSED_MESSAGE = "parsed_message_%s"
+PARSED_MESSAGE_TTL = 7 * 86400
+MESSAGE_PARSER_STATS = "message_parser_stats"
+REDIS_COMMAND_STATS = "redis_command_stats"
+# seconds between adding a process's command counts to REDIS_COMMAND_STATS
+REDIS_COMMAND_STATS_FLUSH_INTERVAL = 10
+# chat messages of a relayed stream are published together after this many seconds or messages
+TRW_CHAT_FLUSH_INTERVAL = 0.25
+TRW_CHAT_FLUSH_MAX_MESSAGES = 50
+
+UPCOMING_STREAMS_ADAPTER = TypeAdapter(List[TRWUpcomingStream])
+
+# everything delete_all_streams clears, in one DEL
+STREAM_KEYS = (
+    TRW_RUNNING_STREAMS,
+    TRW_UPCOMING_STREAMS,
+    *(TRW_CAMPUS_UPCOMING_STREAMS % campus.value for campus in TRWCampus),
+    DUDESTREAM_STREAMS,
+    TRW_CAPTURE_SLOTS,
+    TRW_RELAY_STATS,
+    TRW_CAPTURE_SCHEDULER,
+)
+
+
+def upcoming_stream_score(start_time: datetime) -> float:
+    """Sorted set score for a stream start time, naive datetimes are taken as UTC."""
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+    return start_time.timestamp()
+
+
+def chat_entry(entry_id: bytes, fields: Dict[bytes, bytes]) -> Tuple[str, TRWStreamChatMessage]:
+    return entry_id.decode(), TRWStreamChatMessage.model_validate_json(fields[b"message"])
+
+
+class RedisCommandCounter:
+    """Round-trips to Redis made by this process, the commands sent in them and the time they took."""
+
+    def __init__(self) -> None:
+        self.round_trips = 0
+        self.commands = 0
+        self.seconds = 0.0
+        self.flushed_at = time.monotonic()
+
+    def record(self, commands: int, seconds: float) -> None:
+        self.round_trips += 1
+        self.commands += commands
+        self.seconds += seconds
+
+    def take(self) -> Tuple[int, int, float]:
+        """The counts since the last take."""
+        counts = self.round_trips, self.commands, self.seconds
+        self.round_trips, self.commands, self.seconds = 0, 0, 0.0
+        self.flushed_at = time.monotonic()
+        return counts
+
+
+class CountingRedis(Redis):
+    """Redis that counts its round-trips, a pipeline is one round-trip for all its commands.
+
+    The counts are added to REDIS_COMMAND_STATS every REDIS_COMMAND_STATS_FLUSH_INTERVAL.
+    """
+
+    def __init__(self, counter: RedisCommandCounter, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.counter = counter
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            self.counter.record(1, time.perf_counter() - started)
+            self.flush_counter()
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> Pipeline:
+        return CountingPipeline(self, self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+    def flush_counter(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self.counter.flushed_at < REDIS_COMMAND_STATS_FLUSH_INTERVAL:
+            return
+        round_trips, commands, seconds = self.counter.take()
+        if not round_trips:
+            return
+        # a plain pipeline, counting the flush would never let the counter settle
+        pipeline = Redis.pipeline(self, transaction=False)
+        pipeline.hincrby(REDIS_COMMAND_STATS, "round_trips", round_trips)
+        pipeline.hincrby(REDIS_COMMAND_STATS, "commands", commands)
+        pipeline.hincrbyfloat(REDIS_COMMAND_STATS, "total_seconds", seconds)
+        try:
+            pipeline.execute()
+        except Exception as e:
+            print(f"[RedisClient] could not record command stats: {e}")
+
+
+class CountingPipeline(Pipeline):
+
+    def __init__(self, redis: CountingRedis, *args) -> None:
+        super().__init__(*args)
+        self.counting_redis = redis
+
+    def execute(self, raise_on_error: bool = True):
+        commands = len(self.command_stack)
+        started = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            if commands:
+                self.counting_redis.counter.record(commands, time.perf_counter() - started)
+                self.counting_redis.flush_counter()
 
 
 class RedisClient:
+    """Redis access for the monitor and its worker processes.
+
+    Every process gets its own connection pool the first time it uses the
+    client, so forked workers never share a socket with their parent.
+    """
 
     def __init__(self, host: str, port: int) -> None:
-        self.redis = Redis(host=host, port=port)
+        self.host = host
+        self.port = port
+        self.pid: int | None = None
+        self.__redis: CountingRedis | None = None
+
+    @property
+    def redis(self) -> CountingRedis:
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.__redis = CountingRedis(
+                RedisCommandCounter(),
+                connection_pool=ConnectionPool(host=self.host, port=self.port),
+            )
+        return self.__redis
+
+    def migrate_trw_running_streams(self) -> None:
+        """Move running streams stored as JSON set members into the id keyed hash."""
+        if self.redis.type(TRW_RUNNING_STREAMS) != b"set":
+            return
+        pipeline = self.redis.pipeline()
+        pipeline.delete(TRW_RUNNING_STREAMS)
+        for member in self.redis.smembers(TRW_RUNNING_STREAMS):
+            stream = TRWStream.model_validate_json(member)
+            pipeline.hset(TRW_RUNNING_STREAMS, stream.id, stream.model_dump_json())
+        pipeline.execute()
 
     def get_trw_running_stream(self, stream_id: str) -> TRWStream | None:
-        for stream in self.get_trw_running_streams():
-            if stream.id == stream_id:
-                return stream
+        stream = self.redis.hget(TRW_RUNNING_STREAMS, stream_id)
+        if stream:
+            return TRWStream.model_validate_json(stream)
         return None
 
     def add_trw_running_stream(self, stream: TRWStream) -> None:
-        self.redis.sadd(TRW_RUNNING_STREAMS, stream.model_dump_json())
+        self.redis.hset(TRW_RUNNING_STREAMS, stream.id, stream.model_dump_json())
+
+    def migrate_trw_upcoming_streams(self) -> None:
+        """Move upcoming streams stored as JSON set members into the start time sorted sets."""
+        if self.redis.type(TRW_UPCOMING_STREAMS) != b"set":
+            return
+        pipeline = self.redis.pipeline()
+        pipeline.delete(TRW_UPCOMING_STREAMS)
+        for member in self.redis.smembers(TRW_UPCOMING_STREAMS):
+            stream = TRWUpcomingStream.model_validate_json(member)
+            member = stream.model_dump_json()
+            score = upcoming_stream_score(stream.start_time)
+            pipeline.zadd(TRW_UPCOMING_STREAMS, {member: score})
+            pipeline.zadd(TRW_CAMPUS_UPCOMING_STREAMS % stream.campus.value, {member: score})
+        pipeline.execute()
 
     def add_trw_upcoming_stream(self, stream: TRWUpcomingStream) -> None:
-        self.redis.sadd(TRW_UPCOMING_STREAMS, stream.model_dump_json())
+        member = stream.model_dump_json()
+        score = upcoming_stream_score(stream.start_time)
+        now = upcoming_stream_score(datetime.now(timezone.utc))
+        pipeline = self.redis.pipeline()
+        pipeline.zadd(TRW_UPCOMING_STREAMS, {member: score})
+        pipeline.zadd(TRW_CAMPUS_UPCOMING_STREAMS % stream.campus.value, {member: score})
+        # expire streams that already started, so reads never have to
+        pipeline.zremrangebyscore(TRW_UPCOMING_STREAMS, "-inf", f"({now}")
+        pipeline.zremrangebyscore(TRW_CAMPUS_UPCOMING_STREAMS % stream.campus.value, "-inf", f"({now}")
+        pipeline.execute()
 
     def get_trw_running_streams(self) -> List[TRWStream]:
         running_streams = []
-        for member in self.redis.smembers(TRW_RUNNING_STREAMS):
-            stream = TRWStream.model_validate_json(member)
+        for value in self.redis.hvals(TRW_RUNNING_STREAMS):
+            stream = TRWStream.model_validate_json(value)
             running_streams.append(stream)
         return running_streams
 
-    def get_trw_upcoming_streams(self) -> List[TRWUpcomingStream]:
+    def get_trw_upcoming_streams(
+        self,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        campus: TRWCampus | None = None,
+    ) -> List[TRWUpcomingStream]:
+        now = datetime.now(timezone.utc)
+        if start is None or upcoming_stream_score(start) < upcoming_stream_score(now):
+            start = now
+        key = TRW_CAMPUS_UPCOMING_STREAMS % campus.value if campus else TRW_UPCOMING_STREAMS
         upcoming_streams = []
-        for member in self.redis.smembers(TRW_UPCOMING_STREAMS):
+        for member in self.redis.zrangebyscore(
+            key,
+            upcoming_stream_score(start),
+            upcoming_stream_score(end) if end else "+inf",
+        ):
             upcoming_stream = TRWUpcomingStream.model_validate_json(member)
             upcoming_streams.append(upcoming_stream)
         return upcoming_streams
 
     def delete_all_streams(self) -> None:
-        for stream in self.get_trw_running_streams():
-            self.redis.delete(TRW_STREAM_CHAT_MESSAGES % stream.id)
-        self.redis.delete(TRW_RUNNING_STREAMS)
-        self.redis.delete(TRW_UPCOMING_STREAMS)
-        self.redis.delete(DUDESTREAM_STREAMS)
+        chat_keys = [TRW_STREAM_CHAT % stream_id.decode() for stream_id in self.redis.hkeys(TRW_RUNNING_STREAMS)]
+        self.redis.delete(*STREAM_KEYS, *chat_keys)
 
     def delete_trw_stream_by_id(self, stream_id: str) -> None:
-        self.redis.delete(TRW_STREAM_CHAT_MESSAGES % stream_id)
-        for stream in self.get_trw_running_streams():
-            if stream.id == stream_id:
-                self.redis.srem(TRW_RUNNING_STREAMS, stream.model_dump_json())
-                return
+        # the chat of an ended stream is not replayed, so it goes with the stream
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.hdel(TRW_RELAY_STATS, stream_id)
+        pipeline.delete(TRW_STREAM_CHAT % stream_id)
+        pipeline.hdel(TRW_RUNNING_STREAMS, stream_id)
+        if pipeline.execute()[-1]:
+            return
 
-        for stream in self.get_trw_upcoming_streams():
+        for member in self.redis.zrange(TRW_UPCOMING_STREAMS, 0, -1):
+            stream = TRWUpcomingStream.model_validate_json(member)
             if stream.name == stream_id:
-                self.redis.srem(TRW_UPCOMING_STREAMS, stream.model_dump_json())
+                self.delete_trw_upcoming_stream(stream)
                 return
     
     def delete_trw_upcoming_stream(self, stream: TRWUpcomingStream) -> None:
-        self.redis.srem(TRW_UPCOMING_STREAMS, stream.model_dump_json())
+        member = stream.model_dump_json()
+        pipeline = self.redis.pipeline()
+        pipeline.zrem(TRW_UPCOMING_STREAMS, member)
+        pipeline.zrem(TRW_CAMPUS_UPCOMING_STREAMS % stream.campus.value, member)
+        pipeline.execute()
 
-    def enqueue_trw_stream_message(
+    def add_trw_stream_message(
         self, stream_id: str, message: TRWStreamChatMessage
     ) -> None:
-        self.redis.lpush(TRW_STREAM_CHAT_MESSAGES % stream_id, message.model_dump_json())
+        self.add_trw_stream_messages(stream_id, [message])
 
-    def dequeue_trw_stream_message(self, stream_id: str) -> TRWStreamChatMessage | None:
-        message = self.redis.rpop(TRW_STREAM_CHAT_MESSAGES % stream_id)
-        if message:
-            return TRWStreamChatMessage.model_validate_json(message)
+    def add_trw_stream_messages(
+        self, stream_id: str, messages: List[TRWStreamChatMessage]
+    ) -> None:
+        """Append to the stream's chat, which stays capped and expires whether anyone reads it or not."""
+        key = TRW_STREAM_CHAT % stream_id
+        pipeline = self.redis.pipeline(transaction=False)
+        for message in messages:
+            pipeline.xadd(
+                key, {"message": message.model_dump_json()}, maxlen=TRW_STREAM_CHAT_MAXLEN, approximate=True
+            )
+        pipeline.expire(key, TRW_STREAM_CHAT_TTL)
+        pipeline.execute()
+
+    def get_trw_stream_messages(
+        self, stream_id: str, count: int, after_id: str | None = None
+    ) -> List[Tuple[str, TRWStreamChatMessage]]:
+        """The last count messages, or the first count after after_id, oldest first with their entry ids."""
+        key = TRW_STREAM_CHAT % stream_id
+        if after_id:
+            entries = self.redis.xrange(key, f"({after_id}", "+", count=count)
+        else:
+            entries = reversed(self.redis.xrevrange(key, "+", "-", count=count))
+        return [chat_entry(entry_id, fields) for entry_id, fields in entries]
+
+    def get_trw_stream_last_message_id(self, stream_id: str) -> str:
+        """Entry id of the newest message, "0-0" when there is none yet."""
+        entries = self.redis.xrevrange(TRW_STREAM_CHAT % stream_id, "+", "-", count=1)
+        return entries[0][0].decode() if entries else "0-0"
+
+    def read_trw_stream_messages(
+        self, stream_id: str, after_id: str, block_ms: int, count: int = 100
+    ) -> List[Tuple[str, TRWStreamChatMessage]]:
+        """Messages after after_id, waits up to block_ms for the first one to arrive."""
+        key = TRW_STREAM_CHAT % stream_id
+        response = self.redis.xread({key: after_id}, count=count, block=block_ms)
+        if not response:
+            return []
+        return [chat_entry(entry_id, fields) for entry_id, fields in response[0][1]]
+
+    def set_trw_relay_stats(self, stream_id: str, stats: RelayStats) -> None:
+        self.redis.hset(TRW_RELAY_STATS, stream_id, stats.model_dump_json())
+
+    def get_trw_relay_stats(self) -> Dict[str, RelayStats]:
+        return {
+            stream_id.decode(): RelayStats.model_validate_json(value)
+            for stream_id, value in (self.redis.hgetall(TRW_RELAY_STATS)).items()
+        }
+
+    def set_trw_capture_slot(self, slot: TRWCaptureSlot) -> None:
+        self.redis.hset(TRW_CAPTURE_SLOTS, slot.number, slot.model_dump_json())
+
+    def get_trw_capture_slots(self) -> List[TRWCaptureSlot]:
+        slots = [
+            TRWCaptureSlot.model_validate_json(value)
+            for value in self.redis.hvals(TRW_CAPTURE_SLOTS)
+        ]
+        return sorted(slots, key=lambda slot: slot.number)
+
+    def record_trw_capture_startup(self, kind: str, seconds: float) -> None:
+        key = TRW_CAPTURE_STARTUP % kind
+        pipeline = self.redis.pipeline()
+        pipeline.hincrby(key, "count", 1)
+        pipeline.hincrbyfloat(key, "total_seconds", seconds)
+        pipeline.hset(key, "last_seconds", seconds)
+        pipeline.execute()
+
+    def get_trw_capture_startup(self) -> List[TRWCaptureStartup]:
+        startup = []
+        for kind in TRW_CAPTURE_STARTUP_KINDS:
+            stats = self.redis.hgetall(TRW_CAPTURE_STARTUP % kind)
+            if not stats:
+                continue
+            count = int(stats[b"count"])
+            startup.append(TRWCaptureStartup(
+                kind=kind,
+                count=count,
+                average_seconds=float(stats[b"total_seconds"]) / count,
+                last_seconds=float(stats[b"last_seconds"]),
+            ))
+        return startup
+
+    def set_trw_capture_scheduler_state(self, state: TRWCaptureSchedulerState) -> None:
+        self.redis.set(TRW_CAPTURE_SCHEDULER, state.model_dump_json())
+
+    def get_trw_capture_scheduler_state(self) -> TRWCaptureSchedulerState | None:
+        state = self.redis.get(TRW_CAPTURE_SCHEDULER)
+        if state:
+            return TRWCaptureSchedulerState.model_validate_json(state)
         return None
-    
+
+    def record_trw_discovery_sweep(self, seconds: float) -> None:
+        pipeline = self.redis.pipeline()
+        pipeline.hincrby(TRW_DISCOVERY_SWEEP, "count", 1)
+        pipeline.hincrbyfloat(TRW_DISCOVERY_SWEEP, "total_seconds", seconds)
+        pipeline.hset(TRW_DISCOVERY_SWEEP, mapping={
+            "last_seconds": seconds,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        })
+        pipeline.execute()
+        # only the discovery loop writes this hash, so read-then-set is safe for the max
+        max_seconds = self.redis.hget(TRW_DISCOVERY_SWEEP, "max_seconds")
+        if max_seconds is None or seconds > float(max_seconds):
+            self.redis.hset(TRW_DISCOVERY_SWEEP, "max_seconds", seconds)
+
+    def get_trw_discovery_sweep(self) -> TRWDiscoverySweep | None:
+        stats = self.redis.hgetall(TRW_DISCOVERY_SWEEP)
+        if not stats:
+            return None
+        count = int(stats[b"count"])
+        return TRWDiscoverySweep(
+            count=count,
+            average_seconds=float(stats[b"total_seconds"]) / count,
+            last_seconds=float(stats[b"last_seconds"]),
+            max_seconds=float(stats[b"max_seconds"]),
+            finished_at=stats[b"finished_at"].decode(),
+        )
+
+    def get_parsed_message(self, key: str) -> List[TRWUpcomingStream] | None:
+        upcoming_streams = self.redis.get(PARSED_MESSAGE % key)
+        if upcoming_streams is None:
+            return None
+        return UPCOMING_STREAMS_ADAPTER.validate_json(upcoming_streams)
+
+    def set_parsed_message(self, key: str, upcoming_streams: List[TRWUpcomingStream]) -> None:
+        self.redis.set(
+            PARSED_MESSAGE % key,
+            UPCOMING_STREAMS_ADAPTER.dump_json(upcoming_streams),
+            ex=PARSED_MESSAGE_TTL,
+        )
+
+    def get_redis_command_stats(self) -> RedisCommandStats:
+        stats = self.redis.hgetall(REDIS_COMMAND_STATS)
+        round_trips = int(stats.get(b"round_trips", 0))
+        total_seconds = float(stats.get(b"total_seconds", 0))
+        return RedisCommandStats(
+            round_trips=round_trips,
+            commands=int(stats.get(b"commands", 0)),
+            average_latency_ms=total_seconds * 1000 / round_trips if round_trips else 0,
+        )
+
+    def increment_message_parser_stat(self, counter: str) -> None:
+        self.redis.hincrby(MESSAGE_PARSER_STATS, counter, 1)
+
+    def get_message_parser_stats(self) -> MessageParserStats:
+        stats = self.redis.hgetall(MESSAGE_PARSER_STATS)
+        return MessageParserStats(**{counter.decode(): int(value) for counter, value in stats.items()})
+
+    def get_catalog_count(self, key: str) -> int | None:
+        count = self.redis.get(CATALOG_COUNT % key)
+        return int(count) if count is not None else None
+
+    def set_catalog_count(self, key: str, count: int) -> None:
+        self.redis.set(CATALOG_COUNT % key, count, ex=CATALOG_COUNT_TTL)
+
+    def get_libgen_topic_counts(self) -> Dict[int, int] | None:
+        counts = self.redis.hgetall(LIBGEN_TOPIC_COUNTS)
+        if not counts:
+            return None
+        return {int(topic_id): int(count) for topic_id, count in counts.items()}
+
+    def set_libgen_topic_counts(self, counts: Dict[int, int]) -> None:
+        if not counts:
+            return
+        pipeline = self.redis.pipeline()
+        pipeline.delete(LIBGEN_TOPIC_COUNTS)
+        pipeline.hset(LIBGEN_TOPIC_COUNTS, mapping=counts)
+        pipeline.expire(LIBGEN_TOPIC_COUNTS, CATALOG_COUNT_TTL)
+        pipeline.execute()
+
     def add_dudestream_stream(self, stream: DudestreamStream) -> None:
         self.redis.sadd(DUDESTREAM_STREAMS, stream.model_dump_json())
 
@@ -85,7 +446,56 @@ class RedisClient:
         return streams
 
     def delete_dudestream_category_streams(self, category: str) -> None:
-        for stream in self.get_dudestream_streams():
-            if stream.category == category:
-                self.redis.srem(DUDESTREAM_STREAMS, stream.model_dump_json())
-                return
+        self.replace_dudestream_category_streams(category, [])
+
+    def replace_dudestream_category_streams(self, category: str, streams: List[DudestreamStream]) -> None:
+        """Swap the streams of a category in one MULTI, readers never see it empty."""
+        members = [
+            member
+            for member in self.redis.smembers(DUDESTREAM_STREAMS)
+            if DudestreamStream.model_validate_json(member).category == category
+        ]
+        pipeline = self.redis.pipeline()
+        if members:
+            pipeline.srem(DUDESTREAM_STREAMS, *members)
+        if streams:
+            pipeline.sadd(DUDESTREAM_STREAMS, *(stream.model_dump_json() for stream in streams))
+        pipeline.execute()
+
+
+class TRWChatBuffer:
+    """Writes the chat messages of a relayed stream in batches.
+
+    Messages are sent in one pipeline once TRW_CHAT_FLUSH_MAX_MESSAGES are
+    waiting or the oldest has waited TRW_CHAT_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(
+        self,
+        redis_client: RedisClient,
+        stream_id: str,
+        max_messages: int = TRW_CHAT_FLUSH_MAX_MESSAGES,
+        interval: float = TRW_CHAT_FLUSH_INTERVAL,
+    ) -> None:
+        self.redis_client = redis_client
+        self.stream_id = stream_id
+        self.max_messages = max_messages
+        self.interval = interval
+        self.messages: List[TRWStreamChatMessage] = []
+        self.oldest_at = 0.0
+
+    def add(self, messages: List[TRWStreamChatMessage]) -> None:
+        """Queue messages and publish them when due, call it with no messages to flush on time."""
+        if messages and not self.messages:
+            self.oldest_at = time.monotonic()
+        self.messages.extend(messages)
+        if not self.messages:
+            return
+        if len(self.messages) >= self.max_messages or time.monotonic() - self.oldest_at >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.messages:
+            return
+        messages, self.messages = self.messages, []
+        self.redis_client.add_trw_stream_messages(self.stream_id, messages)
@@ -0,0 +1,148 @@
+import subprocess
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, IO, Tuple
+
+from internal.schemas import RelayStats
+
+
+class FFmpegProgressParser:
+    """Turns the key=value lines of ffmpeg's -progress output into RelayStats.
+
+    ffmpeg writes one block of lines per update and ends every block with a
+    progress=continue or progress=end line.
+    """
+
+    def __init__(self) -> None:
+        self.fields: Dict[str, str] = {}
+
+    def feed(self, line: str) -> RelayStats | None:
+        """Add a line, returns the stats when it completes a block."""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self.fields[key] = value.strip()
+            return None
+        fields, self.fields = self.fields, {}
+        return RelayStats(
+            fps=parse_float(fields.get("fps")),
+            speed=parse_float(fields.get("speed", "").rstrip("x")),
+            bitrate_kbps=parse_float(fields.get("bitrate", "").removesuffix("kbits/s")),
+            frames=int(parse_float(fields.get("frame")) or 0),
+            drop_frames=int(parse_float(fields.get("drop_frames")) or 0),
+            dup_frames=int(parse_float(fields.get("dup_frames")) or 0),
+            out_time_seconds=(parse_float(fields.get("out_time_us")) or 0) / 1_000_000,
+            updated_at=datetime.now(timezone.utc),
+        )
+
+
+def parse_float(value: str | None) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # ffmpeg writes N/A until it has a value
+        return None
+
+
+class RelaySupervisor:
+    """Runs an ffmpeg relay in a background thread and keeps it healthy.
+
+    start_relay has to start ffmpeg with -progress pipe:1 and stdout piped.
+    Every progress update is passed to on_stats. The relay is restarted with
+    exponential backoff when it exits, or when it encodes slower than
+    min_speed over the last slow_grace seconds.
+    """
+
+    def __init__(
+        self,
+        start_relay: Callable[[], subprocess.Popen],
+        on_stats: Callable[[RelayStats], None],
+        min_speed: float = 0.9,
+        slow_grace: float = 15.0,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        healthy_after: float = 60.0,
+    ) -> None:
+        self.start_relay = start_relay
+        self.on_stats = on_stats
+        self.min_speed = min_speed
+        self.slow_grace = slow_grace
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # a relay that ran this long resets the backoff
+        self.healthy_after = healthy_after
+        self.restarts = 0
+        self.process: subprocess.Popen | None = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.__kill()
+        self.thread.join(timeout=10)
+
+    def __run(self) -> None:
+        failures = 0
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            try:
+                self.process = self.start_relay()
+                reason = self.__watch(self.process.stdout)
+            except Exception as e:
+                reason = f"failed to start: {e}"
+            self.__kill()
+            if self.stopped.is_set():
+                return
+
+            failures = 0 if time.monotonic() - started > self.healthy_after else failures + 1
+            delay = min(self.max_backoff, self.backoff * 2 ** (failures - 1)) if failures else 0
+            self.restarts += 1
+            print(f"[RelaySupervisor] relay {reason}, restart {self.restarts} in {delay:.0f}s")
+            if self.stopped.wait(delay):
+                return
+
+    def __watch(self, stdout: IO) -> str:
+        """Read progress until the relay has to be restarted, returns why."""
+        parser = FFmpegProgressParser()
+        samples: Deque[Tuple[float, float]] = deque()
+        for line in stdout:
+            if self.stopped.is_set():
+                return "stopped"
+            stats = parser.feed(line if isinstance(line, str) else line.decode())
+            if stats is None:
+                continue
+            stats.restarts = self.restarts
+            try:
+                self.on_stats(stats)
+            except Exception as e:
+                print(f"[RelaySupervisor] could not publish stats: {e}")
+
+            # ffmpeg's speed is averaged since start and stays just under 1x for a
+            # real-time input, so the speed is measured over the last slow_grace seconds
+            now = time.monotonic()
+            samples.append((now, stats.out_time_seconds))
+            while len(samples) > 2 and now - samples[1][0] >= self.slow_grace:
+                samples.popleft()
+            started_at, started_out_time = samples[0]
+            if len(samples) < 2 or now - started_at < self.slow_grace or now == started_at:
+                continue
+            speed = (stats.out_time_seconds - started_out_time) / (now - started_at)
+            if speed < self.min_speed:
+                return f"running at {speed:.2f}x for {now - started_at:.0f}s"
+        return f"exited with code {self.process.wait()}"
+
+    def __kill(self) -> None:
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        try:
+            process.kill()
+            process.wait(timeout=10)
+        except Exception:
+            pass
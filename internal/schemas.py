@@ -1,6 +1,7 @@
+import json
 from enum import Enum
 from datetime import datetime, timezone, date
-from typing import List
+from typing import Dict, List
 
 from pydantic import BaseModel
 
@@ -22,11 +23,87 @@ class TRWCampus(str, Enum):
 
 
 
+class CatalogSource(str, Enum):
+    HURAWATCH = "HURAWATCH"
+    LIBGEN = "LIBGEN"
+
+
+class RelayStats(BaseModel):
+    fps: float | None = None
+    speed: float | None = None
+    bitrate_kbps: float | None = None
+    frames: int = 0
+    drop_frames: int = 0
+    dup_frames: int = 0
+    out_time_seconds: float = 0
+    restarts: int = 0
+    updated_at: datetime
+
+
 class TRWStream(BaseModel):
     id: str
     name: str
     url: str
     campus: TRWCampus
+    # rendition name -> url, the first one is url itself
+    renditions: Dict[str, str] = {}
+    relay_stats: RelayStats | None = None
+
+
+class TRWCaptureSlotStatus(str, Enum):
+    STARTING = "STARTING"
+    READY = "READY"
+    STREAMING = "STREAMING"
+
+
+class TRWCaptureSlot(BaseModel):
+    number: int
+    status: TRWCaptureSlotStatus
+    stream_id: str | None = None
+    updated_at: datetime
+
+
+class TRWCaptureStartup(BaseModel):
+    # "warm" when a pool slot picked the stream up, "cold" when a new process had to start
+    kind: str
+    count: int
+    average_seconds: float
+    last_seconds: float
+
+
+class TRWDiscoverySweep(BaseModel):
+    count: int
+    average_seconds: float
+    last_seconds: float
+    max_seconds: float
+    finished_at: datetime
+
+
+class ScheduledCapture(BaseModel):
+    stream_id: str
+    channel: str
+    campus: TRWCampus
+    # lower is admitted first
+    priority: int
+    queued_at: datetime
+    warm: bool = False
+    # capture slot or display/sink number once admitted
+    number: int | None = None
+    started_at: datetime | None = None
+
+
+class TRWCaptureSchedulerState(BaseModel):
+    max_concurrent: int
+    load_per_cpu: float
+    available_memory_mb: float
+    active: List[ScheduledCapture]
+    queued: List[ScheduledCapture]
+    updated_at: datetime
+
+
+class TRWCaptureSlotsResponse(BaseModel):
+    slots: List[TRWCaptureSlot]
+    startup: List[TRWCaptureStartup]
 
 
 class DudestreamStream(BaseModel):
@@ -42,6 +119,21 @@ class TRWUpcomingStream(BaseModel):
     def is_expired(self) -> bool:
         return self.start_time < datetime.now(timezone.utc)
 
+
+class MessageParserStats(BaseModel):
+    llm_calls: int = 0
+    llm_requests: int = 0
+    local_parses: int = 0
+    cache_hits: int = 0
+    prefilter_skipped: int = 0
+
+
+class RedisCommandStats(BaseModel):
+    round_trips: int = 0
+    commands: int = 0
+    average_latency_ms: float = 0
+
+
 class BaseChatMessage(BaseModel):
     message: str
     author: str
@@ -51,6 +143,11 @@ class TRWStreamChatMessage(BaseChatMessage):
     id: str
     time: str
     reply_to: BaseChatMessage | None
+
+
+class TRWStreamChatEntry(TRWStreamChatMessage):
+    # position in the stream's chat, viewers send the last one back to resume after a reconnect
+    entry_id: str
  
 
 class HurawatchMovieSchema(BaseModel):
@@ -70,6 +167,7 @@ class HurawatchMoviesResponse(BaseModel):
     hurawatch_movies: List[HurawatchMovieSchema]
     page: int
     total_pages: int
+    next_after_id: int | None = None
 
 class LibgenBookSchema(BaseModel):
     id: int
@@ -88,4 +186,29 @@ class LibgenBookSchema(BaseModel):
 class LibgenBooksResponse(BaseModel):
     libgen_books: List[LibgenBookSchema]
     page: int
-    total_pages: int
\ No newline at end of file
+    total_pages: int
+    next_after_id: int | None = None
+
+class SearchResultSchema(BaseModel):
+    source: CatalogSource
+    rank: float
+    hurawatch_movie: HurawatchMovieSchema | None = None
+    libgen_book: LibgenBookSchema | None = None
+
+class SearchResponse(BaseModel):
+    results: List[SearchResultSchema]
+    page: int
+
+
+class TRWSession(BaseModel):
+    # raw value of the "rauth" localStorage entry, it holds the session token
+    rauth: str
+    cookies: List[Dict] = []
+    saved_at: float = 0
+
+    @property
+    def token(self) -> str | None:
+        try:
+            return json.loads(self.rauth).get("token")
+        except (ValueError, AttributeError):
+            return None
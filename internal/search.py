@@ -0,0 +1,216 @@
+import re
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import Engine, select, text
+from sqlalchemy.orm import Session
+
+from internal.models.hurawatch import HuraWatchMovie
+from internal.models.libgen import LibgenBook
+from internal.schemas import CatalogSource
+
+# Full text index over the hurawatch and libgen catalogs.
+# On postgres it is a table with a weighted tsvector column and a GIN index,
+# on sqlite it is an FTS5 virtual table whose rowid encodes source and id.
+SEARCH_TABLE = "catalog_search"
+
+SOURCE_ROWID_OFFSETS = {
+    CatalogSource.HURAWATCH: 0,
+    CatalogSource.LIBGEN: 1,
+}
+
+POSTGRES_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+        source VARCHAR NOT NULL,
+        ref_id INTEGER NOT NULL,
+        document TSVECTOR NOT NULL,
+        PRIMARY KEY (source, ref_id)
+    )""",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)",
+]
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        title,
+        body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+]
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def init_search_index(engine: Engine) -> None:
+    """Create the search index if needed and backfill it from existing catalog rows."""
+    ddl = POSTGRES_DDL if engine.dialect.name == "postgresql" else SQLITE_DDL
+    with engine.begin() as connection:
+        for statement in ddl:
+            connection.execute(text(statement))
+
+    with Session(engine) as session:
+        if session.execute(text(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 1")).first():
+            return
+        rebuild_search_index(session)
+
+
+def rebuild_search_index(session: Session) -> None:
+    for movies in _batches(session, HuraWatchMovie):
+        index_hurawatch_movies(session, movies)
+        session.commit()
+    for books in _batches(session, LibgenBook):
+        index_libgen_books(session, books)
+        session.commit()
+
+
+def _batches(session: Session, model) -> Iterable[List]:
+    last_id = 0
+    while True:
+        rows = session.scalars(
+            select(model).where(model.id > last_id).order_by(model.id).limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def index_hurawatch_movies(session: Session, movies: Iterable[HuraWatchMovie]) -> None:
+    """Add or refresh index entries, the caller owns the transaction."""
+    _index_documents(
+        session,
+        CatalogSource.HURAWATCH,
+        [
+            (movie.id, movie.title, _join(movie.storyline, movie.stars, movie.directors))
+            for movie in movies
+        ],
+    )
+
+
+def index_libgen_books(session: Session, books: Iterable[LibgenBook]) -> None:
+    """Add or refresh index entries, the caller owns the transaction."""
+    _index_documents(
+        session,
+        CatalogSource.LIBGEN,
+        [(book.id, book.title, _join(book.authors, book.publisher)) for book in books],
+    )
+
+
+def _join(*fields: str | None) -> str:
+    return " ".join(field for field in fields if field)
+
+
+def _index_documents(
+    session: Session, source: CatalogSource, documents: List[Tuple[int, str, str]]
+) -> None:
+    if not documents:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(
+            text(
+                f"""INSERT INTO {SEARCH_TABLE} (source, ref_id, document)
+                VALUES (
+                    :source,
+                    :ref_id,
+                    setweight(to_tsvector('simple', :title), 'A') || setweight(to_tsvector('simple', :body), 'B')
+                )
+                ON CONFLICT (source, ref_id) DO UPDATE SET document = EXCLUDED.document"""
+            ),
+            [
+                {"source": source.value, "ref_id": ref_id, "title": title or "", "body": body}
+                for ref_id, title, body in documents
+            ],
+        )
+    else:
+        session.execute(
+            text(f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, title, body) VALUES (:rowid, :title, :body)"),
+            [
+                {"rowid": ref_id * 2 + SOURCE_ROWID_OFFSETS[source], "title": title or "", "body": body}
+                for ref_id, title, body in documents
+            ],
+        )
+
+
+def search_terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def search_catalog(
+    session: Session,
+    query: str,
+    source: CatalogSource | None = None,
+    is_movie: bool | None = None,
+    genre: str | None = None,
+    topic: str | None = None,
+    subtopic: str | None = None,
+    limit: int = 12,
+    offset: int = 0,
+) -> List[Tuple[CatalogSource, int, float]]:
+    """Ranked (source, id, rank) matches, every term is matched as a prefix."""
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if session.get_bind().dialect.name == "postgresql":
+        source_column = "source"
+        ref_column = "ref_id"
+        match = "document @@ to_tsquery('simple', :query)"
+        rank = "ts_rank(document, to_tsquery('simple', :query))"
+        match_query = " & ".join(f"{term}:*" for term in terms)
+    else:
+        source_column = "CASE rowid % 2 WHEN 0 THEN 'HURAWATCH' ELSE 'LIBGEN' END"
+        ref_column = "rowid / 2"
+        match = f"{SEARCH_TABLE} MATCH :query"
+        # bm25 is lower for better matches, titles weigh ten times the rest
+        rank = f"-bm25({SEARCH_TABLE}, 10.0, 1.0)"
+        match_query = " ".join(f'"{term}"*' for term in terms)
+
+    conditions = [match]
+    params = {"query": match_query, "limit": limit, "offset": offset}
+
+    if is_movie is not None or genre:
+        source = source or CatalogSource.HURAWATCH
+        if source != CatalogSource.HURAWATCH:
+            return []
+    if topic or subtopic:
+        source = source or CatalogSource.LIBGEN
+        if source != CatalogSource.LIBGEN:
+            return []
+
+    if source:
+        conditions.append(f"{source_column} = :source")
+        params["source"] = source.value
+    if is_movie is not None:
+        conditions.append(f"{ref_column} IN (SELECT id FROM hurawatch_movies WHERE is_movie = :is_movie)")
+        params["is_movie"] = is_movie
+    if genre:
+        conditions.append(
+            f"""{ref_column} IN (
+                SELECT movie_genre.movie_id FROM hurawatch_movie_genre movie_genre
+                JOIN hurawatch_genres genre ON genre.id = movie_genre.genre_id
+                WHERE genre.name = :genre
+            )"""
+        )
+        params["genre"] = genre
+    if topic or subtopic:
+        conditions.append(
+            f"""{ref_column} IN (
+                SELECT book.id FROM libgen_books book
+                JOIN libgen_topics subtopic ON subtopic.id = book.topic_id
+                JOIN libgen_topics topic ON topic.id = subtopic.parent_id
+                WHERE (:topic IS NULL OR topic.name = :topic)
+                AND (:subtopic IS NULL OR subtopic.name = :subtopic)
+            )"""
+        )
+        params["topic"] = topic
+        params["subtopic"] = subtopic
+
+    rows = session.execute(
+        text(
+            f"""SELECT {source_column} AS source, {ref_column} AS ref_id, {rank} AS score
+            FROM {SEARCH_TABLE}
+            WHERE {" AND ".join(conditions)}
+            ORDER BY score DESC
+            LIMIT :limit OFFSET :offset"""
+        ),
+        params,
+    ).all()
+    return [(CatalogSource(row.source), int(row.ref_id), float(row.score)) for row in rows]
@@ -1,20 +1,16 @@
 from internal.stream_sources.base import IStreamSource
-from internal.stream_sources.exceptions import UnexpectedResponse
+from internal.stream_sources.fetcher import Fetcher
 from internal.schemas import DudestreamStream
 from internal.redis import RedisClient
+import asyncio
 import time
 import uuid
-import requests
-from bs4 import BeautifulSoup
 from datetime import datetime
 
 class DudeStream(IStreamSource):
 
     def __init__(self, redis_client: RedisClient) -> None:
         self.redis_client = redis_client
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
-        }
         self.categories = [
             ("Soccer", "https://dudestream.com/category/soccer/",),
             ("MSL", "https://dudestream.com/category/mls/",),
@@ -39,40 +35,39 @@ class DudeStream(IStreamSource):
         ]
 
     def monitor_streams(self):
-
-        for category_name, category_url in self.categories:
-            print_with_dudestream_prefix(f"Checking category: {category_name}")
-            res = requests.get(category_url, headers=self.headers)
-            if res.status_code != 200:
-                raise UnexpectedResponse(f"Unexpected status code {res.status_code} from {category_url}")
-            soup = BeautifulSoup(res.content, "html.parser")
-            articles = soup.find_all("article")
-            # delete all existing streams for this category
-            self.redis_client.delete_dudestream_category_streams(category_name)
-            print_with_dudestream_prefix(f"Found {len(articles)} streams in category: {category_name}")
-            for article in articles:
-                article_url = article.h4.a["href"]
-                res = requests.get(article_url, headers=self.headers)
-                if res.status_code != 200:
-                    print(f"Unexpected status code {res.status_code} from {article_url}")
-                    continue
-                soup = BeautifulSoup(res.content, "html.parser")
-                stream_title = soup.h1.text.strip()
-                stream_date = datetime.strptime(soup.find("span", "mg-blog-date").text.strip(), "%b %d, %Y").date()
-                stream_embed_link = soup.iframe["src"]
-                stream_id = str(uuid.uuid4())
-                stream = DudestreamStream(
-                    id=stream_id,
-                    name=stream_title,
-                    url=stream_embed_link,
-                    date=stream_date,
-                    category=category_name,
-                )
-                self.redis_client.add_dudestream_stream(stream)
+        asyncio.run(self.__check_categories())
 
         print_with_dudestream_prefix(f"All categories checked. Sleeping for 30 minutes.")
         time.sleep(1800)  # Sleep for 30 minutes before checking again
 
+    async def __check_categories(self) -> None:
+        async with Fetcher() as fetcher:
+            for category_name, category_url in self.categories:
+                print_with_dudestream_prefix(f"Checking category: {category_name}")
+                soup = await fetcher.soup(category_url)
+                articles = soup.find_all("article")
+                print_with_dudestream_prefix(f"Found {len(articles)} streams in category: {category_name}")
+                article_urls = [article.h4.a["href"] for article in articles]
+                streams = []
+                for article_url, soup in zip(article_urls, await fetcher.soups(article_urls)):
+                    if isinstance(soup, Exception):
+                        print_with_dudestream_prefix(f"Failed to fetch {article_url}: {soup}")
+                        continue
+                    stream_title = soup.h1.text.strip()
+                    stream_date = datetime.strptime(soup.find("span", "mg-blog-date").text.strip(), "%b %d, %Y").date()
+                    stream_embed_link = soup.iframe["src"]
+                    stream_id = str(uuid.uuid4())
+                    stream = DudestreamStream(
+                        id=stream_id,
+                        name=stream_title,
+                        url=stream_embed_link,
+                        date=stream_date,
+                        category=category_name,
+                    )
+                    streams.append(stream)
+                # the category's old streams are swapped for the new ones in one MULTI
+                self.redis_client.replace_dudestream_category_streams(category_name, streams)
+
 
                 
 def print_with_dudestream_prefix(message: str) -> None:
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+import httpx
+from bs4 import BeautifulSoup
+
+from internal.stream_sources.exceptions import UnexpectedResponse, PageNotFound
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class Fetcher:
+    """Pooled async HTTP client shared by the scraping sources.
+
+    Connections are kept alive between requests, requests to the same host
+    are capped at max_connections_per_host and failed requests are retried
+    with exponential backoff. Use it as an async context manager.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = 8,
+        timeout: float = 30.0,
+        retries: int = 3,
+        backoff: float = 1.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.transport = transport
+        self.client: httpx.AsyncClient | None = None
+        self.host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> "Fetcher":
+        self.client = httpx.AsyncClient(
+            headers=REQUEST_HEADERS,
+            timeout=self.timeout,
+            follow_redirects=True,
+            http2=HTTP2_AVAILABLE,
+            transport=self.transport,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.client.aclose()
+        self.client = None
+
+    async def get(self, url: str) -> bytes:
+        """GET the url and return the body, raising PageNotFound on 404."""
+        host = urlsplit(url).netloc
+        semaphore = self.host_semaphores.setdefault(
+            host, asyncio.Semaphore(self.max_connections_per_host)
+        )
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    response = await self.client.get(url)
+                if response.status_code == 404:
+                    raise PageNotFound(f"Page not found: {url}")
+                if response.status_code == 200:
+                    return response.content
+                error = UnexpectedResponse(f"Unexpected status code {response.status_code} from {url}")
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise error
+            except httpx.TransportError as e:
+                error = UnexpectedResponse(f"Request to {url} failed: {e!r}")
+
+            if attempt >= self.retries:
+                raise error
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    async def soup(self, url: str) -> BeautifulSoup:
+        return BeautifulSoup(await self.get(url), "html.parser")
+
+    async def soups(self, urls: List[str]) -> List[BeautifulSoup | Exception]:
+        """Fetch the urls concurrently, failed pages are returned as their exception."""
+        return await asyncio.gather(
+            *(self.soup(url) for url in urls), return_exceptions=True
+        )
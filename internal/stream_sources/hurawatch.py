@@ -1,85 +1,80 @@
 from internal.stream_sources.base import IStreamSource
-from internal.stream_sources.exceptions import UnexpectedResponse, PageNotFound
-from internal.schemas import DudestreamStream
-from internal.models.hurawatch import HuraWatchGenre, HuraWatchMovie, HuraWatchEpisode
+from internal.stream_sources.exceptions import PageNotFound
+from internal.stream_sources.fetcher import Fetcher
+from internal.models.hurawatch import HuraWatchGenre, HuraWatchMovie, HuraWatchEpisode, movie_genre_association
+from internal.search import index_hurawatch_movies
+from internal.upsert import upsert
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy import select
-import requests
+from sqlalchemy import delete, select
 from bs4 import BeautifulSoup
-from typing import List
+from typing import Dict, List, Tuple
+import asyncio
 import time
 
 MOVIES_URL = "https://hurawatch.vip/movies/page/%d"
 TV_SHOWS_URL = "https://hurawatch.vip/tv-shows/page/%d"
 
-REQUEST_HEADERS = {
-    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
-}
 class Hurawatch(IStreamSource):
 
     def __init__(self, db_session: sessionmaker[Session]) -> None:
         self.db_session = db_session
+        # genre name -> id, shared by every page written by this process
+        self.genre_ids: Dict[str, int] = {}
 
     def monitor_streams(self):
         while True:
-            self.__scrape_movies()
-            self.__scrape_tv_shows()
+            asyncio.run(self.__sync())
             print_with_hurawatch_prefix(f"Movies and Tv shows synced. Sleeping for 6 hours.")
             time.sleep(21600)  # Sleep for 6 hours before checking again
 
-    
-    def __scrape_movies(self) -> None:
+    async def __sync(self) -> None:
+        async with Fetcher() as fetcher:
+            await self.__scrape_movies(fetcher)
+            await self.__scrape_tv_shows(fetcher)
+
+    async def __fetch_articles(self, fetcher: Fetcher, articles) -> List[Tuple[int, BeautifulSoup]]:
+        """Fetch the detail pages of a listing page in parallel, skipping the ones that fail."""
+        movie_ids = [int(article["id"].split("-")[1]) for article in articles]
+        movie_urls = [article.a["href"] for article in articles]
+        fetched = []
+        for movie_id, movie_url, soup in zip(movie_ids, movie_urls, await fetcher.soups(movie_urls)):
+            if isinstance(soup, Exception):
+                print_with_hurawatch_prefix(f"Failed to fetch {movie_url}: {soup}")
+                continue
+            fetched.append((movie_id, soup))
+        return fetched
+
+    async def __scrape_movies(self, fetcher: Fetcher) -> None:
         page = 1
         total_movie_count = 0
         while True:
             print_with_hurawatch_prefix(f"Checking page {page} for movies")
             try:
-                soup = make_request_and_soup(MOVIES_URL % page)
+                soup = await fetcher.soup(MOVIES_URL % page)
             except PageNotFound:
                 break
             articles = soup.find_all("article")
-            for article in articles:
-                movie_id = int(article["id"].split("-")[1])
-                movie_url = article.a["href"]
-                soup = make_request_and_soup(movie_url)
+            movies = []
+            for movie_id, soup in await self.__fetch_articles(fetcher, articles):
                 movie_info = extract_movie_info(soup)
-                embed_url = soup.iframe["src"]
-                genres = []
-                with self.db_session() as session:
-                    for genre_name in movie_info["genres"]:
-                        genre = get_or_create_genre(session, genre_name)
-                        genres.append(genre)
-                    create_or_update_movie(
-                        session,
-                        hurawatch_id=movie_id,
-                        title=movie_info["title"],
-                        movie_embed_url=embed_url,
-                        thumbnail_url=movie_info["thumbnail_url"],
-                        storyline=movie_info["storyline"],
-                        directors=movie_info["directors"],
-                        writers=movie_info["writers"],
-                        stars=movie_info["stars"],
-                        is_movie=True,
-                        genres=genres,
-                    )
+                movies.append(movie_row(movie_id, movie_info, soup.iframe["src"], True))
+            self.__write_page(movies)
             page += 1
             total_movie_count += len(articles)
         print_with_hurawatch_prefix(f"Done scraping movies. Total movies found: {total_movie_count}")
 
-    def __scrape_tv_shows(self) -> None:
+    async def __scrape_tv_shows(self, fetcher: Fetcher) -> None:
         page = 1
         total_movie_count = 0
         while True:
             print_with_hurawatch_prefix(f"Checking page {page} for tv shows")
             try:
-                soup = make_request_and_soup(TV_SHOWS_URL % page)
+                soup = await fetcher.soup(TV_SHOWS_URL % page)
             except PageNotFound:
                 break
             articles = soup.find_all("article")
-            for article in articles:
-                movie_id = int(article["id"].split("-")[1])
-                movie_url = article.a["href"]
-                soup = make_request_and_soup(movie_url)
+            tv_shows = []
+            for movie_id, soup in await self.__fetch_articles(fetcher, articles):
                 movie_info = extract_movie_info(soup)
                 # if iframe exists, means it's a single episode, else multiple episodes inside 1 post
                 if soup.iframe:
@@ -91,37 +86,18 @@ class Hurawatch(IStreamSource):
                     episode_embed_links = []
                     for tag in episode_tags:
                         episode_embed_links.append(tag.a["href"])
-
-                genres = []
-                with self.db_session() as session:
-                    for genre_name in movie_info["genres"]:
-                        genre = get_or_create_genre(session, genre_name)
-                        genres.append(genre)
-                    tv_show = create_or_update_movie(
-                        session,
-                        hurawatch_id=movie_id,
-                        title=movie_info["title"],
-                        movie_embed_url=embed_url,
-                        thumbnail_url=movie_info["thumbnail_url"],
-                        storyline=movie_info["storyline"],
-                        directors=movie_info["directors"],
-                        writers=movie_info["writers"],
-                        stars=movie_info["stars"],
-                        is_movie=False,
-                        genres=genres,
-                    )
-                    if episode_embed_links:
-                        for episode_number, episode_embed_link in enumerate(episode_embed_links, start=1):
-                            create_or_update_episode(
-                                session,
-                                tv_show_id=tv_show.id,
-                                episode_number=episode_number,
-                                embed_url=episode_embed_link,
-                            )
+                tv_shows.append(movie_row(movie_id, movie_info, embed_url, False, episode_embed_links))
+            self.__write_page(tv_shows)
             page += 1
             total_movie_count += len(articles)
         print_with_hurawatch_prefix(f"Done scraping TV Shows. Total TV Shows found: {total_movie_count}")
 
+    def __write_page(self, movies: List[dict]) -> None:
+        started = time.perf_counter()
+        with self.db_session() as session:
+            upsert_movies(session, movies, self.genre_ids)
+        print_with_hurawatch_prefix(f"Wrote {len(movies)} rows in {(time.perf_counter() - started) * 1000:.0f} ms")
+
 
 
 
@@ -183,97 +159,97 @@ def extract_movie_info(soup: BeautifulSoup) -> dict:
     return data
 
 
-def make_request_and_soup(url: str) -> BeautifulSoup:
-    """Make a GET request to the specified URL with the headers."""
-    response = requests.get(url, headers=REQUEST_HEADERS)
-    if response.status_code == 404:
-        raise PageNotFound(f"Page not found: {url}")
-    if response.status_code != 200:
-        raise UnexpectedResponse(f"Unexpected status code {response.status_code} from {url}")
-    return BeautifulSoup(response.content, "html.parser")
-
-
                 
 def print_with_hurawatch_prefix(message: str) -> None:
     print(f"[Hurawatch] {message}")
             
 
         
-def get_or_create_genre(session: Session, genre_name: str) -> HuraWatchGenre:
-    """Get or create a genre in the database."""
-    # use sql.select
-    genre = session.scalars(select(HuraWatchGenre).where(HuraWatchGenre.name == genre_name)).first()
-    if not genre:
-        genre = HuraWatchGenre(name=genre_name)
-        session.add(genre)
-        session.commit()
-    return genre
-
-def create_or_update_movie(
-        session: Session,
+def movie_row(
         hurawatch_id: int,
-        title: str,
-        movie_embed_url: str,
-        thumbnail_url: str,
-        storyline: str,
-        directors: str,
-        writers: str,
-        stars: str,
+        movie_info: dict,
+        movie_embed_url: str | None,
         is_movie: bool,
-        genres: List[HuraWatchGenre],
-) -> HuraWatchMovie:
-    
-    """Create or update a movie in the database."""
-    movie: HuraWatchMovie = session.scalars(select(HuraWatchMovie).where(HuraWatchMovie.hurawatch_id == hurawatch_id)).first()
-    if not movie:
-        movie = HuraWatchMovie(
-            hurawatch_id=hurawatch_id,
-            title=title,
-            movie_embed_url=movie_embed_url,
-            thumbnail_url=thumbnail_url,
-            storyline=storyline,
-            directors=directors,
-            writers=writers,
-            stars=stars,
-            is_movie=is_movie,
-        )
-        session.add(movie)
-    else:
-        movie.title = title
-        movie.movie_embed_url = movie_embed_url
-        movie.thumbnail_url = thumbnail_url
-        movie.storyline = storyline
-        movie.directors = directors
-        movie.writers = writers
-        movie.stars = stars
-        movie.is_movie = is_movie
-
-    # Update genres
-    movie.genres.clear()
-    for genre in genres:
-        movie.genres.append(genre)
+        episode_embed_links: List[str] | None = None,
+) -> dict:
+    """A scraped movie or tv show in the shape upsert_movies writes."""
+    return {
+        "hurawatch_id": hurawatch_id,
+        "title": movie_info["title"],
+        "movie_embed_url": movie_embed_url,
+        "thumbnail_url": movie_info["thumbnail_url"],
+        "storyline": movie_info["storyline"],
+        "directors": movie_info["directors"],
+        "writers": movie_info["writers"],
+        "stars": movie_info["stars"],
+        "is_movie": is_movie,
+        "genres": movie_info["genres"] or [],
+        "episode_embed_links": episode_embed_links or [],
+    }
 
-    session.commit()
-    return movie
 
+def get_genre_ids(session: Session, genre_names: List[str], genre_ids: Dict[str, int]) -> Dict[str, int]:
+    """Resolve genre names to ids, creating missing genres and filling the genre_ids cache."""
+    missing = sorted(set(genre_names) - genre_ids.keys())
+    if missing:
+        upsert(session, HuraWatchGenre.__table__, [{"name": name} for name in missing], ["name"], update=False)
+        for genre_id, name in session.execute(
+            select(HuraWatchGenre.id, HuraWatchGenre.name).where(HuraWatchGenre.name.in_(missing))
+        ):
+            genre_ids[name] = genre_id
+    return genre_ids
+
+
+def upsert_movies(session: Session, movies: List[dict], genre_ids: Dict[str, int]) -> None:
+    """Write a page of movie_row()s, their genres and episodes in one transaction."""
+    if not movies:
+        return
+    get_genre_ids(session, [name for movie in movies for name in movie["genres"]], genre_ids)
+
+    movie_columns = [
+        "hurawatch_id", "title", "movie_embed_url", "thumbnail_url", "storyline",
+        "directors", "writers", "stars", "is_movie",
+    ]
+    # a listing page can repeat a post, the last occurrence wins
+    movies = list({movie["hurawatch_id"]: movie for movie in movies}.values())
+    ids = {
+        hurawatch_id: movie_id
+        for movie_id, hurawatch_id in upsert(
+            session,
+            HuraWatchMovie.__table__,
+            [{column: movie[column] for column in movie_columns} for movie in movies],
+            ["hurawatch_id"],
+            returning=["id", "hurawatch_id"],
+        )
+    }
 
-def create_or_update_episode(
-        session: Session,
-        tv_show_id: int,
-        episode_number: int,
-        embed_url: str,
-) -> None:
-    
-    """Create or update an episode in the database."""
-    episode = session.scalars(select(HuraWatchEpisode).where(HuraWatchEpisode.tv_show_id == tv_show_id, HuraWatchEpisode.episode_number == episode_number)).first()
-    if not episode:
-        episode = HuraWatchEpisode(
-            tv_show_id=tv_show_id,
-            episode_number=episode_number,
-            embed_url=embed_url,
+    session.execute(
+        delete(movie_genre_association).where(movie_genre_association.c.movie_id.in_(ids.values()))
+    )
+    movie_genres = {
+        (ids[movie["hurawatch_id"]], genre_ids[name])
+        for movie in movies
+        for name in movie["genres"]
+    }
+    if movie_genres:
+        session.execute(
+            movie_genre_association.insert(),
+            [{"movie_id": movie_id, "genre_id": genre_id} for movie_id, genre_id in movie_genres],
         )
-        session.add(episode)
-    else:
-        episode.embed_url = embed_url
 
-    session.commit()
\ No newline at end of file
+    upsert(
+        session,
+        HuraWatchEpisode.__table__,
+        [
+            {"tv_show_id": ids[movie["hurawatch_id"]], "episode_number": episode_number, "embed_url": embed_url}
+            for movie in movies
+            for episode_number, embed_url in enumerate(movie["episode_embed_links"], start=1)
+        ],
+        ["tv_show_id", "episode_number"],
+    )
+
+    index_hurawatch_movies(
+        session,
+        session.scalars(select(HuraWatchMovie).where(HuraWatchMovie.id.in_(ids.values()))).all(),
+    )
+    session.commit()
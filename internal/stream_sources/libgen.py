@@ -1,99 +1,152 @@
 from internal.stream_sources.base import IStreamSource
-from internal.stream_sources.exceptions import UnexpectedResponse, PageNotFound
+from internal.stream_sources.fetcher import Fetcher
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy import select
-import requests
-from bs4 import BeautifulSoup
-from typing import List
+from typing import Dict, List, Tuple
+import asyncio
 import time
 
 from internal.models.libgen import LibgenBook, LibgenTopic
+from internal.search import index_libgen_books
+from internal.upsert import upsert
 
 
 BASE_URL = "https://libgen.is/"
 BASE_URL_DOWNLOAD = "https://libgen.gs/"
 
-REQUEST_HEADERS = {
-    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
-}
+class LibgenSyncStats:
+    """Counts of the work an incremental sync did and avoided."""
+
+    def __init__(self) -> None:
+        self.listing_pages_fetched = 0
+        self.download_pages_fetched = 0
+        self.download_pages_skipped = 0
+        self.books_written = 0
+        self.writes_skipped = 0
+
+    def __str__(self) -> str:
+        return (
+            f"listing pages fetched: {self.listing_pages_fetched}, "
+            f"download pages fetched: {self.download_pages_fetched}, "
+            f"download pages skipped: {self.download_pages_skipped}, "
+            f"books written: {self.books_written}, "
+            f"writes skipped: {self.writes_skipped}"
+        )
+
+
 class Libgen(IStreamSource):
 
-    def __init__(self, db_session: sessionmaker[Session]) -> None:
+    def __init__(self, db_session: sessionmaker[Session], incremental: bool = True) -> None:
         self.db_session = db_session
+        # only fetch download pages and write rows for new or changed books,
+        # and stop paging a subtopic once a whole page is already known
+        self.incremental = incremental
+        # (topic, subtopic) -> subtopic id, shared by every page written by this process
+        self.topic_ids: Dict[Tuple[str, str], int] = {}
 
     def monitor_streams(self):
-        soup = make_request_and_soup(BASE_URL)
-        for listColumn in soup.find(id="menu").find_all("ul", "greybox"):
-            for a_tag_main_category in listColumn.find_all("a", "drop"):
-                main_category = a_tag_main_category.text.strip()
-                print_with_libgen_prefix(f"Processing main category: {main_category}")
-                for a_tag_sub_category in a_tag_main_category.find_next("ul").find_all("a"):
-                    sub_category = a_tag_sub_category.text.strip()
-                    print_with_libgen_prefix(f"Processing sub category: {sub_category}")
-                    with self.db_session() as session:
-                        subtopic = get_or_create_libgen_topic(session, main_category, sub_category)
-
-                    sub_category_url = a_tag_sub_category["href"]
-                    page = 1
-                    while True:
-                        print_with_libgen_prefix(f"Processing page {page} of {sub_category}")
-                        soup = make_request_and_soup(BASE_URL + sub_category_url + f"&page={page}")
-                        table = soup.find_all("table")[2]
-                        rows = table.find_all("tr")[1:]
-                        if len(rows) == 0:
-                            break
-                        for row in rows:
-                            columns = row.find_all("td")
-                            if len(columns) < 10:
-                                continue
-                            libgen_id = columns[0].text.strip()
-                            authors = columns[1].text.strip()
-                            title = columns[2].text.strip()
-                            publisher = columns[3].text.strip()
-                            year = columns[4].text.strip()
-                            pages = columns[5].text.strip()
-                            language = columns[6].text.strip()
-                            size = columns[7].text.strip()
-                            extension = columns[8].text.strip()
-                            download_page = columns[10].find("a")["href"]
-                            download_page_soup = make_request_and_soup(download_page)
-                            download_link = BASE_URL_DOWNLOAD + download_page_soup.find("table", id="main").tr.find_all("td")[1].a["href"]
-
-                            with self.db_session() as session:
-                                create_or_update_libgen_book(
-                                    session,
-                                    libgen_id,
-                                    title,
-                                    authors,
-                                    publisher,
-                                    year,
-                                    pages,
-                                    language,
-                                    size,
-                                    extension,
-                                    download_link,
-                                    subtopic.id
-                                )
-
-                        page += 1
+        stats = LibgenSyncStats()
+        asyncio.run(self.__sync(stats))
+        print_with_libgen_prefix(f"Sync done. {stats}")
         time.sleep(86400) # Sleep for 24 hours before the next run
 
-                        
-                    
-
-
+    async def __sync(self, stats: LibgenSyncStats) -> None:
+        async with Fetcher() as fetcher:
+            soup = await fetcher.soup(BASE_URL)
+            for listColumn in soup.find(id="menu").find_all("ul", "greybox"):
+                for a_tag_main_category in listColumn.find_all("a", "drop"):
+                    main_category = a_tag_main_category.text.strip()
+                    print_with_libgen_prefix(f"Processing main category: {main_category}")
+                    for a_tag_sub_category in a_tag_main_category.find_next("ul").find_all("a"):
+                        sub_category = a_tag_sub_category.text.strip()
+                        print_with_libgen_prefix(f"Processing sub category: {sub_category}")
+                        topic_key = (main_category, sub_category)
+                        if topic_key not in self.topic_ids:
+                            with self.db_session() as session:
+                                self.topic_ids[topic_key] = get_or_create_libgen_topic(session, main_category, sub_category).id
+                        await self.__sync_subtopic(fetcher, sub_category, self.topic_ids[topic_key], a_tag_sub_category["href"], stats)
+
+    async def __sync_subtopic(
+        self,
+        fetcher: Fetcher,
+        sub_category: str,
+        subtopic_id: int,
+        sub_category_url: str,
+        stats: LibgenSyncStats,
+    ) -> None:
+        known_books = {}
+        if self.incremental:
+            with self.db_session() as session:
+                known_books = get_libgen_book_fingerprints(session, subtopic_id)
+
+        page = 1
+        while True:
+            print_with_libgen_prefix(f"Processing page {page} of {sub_category}")
+            soup = await fetcher.soup(BASE_URL + sub_category_url + f"&page={page}")
+            stats.listing_pages_fetched += 1
+            table = soup.find_all("table")[2]
+            rows = table.find_all("tr")[1:]
+            if len(rows) == 0:
+                break
+            books = []
+            for row in rows:
+                columns = row.find_all("td")
+                if len(columns) < 10:
+                    continue
+                books.append((
+                    int(columns[0].text.strip()),  # libgen id
+                    columns[1].text.strip(),  # authors
+                    columns[2].text.strip(),  # title
+                    columns[3].text.strip(),  # publisher
+                    columns[4].text.strip(),  # year
+                    columns[5].text.strip(),  # pages
+                    columns[6].text.strip(),  # language
+                    columns[7].text.strip(),  # size
+                    columns[8].text.strip(),  # extension
+                    columns[10].find("a")["href"],  # download page
+                ))
+
+            changed_books = [book for book in books if known_books.get(book[0]) != book[1:9]]
+            skipped = len(books) - len(changed_books)
+            stats.download_pages_skipped += skipped
+            stats.writes_skipped += skipped
+            if self.incremental and books and not changed_books:
+                print_with_libgen_prefix(f"Page {page} of {sub_category} has no new books, done with subtopic")
+                break
+
+            download_pages = await fetcher.soups([book[-1] for book in changed_books])
+            stats.download_pages_fetched += len(changed_books)
+            book_rows = []
+            for book, download_page_soup in zip(changed_books, download_pages):
+                libgen_id, authors, title, publisher, year, pages, language, size, extension, download_page = book
+                if isinstance(download_page_soup, Exception):
+                    print_with_libgen_prefix(f"Failed to fetch {download_page}: {download_page_soup}")
+                    continue
+                download_link = BASE_URL_DOWNLOAD + download_page_soup.find("table", id="main").tr.find_all("td")[1].a["href"]
+                book_rows.append({
+                    "libgen_id": libgen_id,
+                    "title": title,
+                    "authors": authors,
+                    "publisher": publisher,
+                    "year": year,
+                    "pages": pages,
+                    "language": language,
+                    "size": size,
+                    "extension": extension,
+                    "download_link": download_link,
+                    "topic_id": subtopic_id,
+                })
+
+            started = time.perf_counter()
+            with self.db_session() as session:
+                upsert_libgen_books(session, book_rows)
+            stats.books_written += len(book_rows)
+            print_with_libgen_prefix(f"Wrote {len(book_rows)} books in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+            page += 1
 
-def make_request_and_soup(url: str) -> BeautifulSoup:
-    """Make a GET request to the specified URL with the headers."""
-    response = requests.get(url, headers=REQUEST_HEADERS)
-    if response.status_code == 404:
-        raise PageNotFound(f"Page not found: {url}")
-    if response.status_code != 200:
-        raise UnexpectedResponse(f"Unexpected status code {response.status_code} from {url}")
-    return BeautifulSoup(response.content, "html.parser")
 
 
-                
 def print_with_libgen_prefix(message: str) -> None:
     print(f"[Libgen] {message}")
             
@@ -125,55 +178,33 @@ def get_or_create_libgen_topic(session: Session, topic_name: str, sub_topic_name
 
     return subtopic
 
-def create_or_update_libgen_book(
-        session: Session, 
-        libgen_id: int, 
-        title: str, 
-        authors: str, 
-        publisher: str, 
-        year: str,
-        pages: str,
-        language: str,
-        size: str,
-        extension: str,
-        download_link: str, 
-        topic_id: int):
-    # Check if the book already exists using libgen_id
-    book = session.scalars(
-        select(LibgenBook).where(LibgenBook.libgen_id == libgen_id)
-    ).first()
-
-    if book:
-        # Update the existing book
-        book.title = title
-        book.authors = authors
-        book.publisher = publisher
-        book.year = year
-        book.pages = pages
-        book.language = language
-        book.size = size
-        book.extension = extension
-        book.download_link = download_link
-        book.topic_id = topic_id
-    else:
-        # Create a new book entry
-        book = LibgenBook(
-            libgen_id=libgen_id,
-            title=title,
-            authors=authors,
-            publisher=publisher,
-            year=year,
-            pages=pages,
-            language=language,
-            size=size,
-            extension=extension,
-            download_link=download_link,
-            topic_id=topic_id
-        )
-        session.add(book)
-
-    # Commit the changes to the database
+def get_libgen_book_fingerprints(session: Session, topic_id: int) -> Dict[int, Tuple[str, ...]]:
+    """Listing page fields of every stored book in a subtopic, keyed by libgen_id."""
+    rows = session.execute(
+        select(
+            LibgenBook.libgen_id,
+            LibgenBook.authors,
+            LibgenBook.title,
+            LibgenBook.publisher,
+            LibgenBook.year,
+            LibgenBook.pages,
+            LibgenBook.language,
+            LibgenBook.size,
+            LibgenBook.extension,
+        ).where(LibgenBook.topic_id == topic_id)
+    ).all()
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def upsert_libgen_books(session: Session, books: List[dict]) -> None:
+    """Write a page of books and their search index entries in one transaction."""
+    if not books:
+        return
+    # a listing page can repeat a book, the last occurrence wins
+    books = list({book["libgen_id"]: book for book in books}.values())
+    book_ids = [
+        book_id
+        for book_id, in upsert(session, LibgenBook.__table__, books, ["libgen_id"], returning=["id"])
+    ]
+    index_libgen_books(session, session.scalars(select(LibgenBook).where(LibgenBook.id.in_(book_ids))).all())
     session.commit()
-
-    return book
-
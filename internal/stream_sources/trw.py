@@ -1,11 +1,13 @@
 import multiprocessing
 import os
+import queue
 import shutil
 import time
 import uuid
-from typing import Dict, Generator, List
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Generator, List, Set, Tuple
 import json
-import requests
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -17,12 +19,15 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
+from internal.capture_scheduler import CaptureScheduler
 from internal.message_parser import MessageParser
-from internal.redis import RedisClient
-from internal.schemas import BaseChatMessage, TRWStream, TRWStreamChatMessage, TRWCampus
+from internal.redis import RedisClient, TRWChatBuffer
+from internal.schemas import BaseChatMessage, TRWCaptureSlot, TRWCaptureSlotStatus, TRWSession, TRWStream, TRWStreamChatMessage, TRWCampus
 from internal.stream_sources.base import IStreamSource
 from internal.utils import *
 from internal.otp_fetcher import OTPFetcher
+from internal.relay_supervisor import RelaySupervisor
+from internal.trw_session import TRWSessionStore
 
 CHANNELS_TO_MONITOR = [
     (TRWCampus.BUSINESS_MASTERY, "https://app.jointherealworld.com/chat/01GVZRG9K25SS9JZBAMA4GRCEF/01JDEQ9MJA984M1NSPQZGM5BZC"),
@@ -42,6 +47,24 @@ CHANNELS_TO_MONITOR = [
 
 DISPLAY_PORT_START = 100
 
+TRW_APP_URL = "https://app.jointherealworld.com/"
+TRW_LOGIN_URL = "https://app.jointherealworld.com/auth/login?a=p86p7wfnzd&subid=login"
+
+# page loads a stored session gets to show the chat or the login form
+SESSION_VERIFY_ATTEMPTS = 3
+
+# seconds to wait for the 2fa code
+OTP_TIMEOUT = 150
+
+# minimum seconds between two sweeps over the channel tabs
+DISCOVERY_SWEEP_INTERVAL = 5
+# idle channel tabs are reloaded after this many seconds
+CHANNEL_TAB_RELOAD_INTERVAL = 600
+
+# seconds between chat capture drains while a stream is relayed
+CHAT_POLL_INTERVAL = 0.1
+VIDEO_CHECK_EVERY_TICKS = 10
+
 
 class TRW(IStreamSource):
 
@@ -56,6 +79,20 @@ class TRW(IStreamSource):
         otp_email: str,
         otp_email_password: str,
         debug: bool = False,
+        session_file: str = ".trw_session.json",
+        capture_pool_size: int = 2,
+        relay_renditions: List[str] | None = None,
+        hls_dir: str | None = None,
+        crop_to_video: bool = False,
+        decimate: bool = False,
+        max_concurrent_captures: int = 4,
+        max_load_per_cpu: float = 0.85,
+        min_free_memory_mb: float = 1500,
+        campus_priorities: Dict[TRWCampus, int] | None = None,
+        otp_imap_host: str = "imap.gmail.com",
+        otp_imap_port: int = 993,
+        otp_imap_ssl: bool = True,
+        otp_sender: str = "",
     ) -> None:
         self.username = username
         self.password = password
@@ -64,72 +101,100 @@ class TRW(IStreamSource):
         self.redis_client = redis_client
         self.channel_stream_ids: Dict[str, str] = {}
         self.channel_last_messages: Dict[str, TRWStreamChatMessage] = {}
-        self.message_parser = MessageParser(openai_api_key)
-        self.otp_fetcher = OTPFetcher(otp_email, otp_email_password)
+        self.message_parser = MessageParser(openai_api_key, redis_client)
+        self.otp_fetcher = OTPFetcher(
+            otp_email, otp_email_password, otp_imap_host, otp_imap_port, otp_imap_ssl, otp_sender
+        )
         self.debug = debug
+        self.session_store = TRWSessionStore(session_file)
+        self.capture_pool_size = capture_pool_size
+        self.relay_renditions = [RENDITIONS[name.strip()] for name in relay_renditions or ["720p"]]
+        self.hls_dir = hls_dir
+        self.crop_to_video = crop_to_video
+        self.decimate = decimate
+        # numbers below the pool size belong to the warm capture slots
+        self.scheduler = CaptureScheduler(
+            max_concurrent_captures,
+            range(capture_pool_size, capture_pool_size + max_concurrent_captures),
+            max_load_per_cpu,
+            min_free_memory_mb,
+            campus_priorities,
+        )
+        self.idle_slots: Set[int] = set()
+        # warm slot number -> stream it is capturing
+        self.slot_stream_ids: Dict[int, str] = {}
+        self.cold_processes: Dict[str, multiprocessing.Process] = {}
 
     def monitor_streams(self):
 
         chromedriver_path = ChromeDriverManager().install()
+
+        # warm capture slots wait for streams with a display, sink and logged in browser ready
+        slot_jobs = [multiprocessing.Queue() for _ in range(self.capture_pool_size)]
+        free_slots = multiprocessing.Queue()
+        for slot_number in range(self.capture_pool_size):
+            multiprocessing.Process(
+                target=self.__run_capture_slot,
+                args=(slot_number, slot_jobs[slot_number], free_slots, chromedriver_path),
+            ).start()
+
         print_with_process_id("Initializing driver")
         display_port = f":{DISPLAY_PORT_START - 1}"
         virtual_sink_name = f"virtual_sink_trw_main"
         driver = self.initialize_trw(
             chromedriver_path, -1, virtual_sink_name, display_port,
         )
-        i = -1
+        channel_tabs = open_channel_tabs(driver)
         while True:
             try:
-                i = (i + 1) % len(CHANNELS_TO_MONITOR)
-                campus_channel = CHANNELS_TO_MONITOR[i]
-                campus = campus_channel[0]
-                channel = campus_channel[1]
+                sweep_started = time.perf_counter()
+                # new chat messages of every channel are parsed together after the sweep
+                new_messages: List[Tuple[TRWStreamChatMessage, TRWCampus]] = []
+                for campus, channel in CHANNELS_TO_MONITOR:
 
+                    # if stream already being captured, skip
+                    stream_id = self.channel_stream_ids.get(channel)
+                    if self.scheduler.is_active(channel):
+                        continue
+                    if stream_id and self.redis_client.get_trw_running_stream(stream_id):
+                        print_with_process_id("stream already running")
+                        continue
 
-                # if stream already running, skip
-                stream_id = self.channel_stream_ids.get(channel)
-                if stream_id and self.redis_client.get_trw_running_stream(stream_id):
-                    print_with_process_id("stream already running")
-                    continue
+                    # every channel stays open in its own tab, so checking it doesn't wait for a page load
+                    tab = channel_tabs[channel]
+                    driver.switch_to.window(tab.handle)
+                    stream = find_stream(driver)
+                    if self.debug:
+                        driver.save_screenshot("test.png")
+                    new_messages.extend(self.__get_new_chat_messages(driver, channel, campus))
 
-                print_with_process_id("fetching channel " + channel)
-                driver.get(channel)
-                # print_with_process_id("Getting youtube")
-                # driver.get("https://www.youtube.com/watch?v=k9KhdIxeAVM&ab_channel=shfashowIndia")
+                    if stream is None:
+                        # the stream ended while it was waiting for capacity
+                        self.scheduler.drop(channel)
+                        # keep idle tabs from going stale, without waiting for the reload
+                        if time.monotonic() - tab.loaded_at > CHANNEL_TAB_RELOAD_INTERVAL:
+                            driver.execute_script("location.reload();")
+                            tab.loaded_at = time.monotonic()
+                        continue
+                    if self.scheduler.is_queued(channel):
+                        continue
 
-                # check if stream is available
-                try:
-                    print_with_process_id("waiting for stream")
-                    wait_for_stream(driver)
-                except Exception as e:
-                    print_with_process_id("stream not available")
-                    continue
-                finally:
-                    driver.save_screenshot("test.png")
-                    # check for upcoming stream messages
-                    self.__check_upcoming_stream_messages(driver, channel, campus)
-
-                print_with_process_id("stream found")
-
-                stream_id = str(uuid.uuid4())
-                self.channel_stream_ids[channel] = stream_id
-
-                process = multiprocessing.Process(
-                    target=self.__start_stream,
-                    args=(
-                        stream_id,
-                        self.destination_rtmp_server,
-                        channel,
-                        campus,
-                        chromedriver_path,
-                        i,
-                    ),
-                )
-                process.start()
+                    print_with_process_id("stream found in " + channel)
+                    stream_id = str(uuid.uuid4())
+                    self.channel_stream_ids[channel] = stream_id
+                    self.scheduler.enqueue(stream_id, channel, campus)
+
+                self.__dispatch_captures(slot_jobs, free_slots, chromedriver_path)
+                # check for upcoming stream messages
+                self.__check_upcoming_stream_messages(new_messages)
+                sweep_seconds = time.perf_counter() - sweep_started
+                print_with_process_id(f"swept {len(CHANNELS_TO_MONITOR)} channels in {sweep_seconds:.2f}s")
+                self.redis_client.record_trw_discovery_sweep(sweep_seconds)
+                time.sleep(max(0, DISCOVERY_SWEEP_INTERVAL - sweep_seconds))
             except Exception as e:
                 print_with_process_id("Main process exception, restarting..." + str(e))
                 try:
-                    self.logout(driver)
+                    driver.quit()
                 except:
                     pass
                 driver = self.initialize_trw(
@@ -138,190 +203,402 @@ class TRW(IStreamSource):
                     virtual_sink_name,
                     display_port,
                 )
+                channel_tabs = open_channel_tabs(driver)
 
-    def __start_stream(
+    def __dispatch_captures(
         self,
-        stream_id: str,
-        destination_rtmp_server: str,
-        channel: str,
-        campus,
+        slot_jobs: List[multiprocessing.Queue],
+        free_slots: multiprocessing.Queue,
         chromedriver_path: str,
-        stream_number: int,
     ) -> None:
+        """Start queued streams the scheduler admits, warm slots first."""
+        # a slot number coming back means that slot finished its stream
+        while True:
+            try:
+                slot_number = free_slots.get_nowait()
+            except queue.Empty:
+                break
+            self.idle_slots.add(slot_number)
+            finished_stream_id = self.slot_stream_ids.pop(slot_number, None)
+            if finished_stream_id:
+                self.scheduler.finish(finished_stream_id)
+        for stream_id, process in list(self.cold_processes.items()):
+            if not process.is_alive():
+                process.join()
+                del self.cold_processes[stream_id]
+                self.scheduler.finish(stream_id)
 
         while True:
-            print_with_process_id("starting streaming")
+            warm_slot = min(self.idle_slots) if self.idle_slots else None
+            capture = self.scheduler.admit(warm_slot)
+            if capture is None:
+                break
+            started_at = capture.started_at.timestamp()
+            if capture.warm:
+                print_with_process_id(f"handing stream to capture slot {capture.number}")
+                self.idle_slots.remove(capture.number)
+                self.slot_stream_ids[capture.number] = capture.stream_id
+                slot_jobs[capture.number].put((capture.stream_id, capture.channel, capture.campus, started_at))
+                continue
 
-            display_port = f":{DISPLAY_PORT_START + stream_number}"
-            virtual_sink_name = f"virtual_sink_{stream_number}"
+            print_with_process_id(f"no capture slot ready, starting a new process on {capture.number}")
+            process = multiprocessing.Process(
+                target=self.__start_stream,
+                args=(
+                    capture.stream_id,
+                    self.destination_rtmp_server,
+                    capture.channel,
+                    capture.campus,
+                    chromedriver_path,
+                    capture.number,
+                    started_at,
+                ),
+            )
+            process.start()
+            self.cold_processes[capture.stream_id] = process
+            # one new browser per sweep, so the next admission sees its load
+            break
 
-            stream_process = None
+        state = self.scheduler.state()
+        if state.queued:
+            print_with_process_id(f"{len(state.queued)} streams waiting for capture capacity")
+        self.redis_client.set_trw_capture_scheduler_state(state)
 
+    def __run_capture_slot(
+        self,
+        slot_number: int,
+        jobs: multiprocessing.Queue,
+        free_slots: multiprocessing.Queue,
+        chromedriver_path: str,
+    ) -> None:
+        display_port = f":{DISPLAY_PORT_START + slot_number}"
+        virtual_sink_name = f"virtual_sink_{slot_number}"
+        driver = None
+        while True:
             try:
+                if driver is None:
+                    self.__set_capture_slot_status(slot_number, TRWCaptureSlotStatus.STARTING)
+                    driver = self.initialize_trw(
+                        chromedriver_path, slot_number, virtual_sink_name, display_port,
+                    )
+                # park the browser on a blank page, this also fails if it died
+                driver.get("about:blank")
+                self.__set_capture_slot_status(slot_number, TRWCaptureSlotStatus.READY)
+                print_with_process_id(f"capture slot {slot_number} ready")
+                free_slots.put(slot_number)
 
-                driver = self.initialize_trw(
+                stream_id, channel, campus, detected_at = jobs.get()
+                self.__set_capture_slot_status(slot_number, TRWCaptureSlotStatus.STREAMING, stream_id)
+                driver = self.__relay_with_restarts(
+                    driver,
+                    stream_id,
+                    self.destination_rtmp_server,
+                    channel,
+                    campus,
                     chromedriver_path,
-                    stream_number,
-                    virtual_sink_name,
-                    display_port,
+                    slot_number,
+                    detected_at,
                 )
-                print_with_process_id("fetching channel")
-                driver.get(channel)
-
-                # check if stream is available
+            except Exception as e:
+                print_with_process_id(f"capture slot {slot_number} failed, recreating browser " + str(e))
                 try:
-                    print_with_process_id("finding stream")
-                    stream = wait_for_stream(driver)
-                except Exception as e:
-                    print_with_process_id("stream not available")
-                    return
-
-                stream_name = stream.find_element(
-                    By.CLASS_NAME, "flex.items-center.gap-1"
-                ).text
-                # stream_name = "Test stream"
+                    driver.quit()
+                except:
+                    pass
+                driver = None
 
-                stream.click()
-                time.sleep(10)
+    def __set_capture_slot_status(
+        self, slot_number: int, status: TRWCaptureSlotStatus, stream_id: str | None = None
+    ) -> None:
+        self.redis_client.set_trw_capture_slot(TRWCaptureSlot(
+            number=slot_number,
+            status=status,
+            stream_id=stream_id,
+            updated_at=datetime.now(timezone.utc),
+        ))
 
-                # get stream video div
-                try:
-                    video = WebDriverWait(driver, 10).until(
-                        EC.presence_of_element_located(
-                            (
-                                By.TAG_NAME,
-                                "video",
-                            )
-                        )
-                    )
-                except Exception:
-                    print_with_process_id("stream video not found")
-                    return
+    def __start_stream(
+        self,
+        stream_id: str,
+        destination_rtmp_server: str,
+        channel: str,
+        campus,
+        chromedriver_path: str,
+        stream_number: int,
+        detected_at: float,
+    ) -> None:
+        driver = self.__relay_with_restarts(
+            None,
+            stream_id,
+            destination_rtmp_server,
+            channel,
+            campus,
+            chromedriver_path,
+            stream_number,
+            detected_at,
+        )
+        try:
+            driver.quit()
+        except:
+            pass
 
-                # double click on video to make full screen
-                time.sleep(10)
-                actionChains = ActionChains(driver)
-                actionChains.double_click(video).perform()
+    def __relay_with_restarts(
+        self,
+        driver: webdriver.Chrome | None,
+        stream_id: str,
+        destination_rtmp_server: str,
+        channel: str,
+        campus,
+        chromedriver_path: str,
+        stream_number: int,
+        detected_at: float,
+    ) -> webdriver.Chrome | None:
+        """Relay the stream until it ends, restarting the browser on errors.
 
-                driver.execute_script("document.body.style.cursor = 'none';")
+        Returns the browser so a capture slot can reuse it, None if it had to be closed.
+        """
+        display_port = f":{DISPLAY_PORT_START + stream_number}"
+        virtual_sink_name = f"virtual_sink_{stream_number}"
+        startup_kind = "warm" if driver is not None else "cold"
 
-                try:
-                    driver.execute_script(
-                        'document.getElementsByTagName("video")[0].play()'
+        while True:
+            print_with_process_id("starting streaming")
+            try:
+                if driver is None:
+                    driver = self.initialize_trw(
+                        chromedriver_path,
+                        stream_number,
+                        virtual_sink_name,
+                        display_port,
                     )
-                except:
-                    pass
-
-                stream_url = destination_rtmp_server + "/" + stream_id
-                stream = TRWStream(
-                    id=stream_id,
-                    name=stream_name,
-                    url=stream_url,
-                    campus=campus,
-                )
-                print_with_process_id("Relaying stream to destination")
-                stream_process = relay_stream_to_destination(
-                    stream_url + "?key=" + self.rtmp_server_key,
+                self.__relay_stream(
+                    driver,
+                    stream_id,
+                    destination_rtmp_server,
+                    channel,
+                    campus,
                     virtual_sink_name,
                     display_port,
+                    startup_kind,
+                    detected_at,
                 )
-                self.redis_client.add_trw_running_stream(stream)
-                # stream_process.wait()
-
-                for stream_message in self.__get_stream_messages(driver, video):
-                    self.redis_client.enqueue_trw_stream_message(stream_id, stream_message)
-
-                self.redis_client.delete_trw_stream_by_id(stream_id)
-                stream_process.kill()
-                self.logout(driver)
-                return
+                return driver
             except Exception as e:
                 print_with_process_id("Error in process " + str(e))
                 print_with_process_id("Restarting process")
-                if stream_process:
-                    try:
-                        stream_process.kill()
-                    except:
-                        pass
                 try:
-                    self.redis_client.delete_trw_stream_by_id(stream_id)
-                except:
-                    pass
-                try:
-                    self.logout(driver)
+                    driver.quit()
                 except:
                     pass
+                driver = None
+                # only the first start counts towards warm/cold startup times
+                detected_at = None
 
-    def __get_stream_messages(
+    def __relay_stream(
         self,
         driver: webdriver.Chrome,
-        video: WebElement,
-    ) -> Generator[TRWStreamChatMessage, None, None]:
+        stream_id: str,
+        destination_rtmp_server: str,
+        channel: str,
+        campus,
+        virtual_sink_name: str,
+        display_port: str,
+        startup_kind: str,
+        detected_at: float | None,
+    ) -> None:
+        print_with_process_id("fetching channel")
+        driver.get(channel)
 
-        existing_messages_elements = get_chat_messages(driver)
-        for message in existing_messages_elements:
-            try:
-                parsed_message = parse_message_element(message)
-                yield parsed_message
-            except Exception as e:
-                print_with_process_id("error parsing message " + str(e))
+        # check if stream is available
+        try:
+            print_with_process_id("finding stream")
+            stream = wait_for_stream(driver)
+        except Exception as e:
+            print_with_process_id("stream not available")
+            return
 
-        while True:
-            current_message_elements = get_chat_messages(driver)
-            if len(current_message_elements) != len(existing_messages_elements):
-                new_messages_count = len(current_message_elements) - len(
-                    existing_messages_elements
+        stream_name = stream.find_element(
+            By.CLASS_NAME, "flex.items-center.gap-1"
+        ).text
+        # stream_name = "Test stream"
+
+        stream.click()
+
+        # get stream video div
+        try:
+            video = WebDriverWait(driver, 30).until(
+                EC.presence_of_element_located(
+                    (
+                        By.TAG_NAME,
+                        "video",
+                    )
                 )
-                new_message_elements = current_message_elements[-new_messages_count:]
-                for message in new_message_elements:
-                    try:
-                        parsed_message = parse_message_element(message)
-                        yield parsed_message
-                    except Exception as e:
-                        print_with_process_id("error parsing message " + str(e))
-                existing_messages_elements += new_message_elements
+            )
+        except Exception:
+            print_with_process_id("stream video not found")
+            return
+
+        # wait until the video has a frame to show before making it full screen
+        try:
+            WebDriverWait(driver, 20).until(
+                lambda d: d.execute_script("return arguments[0].readyState", video) >= 2
+            )
+        except Exception:
+            print_with_process_id("stream video not ready, continuing")
+
+        capture_region = None
+        if self.crop_to_video:
+            capture_region = video_capture_region(driver, video)
+            print_with_process_id(f"capturing video region {capture_region}")
+        if capture_region is None:
+            # double click on video to make full screen
+            actionChains = ActionChains(driver)
+            actionChains.double_click(video).perform()
+
+        driver.execute_script("document.body.style.cursor = 'none';")
+
+        try:
+            driver.execute_script(
+                'document.getElementsByTagName("video")[0].play()'
+            )
+        except:
+            pass
+
+        stream_url = destination_rtmp_server + "/" + stream_id
+        stream = TRWStream(
+            id=stream_id,
+            name=stream_name,
+            url=stream_url,
+            campus=campus,
+            renditions={
+                rendition.name: rendition_url(stream_url, rendition, i == 0)
+                for i, rendition in enumerate(self.relay_renditions)
+            },
+        )
+        hls_playlist = None
+        if self.hls_dir:
+            os.makedirs(os.path.join(self.hls_dir, stream_id), exist_ok=True)
+            hls_playlist = os.path.join(self.hls_dir, stream_id, "index.m3u8")
+        print_with_process_id("Relaying stream to destination")
+        relay = RelaySupervisor(
+            lambda: relay_stream_to_destination(
+                stream_url + "?key=" + self.rtmp_server_key,
+                virtual_sink_name,
+                display_port,
+                self.relay_renditions,
+                hls_playlist,
+                capture_region,
+                self.decimate,
+            ),
+            lambda stats: self.redis_client.set_trw_relay_stats(stream_id, stats),
+        )
+        relay.start()
+        try:
+            self.redis_client.add_trw_running_stream(stream)
+            if detected_at is not None:
+                startup_seconds = time.time() - detected_at
+                print_with_process_id(f"{startup_kind} start took {startup_seconds:.1f}s")
+                self.redis_client.record_trw_capture_startup(startup_kind, startup_seconds)
+
+            chat_buffer = TRWChatBuffer(self.redis_client, stream_id)
             try:
-                if not video.is_displayed():
-                    print_with_process_id("stream ended")
-                    return
-            except Exception:
-                print_with_process_id("stream ended")
-                return
+                for stream_messages in self.__get_stream_messages(driver, video):
+                    chat_buffer.add(stream_messages)
+            finally:
+                chat_buffer.flush()
+        finally:
+            relay.stop()
             try:
-                driver.execute_script(
-                    'document.getElementsByTagName("video")[0].play()'
-                )
+                self.redis_client.delete_trw_stream_by_id(stream_id)
             except:
                 pass
-            time.sleep(0.5)
 
-    def __check_upcoming_stream_messages(
+    def __get_stream_messages(
+        self,
+        driver: webdriver.Chrome,
+        video: WebElement,
+    ) -> Generator[List[TRWStreamChatMessage], None, None]:
+        """New chat messages every CHAT_POLL_INTERVAL, the list is empty when there are none."""
+
+        # ids already yielded, so reinstalling the capture doesn't repeat messages
+        recent_message_ids: OrderedDict[str, None] = OrderedDict()
+        ticks = 0
+        while True:
+            payloads = drain_chat_capture(driver)
+            if payloads is None:
+                install_chat_capture(driver)
+                payloads = drain_chat_capture(driver) or []
+            stream_messages = []
+            for payload in payloads:
+                if payload["id"] in recent_message_ids:
+                    continue
+                recent_message_ids[payload["id"]] = None
+                if len(recent_message_ids) > CHAT_CAPTURE_MAX_SEEN:
+                    recent_message_ids.popitem(last=False)
+                try:
+                    stream_messages.append(parse_message_payload(payload))
+                except Exception as e:
+                    print_with_process_id("error parsing message " + str(e))
+            yield stream_messages
+
+            # checking the video costs extra round-trips, do it about once a second
+            ticks += 1
+            if ticks % VIDEO_CHECK_EVERY_TICKS == 0:
+                try:
+                    if not video.is_displayed():
+                        print_with_process_id("stream ended")
+                        return
+                except Exception:
+                    print_with_process_id("stream ended")
+                    return
+                try:
+                    driver.execute_script(
+                        'document.getElementsByTagName("video")[0].play()'
+                    )
+                except:
+                    pass
+            time.sleep(CHAT_POLL_INTERVAL)
+
+    def __get_new_chat_messages(
         self, driver: webdriver.Chrome, channel: str, campus: TRWCampus
-    ) -> None:
-        chat_messages = get_chat_messages(driver)
+    ) -> List[Tuple[TRWStreamChatMessage, TRWCampus]]:
+        chat_messages = get_chat_message_payloads(driver)
         chat_messages.reverse()
 
         if not chat_messages:
-            return
+            return []
 
         channel_last_message = self.channel_last_messages.get(channel)
 
+        new_messages = []
         for i, chat_message in enumerate(chat_messages[:5]):
             try:
-                message = parse_message_element(chat_message)
+                message = parse_message_payload(chat_message)
                 if i == 0:
                     self.channel_last_messages[channel] = message
 
                 if channel_last_message and message.id == channel_last_message.id:
                     break
 
-                upcoming_streams = self.message_parser.parse(message, campus)
-                for upcoming_stream in upcoming_streams:
-                    print_with_process_id("found upcoming stream " + str(upcoming_stream))
-                    self.redis_client.add_trw_upcoming_stream(upcoming_stream)
+                new_messages.append((message, campus))
             except Exception as e:
                 print_with_process_id("error parsing message " + str(e))
+        return new_messages
 
+    def __check_upcoming_stream_messages(
+        self, new_messages: List[Tuple[TRWStreamChatMessage, TRWCampus]]
+    ) -> None:
+        if not new_messages:
+            return
+        try:
+            results = self.message_parser.parse_chat_messages(new_messages)
+        except Exception as e:
+            print_with_process_id("error parsing messages " + str(e))
+            return
+        for upcoming_streams in results.values():
+            for upcoming_stream in upcoming_streams:
+                print_with_process_id("found upcoming stream " + str(upcoming_stream))
+                self.redis_client.add_trw_upcoming_stream(upcoming_stream)
 
     def initialize_trw(
         self,
@@ -329,6 +606,53 @@ class TRW(IStreamSource):
         number: str,
         virtual_sink_name: str,
         display_port: str,
+    ) -> webdriver.Chrome:
+        started = time.perf_counter()
+        driver = self.__start_browser(chromedriver_path, number, virtual_sink_name, display_port)
+
+        session = self.session_store.load()
+        restored = self.__restore_session(driver, session) if session else False
+        if restored:
+            print_with_process_id(f"session restored in {time.perf_counter() - started:.1f}s")
+            return driver
+
+        with self.session_store.login_lock():
+            # another process may have logged in while we were waiting for the lock
+            latest = self.session_store.load()
+            if latest and (session is None or latest.rauth != session.rauth):
+                restored = self.__restore_session(driver, latest)
+                if restored:
+                    print_with_process_id(f"session restored in {time.perf_counter() - started:.1f}s")
+                    return driver
+            # only a session TRW answered with the login form is thrown away, not one that didn't load
+            if latest and restored is False:
+                print_with_process_id("stored session rejected, logging in")
+                self.session_store.discard(latest)
+            elif latest:
+                print_with_process_id("stored session could not be verified, logging in")
+
+            while not self.__login(driver):
+                try:
+                    driver.quit()
+                except:
+                    pass
+                driver = self.__start_browser(chromedriver_path, number, virtual_sink_name, display_port)
+
+            rauth = driver.execute_script('return window.localStorage.getItem("rauth");')
+            if rauth:
+                self.session_store.save(rauth, driver.get_cookies())
+            else:
+                print_with_process_id("session token not found after login")
+
+        print_with_process_id(f"logged in in {time.perf_counter() - started:.1f}s")
+        return driver
+
+    def __start_browser(
+        self,
+        chromedriver_path: str,
+        number: str,
+        virtual_sink_name: str,
+        display_port: str,
     ) -> webdriver.Chrome:
         chrome_opt = Options()
         if not self.debug:
@@ -360,88 +684,89 @@ class TRW(IStreamSource):
         chrome_opt.add_argument("--no-crash-upload")
         chrome_opt.add_argument("--disable-low-res-tiling")
         chrome_opt.add_argument("--disable-gpu")
+        # the discovery loop opens its channel tabs with window.open
+        chrome_opt.add_argument("--disable-popup-blocking")
 
         chrome_opt.add_experimental_option("useAutomationExtension", False)
         chrome_opt.add_experimental_option("excludeSwitches", ["enable-automation"])
         driver = webdriver.Chrome(options=chrome_opt, service=Service(chromedriver_path))
         driver.maximize_window()
-        driver.get("https://app.jointherealworld.com/auth/login?a=p86p7wfnzd&subid=login")
+        return driver
+
+    def __restore_session(self, driver: webdriver.Chrome, session: TRWSession) -> bool | None:
+        """Inject a stored session into the browser.
+
+        False if TRW no longer accepts it, None if the page never showed either way.
+        """
+        # localStorage and cookies can only be set on a page of the app's origin
+        driver.get(TRW_APP_URL)
+        for cookie in session.cookies:
+            try:
+                driver.add_cookie(cookie)
+            except Exception as e:
+                if self.debug:
+                    print_with_process_id(e)
+        driver.execute_script('window.localStorage.setItem("rauth", arguments[0]);', session.rauth)
+
+        # a channel page shows the chat when logged in and the login form otherwise
+        for attempt in range(1, SESSION_VERIFY_ATTEMPTS + 1):
+            driver.get(CHANNELS_TO_MONITOR[0][1])
+            try:
+                WebDriverWait(driver, 20).until(
+                    lambda d: d.find_elements(By.ID, "chat-scroller") or d.find_elements(By.ID, "email")
+                )
+            except Exception:
+                print_with_process_id(f"could not verify stored session, attempt {attempt}")
+                continue
+            if driver.find_elements(By.ID, "email"):
+                return False
+            close_modal(driver, 2)
+            return True
+        return None
+
+    def __login(self, driver: webdriver.Chrome) -> bool:
+        """Log in with the username and password, False if the 2FA code never arrived."""
+        driver.get(TRW_LOGIN_URL)
 
         # login
-        driver.find_element(By.ID, "email").send_keys(self.username)
+        WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located((By.ID, "email"))
+        ).send_keys(self.username)
         driver.find_element(By.ID, "password").send_keys(self.password)
+        # codes mailed for earlier attempts are not valid anymore
+        attempt_started = datetime.now(timezone.utc)
         driver.find_element(By.CLASS_NAME, "btn-primary.btn-no-effects").click()
         print_with_process_id("logged in")
-        time.sleep(5)
-        
+
         # wait for 2fa popup
         try:
-            popup = WebDriverWait(driver, 10).until(
+            popup = WebDriverWait(driver, 15).until(
                 EC.presence_of_element_located((By.CLASS_NAME, "modal-body.relative.flex.flex-col.bg-neutral.shadow-xl"))
             )
             if "verification" in popup.text.lower() or "verify" in popup.text.lower():
                 print_with_process_id("2fa popup found")
-                otp_counter = 0
-                while True:
-                    time.sleep(15)
-                    otp = self.otp_fetcher.fetch_otp()
-                    if otp:
-                        print_with_process_id("got otp " + otp)
-                        break
-                    otp_counter += 1
-                    if otp_counter == 10:
-                        print_with_process_id("Waiting for two minutes but no otp found. Exiting and restarting flow...")
-                        try:
-                            self.logout()
-                        except:
-                            pass
-                        return self.initialize_trw(chromedriver_path, number, virtual_sink_name, display_port)
-                
+                try:
+                    otp = self.otp_fetcher.wait_for_otp(attempt_started, OTP_TIMEOUT)
+                except Exception as e:
+                    print_with_process_id("could not read the otp mail " + str(e))
+                    otp = None
+                if otp:
+                    print_with_process_id("got otp " + otp)
+                else:
+                    print_with_process_id(f"Waited {OTP_TIMEOUT}s but no otp found. Exiting and restarting flow...")
+                    return False
+
                 popup.find_element(By.TAG_NAME, "input").send_keys(otp)
                 popup.find_element(By.CLASS_NAME, "btn.btn-primary").click()
-                time.sleep(5)
+                WebDriverWait(driver, 30).until(EC.staleness_of(popup))
                 print_with_process_id("2fa entered")
         except Exception as e:
             if self.debug:
                 print_with_process_id(e)
             print_with_process_id("2fa popup not found")
 
-        # close modal
-        try:
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "modal-body"))
-            ).find_elements(By.CLASS_NAME, "btn.btn-circle")[1].click()
-            print_with_process_id("popup closed")
-        except Exception as e:
-            print_with_process_id(e)
-            print_with_process_id("popup not found")
-
-        return driver
-    
-    def logout(self, driver: webdriver.Chrome):
-        token = json.loads(driver.execute_script("return window.localStorage.getItem(\"rauth\");")).get("token")
-        if not token:
-            print_with_process_id("Token not found")
-            return
-        url = "https://api.therealworld.ag/auth/session/logout"
-
-        headers = {
-            'sec-ch-ua-platform': '"Linux"',
-            'Referer': 'https://app.jointherealworld.com/',
-            'sec-ch-ua': '"Google Chrome";v="131", "Chromium";v="131", "Not_A Brand";v="24"',
-            'sec-ch-ua-mobile': '?0',
-            'X-Session-Token': token,
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'X-Client-Version': '2.5.338'
-        }
-
-        response = requests.request("POST", url, headers=headers)
-        if response.status_code != 204:
-            print_with_process_id("Logout failed with status code: " + str(response.status_code))
-            return
-        print_with_process_id("Logout Sucessful.")
-        driver.quit()
+        close_modal(driver, 30)
+        return True
 
 
 def parse_message_element(message_element: WebElement) -> TRWStreamChatMessage:
@@ -476,14 +801,225 @@ def parse_message_element(message_element: WebElement) -> TRWStreamChatMessage:
     return message
 
 
+# Turns a .chat-message element into [id, message, author, time, reply to message, reply to author]
+CHAT_MESSAGE_FIELDS_FUNCTION = """(element) => {
+    const text = (selector) => {
+        const node = element.querySelector(selector);
+        return node ? node.innerText : null;
+    };
+    return [
+        element.id,
+        text(".custom-break-words.break-words.text-sm"),
+        text(".inline-flex.items-center.cursor-pointer.font-medium.text-xs"),
+        text(".ml-3.cursor-default.text-3xs.opacity-50"),
+        text(".text-left.font-medium.text-primary.text-xs"),
+        text(".relative.flex.items-center.text-left"),
+    ];
+}"""
+
+# Reads every chat message after the message with id arguments[0] (all messages
+# when it is missing or no longer in the DOM) in a single WebDriver round-trip.
+CHAT_MESSAGES_SCRIPT = """
+const scroller = document.getElementById("chat-scroller");
+if (!scroller) {
+    return "[]";
+}
+const fields = %s;
+let elements = Array.from(scroller.getElementsByClassName("chat-message"));
+const afterIndex = arguments[0] ? elements.findIndex((element) => element.id === arguments[0]) : -1;
+return JSON.stringify(elements.slice(afterIndex + 1).map(fields));
+""" % CHAT_MESSAGE_FIELDS_FUNCTION
+
+# Size of the in page buffer of captured messages and of the set of ids already captured.
+CHAT_CAPTURE_MAX_BUFFERED = 1000
+CHAT_CAPTURE_MAX_SEEN = 5000
+
+# Installs a MutationObserver on #chat-scroller which buffers every chat message
+# node added to it, once per id, so messages are not lost when the virtualized
+# scroller drops old nodes between polls. The buffer and the set of seen ids are
+# bounded by arguments[0] and arguments[1]. Returns false if there is no chat.
+CHAT_CAPTURE_INSTALL_SCRIPT = """
+const scroller = document.getElementById("chat-scroller");
+if (!scroller) {
+    return false;
+}
+if (window.__chatCapture && window.__chatCapture.scroller === scroller) {
+    return true;
+}
+const capture = {
+    scroller: scroller,
+    buffer: [],
+    seen: new Set(),
+    seenOrder: [],
+    fields: %s,
+};
+const maxBuffered = arguments[0];
+const maxSeen = arguments[1];
+const add = (element) => {
+    if (!element.id || capture.seen.has(element.id)) {
+        return;
+    }
+    capture.seen.add(element.id);
+    capture.seenOrder.push(element.id);
+    if (capture.seenOrder.length > maxSeen) {
+        capture.seen.delete(capture.seenOrder.shift());
+    }
+    capture.buffer.push(element);
+    if (capture.buffer.length > maxBuffered) {
+        capture.buffer.shift();
+    }
+};
+const scan = (node) => {
+    if (node.nodeType !== Node.ELEMENT_NODE) {
+        return;
+    }
+    if (node.classList.contains("chat-message")) {
+        add(node);
+    } else {
+        node.querySelectorAll(".chat-message").forEach(add);
+    }
+};
+scroller.querySelectorAll(".chat-message").forEach(add);
+capture.observer = new MutationObserver((mutations) => {
+    mutations.forEach((mutation) => mutation.addedNodes.forEach(scan));
+});
+capture.observer.observe(scroller, {childList: true, subtree: true});
+window.__chatCapture = capture;
+return true;
+""" % CHAT_MESSAGE_FIELDS_FUNCTION
+
+# Returns the messages captured since the last drain, or null when the capture is
+# gone (page navigated or the chat re-rendered) and has to be installed again.
+# Fields are read at drain time so messages rendered after insertion are complete.
+CHAT_CAPTURE_DRAIN_SCRIPT = """
+const capture = window.__chatCapture;
+if (!capture || !capture.scroller.isConnected) {
+    return null;
+}
+return JSON.stringify(capture.buffer.splice(0).map(capture.fields));
+"""
+
+
+def chat_message_payloads(fields_json: str) -> List[dict]:
+    return [
+        {
+            "id": message_id,
+            "message": message,
+            "author": author,
+            "time": message_time,
+            "reply_to_message": reply_to_message,
+            "reply_to_author": reply_to_author,
+        }
+        for message_id, message, author, message_time, reply_to_message, reply_to_author
+        in json.loads(fields_json)
+    ]
+
+
+def get_chat_message_payloads(driver: webdriver.Chrome, after_id: str | None = None) -> List[dict]:
+    """Raw fields of the chat messages after after_id, extracted in one execute_script call."""
+    return chat_message_payloads(driver.execute_script(CHAT_MESSAGES_SCRIPT, after_id))
+
+
+def install_chat_capture(driver: webdriver.Chrome) -> bool:
+    return driver.execute_script(
+        CHAT_CAPTURE_INSTALL_SCRIPT, CHAT_CAPTURE_MAX_BUFFERED, CHAT_CAPTURE_MAX_SEEN
+    )
+
+
+def drain_chat_capture(driver: webdriver.Chrome) -> List[dict] | None:
+    """Messages captured since the last drain, None if the capture has to be reinstalled."""
+    drained = driver.execute_script(CHAT_CAPTURE_DRAIN_SCRIPT)
+    if drained is None:
+        return None
+    return chat_message_payloads(drained)
+
+
+def parse_message_payload(payload: dict) -> TRWStreamChatMessage:
+    reply_to = None
+    if payload["reply_to_message"] is not None and payload["reply_to_author"] is not None:
+        reply_to = BaseChatMessage(
+            message=payload["reply_to_message"],
+            author=payload["reply_to_author"],
+        )
+    return TRWStreamChatMessage(
+        id=payload["id"],
+        message=payload["message"],
+        author=payload["author"].strip() if payload["author"] is not None else None,
+        time=payload["time"],
+        reply_to=reply_to,
+    )
+
+
+def close_modal(driver: webdriver.Chrome, timeout: float) -> None:
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CLASS_NAME, "modal-body"))
+        ).find_elements(By.CLASS_NAME, "btn.btn-circle")[1].click()
+        print_with_process_id("popup closed")
+    except Exception as e:
+        print_with_process_id(e)
+        print_with_process_id("popup not found")
+
+
+VIDEO_RECT_SCRIPT = """
+const rect = arguments[0].getBoundingClientRect();
+return {
+    left: rect.left,
+    top: rect.top,
+    width: rect.width,
+    height: rect.height,
+    // the page starts below the browser's own toolbars
+    offsetX: window.screenX + (window.outerWidth - window.innerWidth) / 2,
+    offsetY: window.screenY + window.outerHeight - window.innerHeight,
+    scale: window.devicePixelRatio,
+};
+"""
+MIN_CAPTURE_SIZE = 64
+
+
+def video_capture_region(driver: webdriver.Chrome, video: WebElement) -> Tuple[int, int, int, int] | None:
+    """Screen region (x, y, width, height) of the video element for x11grab, None if it isn't usable."""
+    rect = driver.execute_script(VIDEO_RECT_SCRIPT, video)
+    x = max(0, int((rect["offsetX"] + rect["left"]) * rect["scale"]))
+    y = max(0, int((rect["offsetY"] + rect["top"]) * rect["scale"]))
+    # clamp to the display and keep the size even, libx264 needs that for yuv420p
+    width = min(int(rect["width"] * rect["scale"]), CAPTURE_WIDTH - x) // 2 * 2
+    height = min(int(rect["height"] * rect["scale"]), CAPTURE_HEIGHT - y) // 2 * 2
+    if width < MIN_CAPTURE_SIZE or height < MIN_CAPTURE_SIZE:
+        return None
+    return x, y, width, height
+
+
+STREAM_CARD_CLASS = "group.relative.cursor-pointer.border.border-neutral.border-b.bg-base-200.p-3.mb-3"
+
+
+class ChannelTab:
+    def __init__(self, handle: str) -> None:
+        self.handle = handle
+        self.loaded_at = time.monotonic()
+
+
+def open_channel_tabs(driver: webdriver.Chrome) -> Dict[str, ChannelTab]:
+    """Open every monitored channel in its own tab, the pages load in parallel."""
+    channel_tabs = {}
+    for _, channel in CHANNELS_TO_MONITOR:
+        handles = set(driver.window_handles)
+        # window.open returns right away, unlike driver.get which waits for the page
+        driver.execute_script("window.open(arguments[0], '_blank');", channel)
+        new_handle = (set(driver.window_handles) - handles).pop()
+        channel_tabs[channel] = ChannelTab(new_handle)
+    return channel_tabs
+
+
+def find_stream(driver: webdriver.Chrome) -> WebElement | None:
+    """The live stream card of the current channel, without waiting for one to appear."""
+    streams = driver.find_elements(By.CLASS_NAME, STREAM_CARD_CLASS)
+    return streams[0] if streams else None
+
+
 def wait_for_stream(driver: webdriver.Chrome) -> WebElement:
     return WebDriverWait(driver, 20).until(
-        EC.presence_of_element_located(
-            (
-                By.CLASS_NAME,
-                "group.relative.cursor-pointer.border.border-neutral.border-b.bg-base-200.p-3.mb-3"
-            )
-        )
+        EC.presence_of_element_located((By.CLASS_NAME, STREAM_CARD_CLASS))
     )
 
 
@@ -0,0 +1,64 @@
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from internal.schemas import TRWSession
+
+
+class TRWSessionStore:
+    """An authenticated TRW session shared by every browser of the monitor.
+
+    The session is kept in a file only the current user can read, so new
+    browsers can restore it instead of logging in and going through 2FA.
+    login_lock makes sure only one process logs in at a time, the others
+    wait and then pick up the session it saved.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock_path = path + ".lock"
+
+    def load(self) -> TRWSession | None:
+        try:
+            with open(self.path) as f:
+                return TRWSession.model_validate_json(f.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            print(f"[TRWSessionStore] Ignoring unreadable session file {self.path}")
+            return None
+
+    def save(self, rauth: str, cookies: List[Dict]) -> TRWSession:
+        session = TRWSession(rauth=rauth, cookies=cookies, saved_at=time.time())
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # write next to the file and rename, so readers never see half a session
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(session.model_dump_json())
+        os.replace(tmp_path, self.path)
+        return session
+
+    def discard(self, rejected: TRWSession) -> None:
+        """Delete the stored session if it is still the one that was rejected."""
+        stored = self.load()
+        if stored is not None and stored.rauth == rejected.rauth:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def login_lock(self) -> Iterator[None]:
+        directory = os.path.dirname(os.path.abspath(self.lock_path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
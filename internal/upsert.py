@@ -0,0 +1,38 @@
+from typing import Dict, List, Sequence
+
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def upsert(
+    session: Session,
+    table: Table,
+    rows: List[Dict],
+    index_elements: Sequence[str],
+    returning: Sequence[str] = (),
+    update: bool = True,
+) -> List:
+    """INSERT ... ON CONFLICT for many rows in one statement, on postgres and sqlite.
+
+    Conflicting rows get every non key column overwritten, or are left alone
+    when update is False. The columns listed in returning are returned for
+    inserted and updated rows. The caller owns the transaction.
+    """
+    if not rows:
+        return []
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table).values(rows)
+    if update:
+        update_columns = [column for column in rows[0] if column not in index_elements]
+        statement = statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: statement.excluded[column] for column in update_columns},
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+    if returning:
+        statement = statement.returning(*(table.c[column] for column in returning))
+        return session.execute(statement).all()
+    session.execute(statement)
+    return []
@@ -1,36 +1,147 @@
+import os
 import subprocess
 import time
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Tuple
 
 
-def start_xvfb(display_port):
-    # Start the Xvfb server
+def start_xvfb(display_port, timeout=5):
+    # Start the Xvfb server, unless one is already serving this display
+    socket_path = f"/tmp/.X11-unix/X{display_port.lstrip(':')}"
+    if os.path.exists(socket_path):
+        return
     subprocess.Popen(["Xvfb", display_port, "-screen", "0", "1280x720x24"])
-    time.sleep(2)
+    # wait for the display socket instead of a fixed delay
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.05)
 
 
-def relay_stream_to_destination(
-    destination_server: str, audio_sink: str, display_port: str
-) -> subprocess.Popen:
-    ffmpeg_command = [
+class Rendition(NamedTuple):
+    name: str
+    height: int | None  # None for audio only
+    video_bitrate: str | None
+
+
+RENDITIONS = {
+    "720p": Rendition("720p", 720, "2M"),
+    "480p": Rendition("480p", 480, "900k"),
+    "360p": Rendition("360p", 360, "500k"),
+    "audio": Rendition("audio", None, None),
+}
+CAPTURE_WIDTH = 1280
+CAPTURE_HEIGHT = 720
+FRAME_RATE = 24
+# with decimation a static screen still sends a frame every this many frames
+DECIMATE_MAX_DROPPED = FRAME_RATE - 1
+
+
+def rendition_url(destination_server: str, rendition: Rendition, primary: bool) -> str:
+    """The primary rendition keeps the destination url, others get a _<name> suffix on the path."""
+    if primary:
+        return destination_server
+    path, sep, query = destination_server.partition("?")
+    return f"{path}_{rendition.name}{sep}{query}"
+
+
+def build_relay_command(
+    destination_server: str,
+    audio_sink: str,
+    display_port: str,
+    renditions: List[Rendition] | None = None,
+    hls_playlist: str | None = None,
+    capture_region: Tuple[int, int, int, int] | None = None,
+    decimate: bool = False,
+) -> List[str]:
+    """ffmpeg command that captures the display once and pushes every rendition.
+
+    The capture is split and scaled in one filter graph, every stream is
+    encoded once and the tee muxer sends them to all outputs. The first video
+    rendition goes to destination_server and optionally to an HLS playlist,
+    the others to destination_server with a _<name> suffix. Only the primary
+    output is allowed to fail the relay.
+
+    capture_region (x, y, width, height) grabs only that part of the display.
+    decimate drops frames that are duplicates of the previous one and sends
+    the rest with a variable frame rate.
+    """
+    renditions = renditions or [RENDITIONS["720p"]]
+    video_renditions = [rendition for rendition in renditions if rendition.height]
+
+    capture_input = ["-i", display_port]  # Display input (e.g., :0.0)
+    if capture_region:
+        x, y, width, height = capture_region
+        capture_input = ["-video_size", f"{width}x{height}", "-i", f"{display_port}+{x},{y}"]
+
+    source = f"[0:v]fps={FRAME_RATE}"
+    if decimate:
+        source += f",mpdecimate=max={DECIMATE_MAX_DROPPED}"
+    filters = [source + f",split={len(video_renditions)}" + "".join(
+        f"[s{i}]" for i in range(len(video_renditions))
+    )]
+    for i, rendition in enumerate(video_renditions):
+        if capture_region:
+            # a cropped capture can be smaller than the rendition, never scale it up
+            filters.append(f"[s{i}]scale=-2:min({rendition.height}\\,ih)[v{i}]")
+        elif rendition.height == CAPTURE_HEIGHT:
+            filters.append(f"[s{i}]null[v{i}]")
+        else:
+            filters.append(f"[s{i}]scale=-2:{rendition.height}[v{i}]")
+
+    encoding = []
+    for i, rendition in enumerate(video_renditions):
+        encoding += ["-map", f"[v{i}]", f"-b:v:{i}", rendition.video_bitrate]
+    # audio is encoded once and shared by every output
+    encoding += ["-map", "1:a"]
+    if decimate:
+        # keep dropped frames dropped, and keyframes every 2 seconds of time rather than frames
+        encoding += ["-fps_mode", "vfr", "-force_key_frames", "expr:gte(t,n_forced*2)"]
+
+    outputs = []
+    primary = True
+    for rendition in renditions:
+        if rendition.height:
+            select = f"v:{video_renditions.index(rendition)},a:0"
+        else:
+            select = "a:0"
+        options = f"select='{select}':f=flv" + ("" if primary else ":onfail=ignore")
+        outputs.append(f"[{options}]{rendition_url(destination_server, rendition, primary)}")
+        if primary and hls_playlist and video_renditions:
+            outputs.append(
+                f"[select='v:0,a:0':f=hls:hls_time=2:hls_list_size=6:hls_flags=delete_segments:onfail=ignore]{hls_playlist}"
+            )
+        primary = False
+
+    return [
         "ffmpeg",
+        "-progress",
+        "pipe:1",  # key=value progress blocks on stdout, read by RelaySupervisor
+        "-nostats",
         "-thread_queue_size",
         "512",
         "-f",
         "x11grab",  # Capture video from the display
-        "-i",
-        display_port,  # Display input (e.g., :0.0)
+        *capture_input,
         "-thread_queue_size",
         "512",
         "-f",
         "pulse",  # Capture system audio using Pulseaudio
         "-i",
         f"{audio_sink}.monitor",  # Audio source (e.g., "default")
+        "-filter_complex",
+        ";".join(filters),
+        *encoding,
         "-c:v",
         "libx264",  # Video codec
         "-preset",
         "ultrafast",  # Encoding speed (ultrafast for real-time)
-        "-b:v",
-        "2M",  # Video bitrate
+        # keyframes every 2 seconds, aligned across renditions for HLS segments
+        "-g",
+        str(FRAME_RATE * 2),
+        "-keyint_min",
+        str(FRAME_RATE * 2),
+        "-sc_threshold",
+        "0",
         "-c:a",
         "aac",  # Audio codec (AAC)
         "-b:a",
@@ -39,17 +150,30 @@ def relay_stream_to_destination(
         "32M",  # Increase probing size to 32MB
         "-analyzeduration",
         "100M",
-        "-r",
-        "24",
-        "-s",
-        "1280x720",
+        "-flags",
+        "+global_header",  # required by the tee muxer
         "-f",
-        "flv",  # Output format for RTMP streaming
-        destination_server,  # YouTube RTMP stream URL
+        "tee",  # One encode, many outputs
+        "|".join(outputs),
     ]
 
+
+def relay_stream_to_destination(
+    destination_server: str,
+    audio_sink: str,
+    display_port: str,
+    renditions: List[Rendition] | None = None,
+    hls_playlist: str | None = None,
+    capture_region: Tuple[int, int, int, int] | None = None,
+    decimate: bool = False,
+) -> subprocess.Popen:
+    ffmpeg_command = build_relay_command(
+        destination_server, audio_sink, display_port, renditions, hls_playlist,
+        capture_region, decimate,
+    )
+
     # Run the FFmpeg command to stream the video
-    return subprocess.Popen(ffmpeg_command)
+    return subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, text=True)
 
 
 # Function to run pactl command and return the output
@@ -72,3 +196,18 @@ def create_virtual_sink(sink_name="virtual_sink1"):
         run_pactl_command(
             ["pactl", "load-module", "module-null-sink", f"sink_name={sink_name}"]
         )
+
+
+def round_to_nearest_15_minutes(dt: datetime) -> datetime:
+    minute = round(dt.minute / 15) * 15
+    if minute == 60:
+        dt += timedelta(hours=1)
+        minute = 0
+    return datetime(
+        dt.year,
+        dt.month,
+        dt.day,
+        dt.hour,
+        minute,
+        tzinfo=timezone.utc,
+    )
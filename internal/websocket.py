@@ -1,28 +1,147 @@
-from typing import List
+import asyncio
+from typing import Dict, Tuple
 
 from fastapi import WebSocket
 from fastapi.websockets import WebSocketState
 
-from internal.schemas import TRWStreamChatMessage
+from internal.async_redis import AsyncRedisClient
+from internal.redis import TRW_STREAM_CHAT_MAXLEN
+from internal.schemas import TRWStreamChatEntry, TRWStreamChatMessage
 
+# messages a new viewer without a last seen id gets from before it connected
+CHAT_REPLAY_COUNT = 50
+# milliseconds a subscriber waits for new chat before asking again
+CHAT_READ_BLOCK_MS = 5000
+# seconds before a failed read is retried, doubling up to the max
+CHAT_READ_RETRY_DELAY = 0.5
+CHAT_READ_MAX_RETRY_DELAY = 10
 
-# A manager to keep track of connected WebSocket clients
+
+def entry_id_order(entry_id: str) -> Tuple[int, int]:
+    milliseconds, _, sequence = entry_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class Viewer:
+    def __init__(self, websocket: WebSocket, last_id: str) -> None:
+        self.websocket = websocket
+        # newest chat entry the viewer has, nothing at or before it is sent again
+        self.last_id = last_id
+        # keeps replayed and live messages in order
+        self.lock = asyncio.Lock()
+
+
+# A manager to keep track of connected WebSocket clients, grouped by stream.
+# Each stream with at least one viewer gets exactly one subscriber task which
+# reads the stream's chat from Redis and pushes every message once to all
+# viewers of that stream. A new viewer first gets the recent messages, or the
+# ones after the last id it saw before reconnecting.
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, redis_client: AsyncRedisClient):
+        self.redis_client = redis_client
+        self.stream_connections: Dict[str, Dict[WebSocket, Viewer]] = {}
+        self.stream_subscribers: Dict[str, asyncio.Task] = {}
+        self.stream_subscribers_ready: Dict[str, asyncio.Event] = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(
+        self,
+        stream_id: str,
+        websocket: WebSocket,
+        last_id: str | None = None,
+        replay: int = CHAT_REPLAY_COUNT,
+    ):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        viewer = Viewer(websocket, last_id or "0-0")
+        async with viewer.lock:
+            self.stream_connections.setdefault(stream_id, {})[websocket] = viewer
+            if stream_id not in self.stream_subscribers:
+                self.stream_subscribers_ready[stream_id] = asyncio.Event()
+                self.stream_subscribers[stream_id] = asyncio.create_task(
+                    self.__subscribe(stream_id, self.stream_subscribers_ready[stream_id])
+                )
+            # the subscriber knows where it starts before the replay is read, so nothing falls in between
+            ready = self.stream_subscribers_ready[stream_id]
+            await ready.wait()
+            try:
+                if last_id:
+                    entries = await self.redis_client.get_trw_stream_messages(
+                        stream_id, TRW_STREAM_CHAT_MAXLEN, last_id
+                    )
+                else:
+                    entries = await self.redis_client.get_trw_stream_messages(stream_id, replay) if replay else []
+            except Exception as e:
+                print(f"Error reading chat history of stream {stream_id}: {e}")
+                entries = []
+            for entry_id, message in entries:
+                await self.__send(viewer, entry_id, message)
+
+    def disconnect(self, stream_id: str, websocket: WebSocket):
+        connections = self.stream_connections.get(stream_id)
+        if connections is None:
+            return
+        connections.pop(websocket, None)
+        if connections:
+            return
+        # last viewer left, stop listening for this stream
+        del self.stream_connections[stream_id]
+        subscriber = self.stream_subscribers.pop(stream_id, None)
+        self.stream_subscribers_ready.pop(stream_id, None)
+        if subscriber:
+            subscriber.cancel()
+
+    async def broadcast(self, stream_id: str, entry_id: str, message: TRWStreamChatMessage):
+        viewers = list(self.stream_connections.get(stream_id, {}).values())
+        if not viewers:
+            return
+        await asyncio.gather(
+            *(self.__send_in_order(viewer, entry_id, message) for viewer in viewers)
+        )
+
+    async def __send_in_order(self, viewer: Viewer, entry_id: str, message: TRWStreamChatMessage):
+        async with viewer.lock:
+            await self.__send(viewer, entry_id, message)
 
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+    async def __send(self, viewer: Viewer, entry_id: str, message: TRWStreamChatMessage):
+        if entry_id_order(entry_id) <= entry_id_order(viewer.last_id):
+            return
+        viewer.last_id = entry_id
+        if viewer.websocket.application_state != WebSocketState.CONNECTED:
+            return
+        payload = TRWStreamChatEntry(entry_id=entry_id, **message.model_dump()).model_dump()
+        try:
+            await viewer.websocket.send_json(payload)
+        except Exception as e:
+            print(f"Error sending message to client: {e}")
 
-    async def broadcast(self, message: TRWStreamChatMessage):
-        for connection in self.active_connections:
-            if connection.application_state == WebSocketState.CONNECTED:
+    async def __subscribe(self, stream_id: str, ready: asyncio.Event):
+        after_id = None
+        delay = CHAT_READ_RETRY_DELAY
+        try:
+            # a Redis error only pauses the stream's viewers, they are not dropped
+            while self.stream_connections.get(stream_id):
                 try:
-                    await connection.send_json(message.model_dump())
+                    if after_id is None:
+                        try:
+                            after_id = await self.redis_client.get_trw_stream_last_message_id(stream_id)
+                        finally:
+                            ready.set()
+                    entries = await self.redis_client.read_trw_stream_messages(
+                        stream_id, after_id, CHAT_READ_BLOCK_MS
+                    )
+                except asyncio.CancelledError:
+                    raise
                 except Exception as e:
-                    print(f"Error sending message to client: {e}")
+                    print(f"Error reading chat of stream {stream_id}, retrying in {delay}s: {e}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, CHAT_READ_MAX_RETRY_DELAY)
+                    continue
+                delay = CHAT_READ_RETRY_DELAY
+                for entry_id, message in entries:
+                    after_id = entry_id
+                    await self.broadcast(stream_id, entry_id, message)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self.stream_subscribers.get(stream_id) is asyncio.current_task():
+                del self.stream_subscribers[stream_id]
+                del self.stream_subscribers_ready[stream_id]
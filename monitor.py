@@ -5,6 +5,7 @@ from internal.stream_sources.dudestream import DudeStream
 from internal.stream_sources.hurawatch import Hurawatch
 from internal.stream_sources.libgen import Libgen
 from internal.database import init_db, SessionLocal
+from internal.capture_scheduler import parse_campus_priorities
 
 import multiprocessing
 
@@ -15,10 +16,17 @@ if __name__ == "__main__":
 
     try:
         redis_client = RedisClient(host=Env.REDIS_HOST, port=Env.REDIS_PORT)
+        redis_client.migrate_trw_running_streams()
+        redis_client.migrate_trw_upcoming_streams()
         redis_client.delete_all_streams()
 
         stream_sources = [
-            TRW(Env.TRW_EMAIL, Env.TRW_PASSWORD, Env.RTMP_SERVER_KEY, Env.RTMP_SERVER, redis_client, Env.OPENAI_API_KEY, Env.OTP_EMAIL, Env.OTP_EMAIL_PASSWORD, Env.DEBUG),
+            TRW(
+                Env.TRW_EMAIL, Env.TRW_PASSWORD, Env.RTMP_SERVER_KEY, Env.RTMP_SERVER, redis_client, Env.OPENAI_API_KEY, Env.OTP_EMAIL, Env.OTP_EMAIL_PASSWORD, Env.DEBUG,
+                Env.TRW_SESSION_FILE, Env.TRW_CAPTURE_POOL_SIZE, Env.TRW_RELAY_RENDITIONS.split(","), Env.TRW_HLS_DIR or None, Env.TRW_RELAY_CROP_TO_VIDEO, Env.TRW_RELAY_DECIMATE,
+                Env.TRW_MAX_CONCURRENT_CAPTURES, Env.TRW_MAX_LOAD_PER_CPU, Env.TRW_MIN_FREE_MEMORY_MB, parse_campus_priorities(Env.TRW_CAMPUS_PRIORITIES),
+                Env.OTP_IMAP_HOST, Env.OTP_IMAP_PORT, Env.OTP_IMAP_SSL, Env.OTP_SENDER,
+            ),
             DudeStream(redis_client),
             Hurawatch(SessionLocal),
             Libgen(SessionLocal),
@@ -0,0 +1,94 @@
+import json
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+
+from internal.announcement_extractor import CONFIDENCE_THRESHOLD, extract_announcements
+from internal.message_parser import might_announce_stream
+from internal.schemas import TRWCampus
+
+CORPUS = Path(__file__).parent.parent / "benchmarks" / "fixtures" / "stream_announcements.json"
+
+
+class TestAnnouncementExtractor(unittest.TestCase):
+    def test_corpus(self):
+        # everything the rules are sure about has to be right, the rest goes to the LLM
+        for case in json.loads(CORPUS.read_text()):
+            if not might_announce_stream(case["message"]):
+                self.assertEqual(case["expected"], [], case["message"])
+                continue
+            now = datetime.fromisoformat(case["posted_at"])
+            upcoming_streams, confidence = extract_announcements(case["message"], TRWCampus.STOCKS, now)
+            if confidence < CONFIDENCE_THRESHOLD:
+                continue
+            self.assertEqual(
+                [(stream.name, stream.start_time.isoformat()) for stream in upcoming_streams],
+                [(stream["name"], stream["start_time"]) for stream in case["expected"]],
+                case["message"],
+            )
+
+    def test_relative_time(self):
+        now = datetime(2025, 1, 20, 14, 2, tzinfo=timezone.utc)
+        upcoming_streams, confidence = extract_announcements(
+            "GOLD ANALYSIS LIVE in 15 minutes", TRWCampus.STOCKS, now
+        )
+        self.assertGreaterEqual(confidence, CONFIDENCE_THRESHOLD)
+        self.assertEqual(upcoming_streams[0].name, "Gold Analysis")
+        self.assertEqual(upcoming_streams[0].start_time, datetime(2025, 1, 20, 14, 15, tzinfo=timezone.utc))
+
+    def test_clock_time_with_zone(self):
+        now = datetime(2025, 1, 20, 14, 0, tzinfo=timezone.utc)
+        upcoming_streams, confidence = extract_announcements(
+            "Join me tomorrow at 3pm EST for the Weekly Outlook call", TRWCampus.STOCKS, now
+        )
+        self.assertGreaterEqual(confidence, CONFIDENCE_THRESHOLD)
+        self.assertEqual(upcoming_streams[0].name, "Weekly Outlook")
+        self.assertEqual(upcoming_streams[0].start_time, datetime(2025, 1, 21, 20, 0, tzinfo=timezone.utc))
+
+    def test_ambiguous_message_defers_to_llm(self):
+        _, confidence = extract_announcements("Stream at 3pm and another one at 6pm", TRWCampus.STOCKS)
+        self.assertLess(confidence, CONFIDENCE_THRESHOLD)
+
+    def test_starting_now(self):
+        now = datetime(2025, 2, 8, 14, 1, tzinfo=timezone.utc)
+        upcoming_streams, confidence = extract_announcements(
+            "DAILY ANALYSIS LIVE STREAM STARTING NOW", TRWCampus.STOCKS, now
+        )
+        self.assertGreaterEqual(confidence, CONFIDENCE_THRESHOLD)
+        self.assertEqual(upcoming_streams[0].name, "Daily Analysis")
+        self.assertEqual(upcoming_streams[0].start_time, datetime(2025, 2, 8, 14, 0, tzinfo=timezone.utc))
+
+    def test_unreadable_time_defers_to_llm(self):
+        # "soon" passes the pre-filter, an empty result must not be trusted and cached
+        upcoming_streams, confidence = extract_announcements(
+            "Stream starting soon, Daily Crypto Analysis", TRWCampus.STOCKS
+        )
+        self.assertEqual(upcoming_streams, [])
+        self.assertLess(confidence, CONFIDENCE_THRESHOLD)
+
+    def test_dated_title_sets_the_day(self):
+        now = datetime(2025, 1, 20, 10, 0, tzinfo=timezone.utc)
+        upcoming_streams, confidence = extract_announcements(
+            "Weekly Review 25th January 2025\nstarting at 3pm UTC", TRWCampus.STOCKS, now
+        )
+        self.assertGreaterEqual(confidence, CONFIDENCE_THRESHOLD)
+        self.assertEqual(upcoming_streams[0].name, "Weekly Review")
+        self.assertEqual(upcoming_streams[0].start_time, datetime(2025, 1, 25, 15, 0, tzinfo=timezone.utc))
+
+    def test_date_in_a_sentence(self):
+        # not a title, so the sentence must not become the name, and the date is still the day
+        now = datetime(2025, 4, 28, 12, 0, tzinfo=timezone.utc)
+        upcoming_streams, confidence = extract_announcements(
+            "Join us for the Market Call at 5 pm EST on 1st May", TRWCampus.STOCKS, now
+        )
+        self.assertNotIn("Join us for the Market Call at 5 pm EST on", [stream.name for stream in upcoming_streams])
+        if confidence >= CONFIDENCE_THRESHOLD:
+            self.assertEqual(upcoming_streams[0].name, "Market Call")
+            self.assertEqual(upcoming_streams[0].start_time, datetime(2025, 5, 1, 21, 0, tzinfo=timezone.utc))
+
+    def test_date_that_is_over_defers_to_llm(self):
+        now = datetime(2025, 2, 10, 12, 0, tzinfo=timezone.utc)
+        _, confidence = extract_announcements(
+            "Weekly Review 3rd February\nLive stream starting at 3pm UTC", TRWCampus.STOCKS, now
+        )
+        self.assertLess(confidence, CONFIDENCE_THRESHOLD)
@@ -0,0 +1,66 @@
+import unittest
+
+from internal.capture_scheduler import CaptureScheduler, parse_campus_priorities
+from internal.schemas import TRWCampus
+
+
+class TestCaptureScheduler(unittest.TestCase):
+    def setUp(self):
+        self.load_per_cpu = 0.1
+        self.available_memory_mb = 8000
+        self.scheduler = CaptureScheduler(
+            max_concurrent=2,
+            numbers=[10, 11, 12],
+            campus_priorities={TRWCampus.STOCKS: 0},
+            resources=lambda: (self.load_per_cpu, self.available_memory_mb),
+        )
+
+    def test_priority_then_detection_order(self):
+        self.scheduler.enqueue("a", "channel-a", TRWCampus.COPYWRITING)
+        self.scheduler.enqueue("b", "channel-b", TRWCampus.ECOMMERCE)
+        self.scheduler.enqueue("c", "channel-c", TRWCampus.STOCKS)
+        self.assertEqual(self.scheduler.admit().stream_id, "c")
+        self.assertEqual(self.scheduler.admit().stream_id, "a")
+        # max_concurrent reached
+        self.assertIsNone(self.scheduler.admit())
+        self.assertEqual([capture.stream_id for capture in self.scheduler.state().queued], ["b"])
+
+    def test_numbers_are_reused(self):
+        for stream_id in "ab":
+            self.scheduler.enqueue(stream_id, "channel-" + stream_id, TRWCampus.STOCKS)
+        self.assertEqual(self.scheduler.admit().number, 10)
+        self.assertEqual(self.scheduler.admit().number, 11)
+        self.scheduler.finish("a")
+        self.scheduler.enqueue("c", "channel-c", TRWCampus.STOCKS)
+        self.assertEqual(self.scheduler.admit().number, 10)
+
+    def test_warm_slot_skips_memory_check(self):
+        self.available_memory_mb = 100
+        self.scheduler.enqueue("a", "channel-a", TRWCampus.STOCKS)
+        self.assertIsNone(self.scheduler.admit())
+        capture = self.scheduler.admit(warm_slot=0)
+        self.assertTrue(capture.warm)
+        self.assertEqual(capture.number, 0)
+        self.assertTrue(self.scheduler.is_active("channel-a"))
+        self.scheduler.finish("a")
+        self.assertEqual(self.scheduler.free_numbers, [10, 11, 12])
+
+    def test_cpu_headroom(self):
+        self.load_per_cpu = 2.0
+        self.scheduler.enqueue("a", "channel-a", TRWCampus.STOCKS)
+        self.assertIsNone(self.scheduler.admit(warm_slot=0))
+        self.assertEqual(self.scheduler.state().load_per_cpu, 2.0)
+
+    def test_drop(self):
+        self.scheduler.enqueue("a", "channel-a", TRWCampus.STOCKS)
+        self.assertTrue(self.scheduler.is_queued("channel-a"))
+        self.scheduler.drop("channel-a")
+        self.assertFalse(self.scheduler.is_queued("channel-a"))
+        self.assertIsNone(self.scheduler.admit())
+
+    def test_parse_campus_priorities(self):
+        self.assertEqual(
+            parse_campus_priorities("STOCKS:0, CRYPTO_TRADING:1,"),
+            {TRWCampus.STOCKS: 0, TRWCampus.CRYPTO_TRADING: 1},
+        )
+        self.assertEqual(parse_campus_priorities(""), {})
@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+
+import httpx
+
+from internal.stream_sources.exceptions import PageNotFound, UnexpectedResponse
+from internal.stream_sources.fetcher import Fetcher
+
+
+class TestFetcher(unittest.TestCase):
+    def run_with_responses(self, handler, coroutine, **kwargs):
+        async def run():
+            async with Fetcher(backoff=0, transport=httpx.MockTransport(handler), **kwargs) as fetcher:
+                return await coroutine(fetcher)
+
+        return asyncio.run(run())
+
+    def test_retries_server_errors(self):
+        attempts = []
+
+        def handler(request):
+            attempts.append(request.url)
+            if len(attempts) < 3:
+                return httpx.Response(503)
+            return httpx.Response(200, text="<h1>ok</h1>")
+
+        soup = self.run_with_responses(handler, lambda fetcher: fetcher.soup("https://example.com/a"))
+        self.assertEqual(soup.h1.text, "ok")
+        self.assertEqual(len(attempts), 3)
+
+    def test_gives_up_after_retries(self):
+        def handler(request):
+            return httpx.Response(500)
+
+        with self.assertRaises(UnexpectedResponse):
+            self.run_with_responses(handler, lambda fetcher: fetcher.get("https://example.com/a"), retries=2)
+
+    def test_not_found_is_not_retried(self):
+        attempts = []
+
+        def handler(request):
+            attempts.append(request.url)
+            return httpx.Response(404)
+
+        with self.assertRaises(PageNotFound):
+            self.run_with_responses(handler, lambda fetcher: fetcher.get("https://example.com/a"))
+        self.assertEqual(len(attempts), 1)
+
+    def test_soups_limits_concurrency_per_host(self):
+        in_flight = {"current": 0, "max": 0}
+
+        async def handler(request):
+            in_flight["current"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["current"])
+            await asyncio.sleep(0.01)
+            in_flight["current"] -= 1
+            if request.url.path == "/missing":
+                return httpx.Response(404)
+            return httpx.Response(200, text=f"<p>{request.url.path}</p>")
+
+        urls = [f"https://example.com/{i}" for i in range(10)] + ["https://example.com/missing"]
+        soups = self.run_with_responses(
+            handler, lambda fetcher: fetcher.soups(urls), max_connections_per_host=3
+        )
+        self.assertEqual([soup.p.text for soup in soups[:10]], [f"/{i}" for i in range(10)])
+        self.assertIsInstance(soups[10], PageNotFound)
+        self.assertEqual(in_flight["max"], 3)
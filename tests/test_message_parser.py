@@ -1,9 +1,11 @@
+import asyncio
 import unittest
 from datetime import datetime, timedelta, timezone
 
 from internal.env import Env
-from internal.message_parser import MessageParser, round_to_nearest_15_minutes
-from internal.schemas import TRWUpcomingStream
+from internal import message_parser
+from internal.message_parser import MessageParser, might_announce_stream, round_to_nearest_15_minutes
+from internal.schemas import TRWCampus, TRWStreamChatMessage, TRWUpcomingStream
 
 
 class TestMessageParser(unittest.TestCase):
@@ -140,3 +142,160 @@ There will be a watch-party hosted in the #live-streams channel. Don't miss it!"
                 round_to_nearest_15_minutes(case["dt"]),
                 case["expected_output"],
             )
+
+
+class FakeRedisClient:
+    def __init__(self):
+        self.parsed_messages = {}
+        self.stats = {}
+
+    def get_parsed_message(self, key):
+        return self.parsed_messages.get(key)
+
+    def set_parsed_message(self, key, upcoming_streams):
+        self.parsed_messages[key] = upcoming_streams
+
+    def increment_message_parser_stat(self, counter):
+        self.stats[counter] = self.stats.get(counter, 0) + 1
+
+
+class CountingMessageParser(MessageParser):
+    def __init__(self, redis_client):
+        super().__init__("test-key", redis_client)
+        self.parsed = []
+
+    def parse(self, message, campus, now=None):
+        self.parsed.append(message)
+        if "fail" in message:
+            raise RuntimeError("LLM unavailable")
+        return [TRWUpcomingStream(name="Daily call", start_time=datetime(2025, 1, 1, tzinfo=timezone.utc), campus=campus)]
+
+
+class TestMessageParserPrefilterAndCache(unittest.TestCase):
+    def test_might_announce_stream(self):
+        self.assertTrue(might_announce_stream("LIVE STREAM IN 5 MINUTES"))
+        self.assertTrue(might_announce_stream("Join me in 30 minutes for the first episode. Watch-party in #live-streams"))
+        self.assertTrue(might_announce_stream("POWER UP CALL When: Today 11:00 am EST, 4:00 pm UTC"))
+        self.assertTrue(might_announce_stream("live stream in a few minutes"))
+        self.assertTrue(might_announce_stream("going live in half an hour"))
+        self.assertTrue(might_announce_stream("live in 1h"))
+        self.assertTrue(might_announce_stream("Call in 5m"))
+        self.assertFalse(might_announce_stream("GM everyone, great wins today"))
+        self.assertFalse(might_announce_stream("Thanks for the stream G"))
+        self.assertFalse(might_announce_stream("@Students check the new lesson"))
+
+    def test_parse_chat_message(self):
+        redis_client = FakeRedisClient()
+        parser = CountingMessageParser(redis_client)
+        announcement = TRWStreamChatMessage(
+            id="1", message="Daily call in 10 minutes", author="Prof", time="10:00", reply_to=None,
+        )
+        chatter = TRWStreamChatMessage(id="2", message="GM", author="Student", time="10:01", reply_to=None)
+
+        first = parser.parse_chat_message(announcement, TRWCampus.STOCKS)
+        self.assertEqual(parser.parse_chat_message(announcement, TRWCampus.STOCKS), first)
+        self.assertEqual(parser.parse_chat_message(chatter, TRWCampus.STOCKS), [])
+        # the text is passed to the LLM, not the message object
+        self.assertEqual(parser.parsed, ["Daily call in 10 minutes"])
+        self.assertEqual(redis_client.stats, {"llm_calls": 1, "llm_requests": 1, "cache_hits": 1, "prefilter_skipped": 1})
+
+    def test_confident_local_parse_skips_llm(self):
+        redis_client = FakeRedisClient()
+        parser = CountingMessageParser(redis_client)
+        announcement = TRWStreamChatMessage(
+            id="3", message="Join me in 30 minutes for the Daily Product Analysis call", author="Prof",
+            time="10:00", reply_to=None,
+        )
+
+        upcoming_streams = parser.parse_chat_message(announcement, TRWCampus.STOCKS)
+        self.assertEqual([stream.name for stream in upcoming_streams], ["Daily Product Analysis"])
+        self.assertEqual(parser.parsed, [])
+        self.assertEqual(redis_client.stats, {"local_parses": 1})
+
+    def test_llm_failure_is_not_cached(self):
+        redis_client = FakeRedisClient()
+        parser = CountingMessageParser(redis_client)
+        announcement = TRWStreamChatMessage(
+            id="4", message="Stream at 3pm, fail", author="Prof", time="10:00", reply_to=None,
+        )
+
+        self.assertEqual(parser.parse_chat_message(announcement, TRWCampus.STOCKS), [])
+        self.assertEqual(redis_client.parsed_messages, {})
+
+
+class BatchingMessageParser(MessageParser):
+    def __init__(self, redis_client, max_concurrent_requests=2):
+        super().__init__("test-key", redis_client, max_concurrent_requests=max_concurrent_requests)
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def parse_batch(self, client, messages, now=None):
+        self.batches.append([message.id for message, _ in messages])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if any("fail" in message.message for message, _ in messages):
+            raise RuntimeError("LLM unavailable")
+        return {
+            message.id: [TRWUpcomingStream(name=message.id, start_time=datetime(2025, 1, 1, tzinfo=timezone.utc), campus=campus)]
+            for message, campus in messages
+            # the LLM may leave a message out
+            if "skip" not in message.message
+        }
+
+
+def chat_message(id, text):
+    return TRWStreamChatMessage(id=id, message=text, author="Prof", time="10:00", reply_to=None)
+
+
+class TestMessageParserBatching(unittest.TestCase):
+    def setUp(self):
+        self.batch_size = message_parser.LLM_BATCH_SIZE
+        message_parser.LLM_BATCH_SIZE = 2
+
+    def tearDown(self):
+        message_parser.LLM_BATCH_SIZE = self.batch_size
+
+    def test_parse_chat_messages(self):
+        redis_client = FakeRedisClient()
+        parser = BatchingMessageParser(redis_client)
+        messages = [
+            (chat_message("1", "Stream at 3pm"), TRWCampus.STOCKS),
+            (chat_message("2", "GM"), TRWCampus.STOCKS),
+            (chat_message("3", "Call at 4pm"), TRWCampus.CRYPTO_TRADING),
+            (chat_message("4", "Join me in 30 minutes for the Daily Product Analysis call"), TRWCampus.STOCKS),
+            (chat_message("5", "Session at 5pm"), TRWCampus.STOCKS),
+            (chat_message("6", "Live at 6pm, skip"), TRWCampus.STOCKS),
+            (chat_message("7", "Live at 7pm"), TRWCampus.STOCKS),
+        ]
+
+        results = parser.parse_chat_messages(messages)
+        self.assertEqual(list(results), ["1", "2", "3", "4", "5", "6", "7"])
+        self.assertEqual([stream.name for stream in results["1"]], ["1"])
+        self.assertEqual(results["3"][0].campus, TRWCampus.CRYPTO_TRADING)
+        self.assertEqual(results["2"], [])
+        self.assertEqual([stream.name for stream in results["4"]], ["Daily Product Analysis"])
+        self.assertEqual(results["6"], [])
+        # only the undecided messages go to the LLM, two per request and two requests at a time
+        self.assertEqual(parser.batches, [["1", "3"], ["5", "6"], ["7"]])
+        self.assertEqual(parser.max_in_flight, 2)
+        self.assertEqual(redis_client.stats["llm_requests"], 3)
+        self.assertEqual(redis_client.stats["llm_calls"], 5)
+        # a message the LLM left out is asked again next time
+        self.assertEqual(len(redis_client.parsed_messages), 5)
+
+    def test_failed_batch_uses_local_results(self):
+        redis_client = FakeRedisClient()
+        parser = BatchingMessageParser(redis_client)
+        messages = [
+            (chat_message("1", "Stream at 3pm, fail"), TRWCampus.STOCKS),
+            (chat_message("2", "Call at 4pm"), TRWCampus.STOCKS),
+            (chat_message("3", "Live at 5pm"), TRWCampus.STOCKS),
+        ]
+
+        results = parser.parse_chat_messages(messages)
+        self.assertEqual(results["1"], [])
+        self.assertEqual([stream.name for stream in results["3"]], ["3"])
+        self.assertEqual(len(redis_client.parsed_messages), 1)
@@ -0,0 +1,179 @@
+import base64
+import re
+import socketserver
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from internal.otp_fetcher import OTPFetcher, find_otp
+
+SENDER = "no-reply@therealworld.ag"
+
+
+class IMAPStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of an IMAP server for OTPFetcher, mails can be delivered while a client idles."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, idle: bool = True):
+        super().__init__(("127.0.0.1", 0), IMAPStandInHandler)
+        self.capabilities = "IMAP4rev1 IDLE" if idle else "IMAP4rev1"
+        self.mails = []
+        self.commands = []
+        self.idling = []
+        # mails that arrive when the next IDLE comes in, announced before its continuation
+        self.arriving_on_idle = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def deliver(self, sender: str, body: bytes, received: datetime | None = None) -> None:
+        with self.lock:
+            self.mails.append({"sender": sender, "body": body, "received": received or datetime.now(timezone.utc)})
+            for handler in self.idling:
+                handler.write(f"* {len(self.mails)} EXISTS")
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class IMAPStandInHandler(socketserver.StreamRequestHandler):
+    def write(self, line: str | bytes) -> None:
+        self.wfile.write((line.encode() if isinstance(line, str) else line) + b"\r\n")
+
+    def handle(self) -> None:
+        server: IMAPStandIn = self.server
+        self.write("* OK IMAP stand-in ready")
+        for raw_line in self.rfile:
+            tag, command, *args = raw_line.decode().strip().split(" ", 2)
+            args = args[0] if args else ""
+            server.commands.append(f"{command} {args}".strip())
+            if command == "CAPABILITY":
+                self.write(f"* CAPABILITY {server.capabilities}")
+            elif command == "EXAMINE":
+                self.write(f"* {len(server.mails)} EXISTS")
+                self.write(f"{tag} OK [READ-ONLY] EXAMINE completed")
+                continue
+            elif command == "SEARCH":
+                self.write("* SEARCH " + " ".join(self.search(args)))
+            elif command == "FETCH":
+                self.fetch(args)
+            elif command == "IDLE":
+                with server.lock:
+                    server.mails += server.arriving_on_idle
+                    if server.arriving_on_idle:
+                        self.write(f"* {len(server.mails)} EXISTS")
+                    server.arriving_on_idle = []
+                    server.idling.append(self)
+                self.write("+ idling")
+                self.rfile.readline()
+                with server.lock:
+                    server.idling.remove(self)
+            elif command == "LOGOUT":
+                self.write("* BYE")
+                self.write(f"{tag} OK LOGOUT completed")
+                return
+            self.write(f"{tag} OK {command} completed")
+
+    def search(self, criteria: str) -> list:
+        since = datetime.strptime(re.search(r"SINCE (\S+)", criteria).group(1), "%d-%b-%Y").date()
+        sender = re.search(r'FROM "([^"]+)"', criteria)
+        return [
+            str(number)
+            for number, mail in enumerate(self.server.mails, 1)
+            if mail["received"].date() >= since and (not sender or mail["sender"] == sender.group(1))
+        ]
+
+    def fetch(self, args: str) -> None:
+        number, items = args.split(" ", 1)
+        mail = self.server.mails[int(number) - 1]
+        if items == "(INTERNALDATE)":
+            received = mail["received"].strftime("%d-%b-%Y %H:%M:%S +0000")
+            self.write(f'* {number} FETCH (INTERNALDATE "{received}")')
+        elif items == "(BODY.PEEK[1])":
+            self.write(f"* {number} FETCH (BODY[1] {{{len(mail['body'])}}}")
+            self.wfile.write(mail["body"] + b")\r\n")
+
+
+class TestOTPFetcher(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def fetcher(self, idle: bool = True, sender: str = SENDER) -> tuple[IMAPStandIn, OTPFetcher]:
+        server = IMAPStandIn(idle)
+        self.servers.append(server)
+        return server, OTPFetcher("me@example.com", "secret", "127.0.0.1", server.server_address[1], False, sender)
+
+    def wait_in_background(self, fetcher: OTPFetcher, since: datetime, timeout: float) -> dict:
+        result = {}
+
+        def wait():
+            started = time.monotonic()
+            result["otp"] = fetcher.wait_for_otp(since, timeout)
+            result["seconds"] = time.monotonic() - started
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        result["thread"] = thread
+        return result
+
+    def test_code_is_delivered_while_idling(self):
+        server, fetcher = self.fetcher()
+        attempt_started = datetime.now(timezone.utc)
+        # a code from an earlier login attempt
+        server.deliver(SENDER, b"Your code is 111111", attempt_started - timedelta(minutes=5))
+
+        result = self.wait_in_background(fetcher, attempt_started, 10)
+        time.sleep(0.3)
+        server.deliver(SENDER, b"Your verification code is =\r\n222222")
+        result["thread"].join(10)
+
+        self.assertEqual(result["otp"], "222222")
+        self.assertLess(result["seconds"], 2)
+        self.assertIn("IDLE", server.commands)
+        self.assertTrue(all("RFC822" not in command for command in server.commands))
+        search = next(command for command in server.commands if command.startswith("SEARCH"))
+        self.assertIn("UNSEEN SINCE", search)
+        self.assertIn(f'FROM "{SENDER}"', search)
+
+    def test_polls_without_idle(self):
+        server, fetcher = self.fetcher(idle=False)
+        server.deliver("friend@example.com", b"call me at 333333")
+
+        result = self.wait_in_background(fetcher, datetime.now(timezone.utc), 10)
+        time.sleep(0.3)
+        server.deliver(SENDER, base64.encodebytes(b"Your verification code is 444444"))
+        result["thread"].join(10)
+
+        self.assertEqual(result["otp"], "444444")
+        self.assertLess(result["seconds"], 3)
+        self.assertNotIn("IDLE", server.commands)
+
+    def test_mail_announced_before_idle_is_accepted(self):
+        server, fetcher = self.fetcher()
+        # the code arrives between the search and the IDLE
+        server.arriving_on_idle.append(
+            {"sender": SENDER, "body": b"Your verification code is 555555", "received": datetime.now(timezone.utc)}
+        )
+        started = time.monotonic()
+        self.assertEqual(fetcher.wait_for_otp(datetime.now(timezone.utc) - timedelta(seconds=1), 10), "555555")
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_timeout(self):
+        server, fetcher = self.fetcher()
+        server.deliver(SENDER, b"Your code is 111111", datetime.now(timezone.utc) - timedelta(minutes=5))
+        started = time.monotonic()
+        self.assertIsNone(fetcher.wait_for_otp(datetime.now(timezone.utc), 0.5))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_find_otp(self):
+        self.assertEqual(find_otp(b"code: 123456"), "123456")
+        self.assertEqual(find_otp(b"code: =\r\n654321"), "654321")
+        self.assertEqual(find_otp(base64.encodebytes(b"code: 987654")), "987654")
+        self.assertIsNone(find_otp(b"no code here 1234"))
@@ -0,0 +1,67 @@
+import multiprocessing
+import time
+import unittest
+
+from internal.redis import RedisClient, RedisCommandCounter, TRWChatBuffer
+from internal.schemas import TRWStreamChatMessage
+
+
+class FakeRedisClient:
+    def __init__(self):
+        self.published = []
+
+    def add_trw_stream_messages(self, stream_id, messages):
+        self.published.append((stream_id, [message.id for message in messages]))
+
+
+def chat_message(id):
+    return TRWStreamChatMessage(id=id, message="GM", author="Student", time="10:00", reply_to=None)
+
+
+class TestTRWChatBuffer(unittest.TestCase):
+    def test_flushes_when_full(self):
+        redis_client = FakeRedisClient()
+        chat_buffer = TRWChatBuffer(redis_client, "stream", max_messages=3, interval=60)
+        chat_buffer.add([chat_message("1"), chat_message("2")])
+        self.assertEqual(redis_client.published, [])
+        chat_buffer.add([chat_message("3"), chat_message("4")])
+        self.assertEqual(redis_client.published, [("stream", ["1", "2", "3", "4"])])
+
+    def test_flushes_on_time(self):
+        redis_client = FakeRedisClient()
+        chat_buffer = TRWChatBuffer(redis_client, "stream", max_messages=50, interval=0.05)
+        chat_buffer.add([chat_message("1")])
+        chat_buffer.add([])
+        self.assertEqual(redis_client.published, [])
+        time.sleep(0.06)
+        # an empty poll still sends what has waited long enough
+        chat_buffer.add([])
+        self.assertEqual(redis_client.published, [("stream", ["1"])])
+        chat_buffer.flush()
+        self.assertEqual(len(redis_client.published), 1)
+
+
+def child_gets_own_connection(redis_client, parent_redis, results):
+    results.put(redis_client.redis is not parent_redis and redis_client.redis is redis_client.redis)
+
+
+class TestRedisClient(unittest.TestCase):
+    def test_connection_per_process(self):
+        redis_client = RedisClient("localhost", 6379)
+        parent_redis = redis_client.redis
+        self.assertIs(redis_client.redis, parent_redis)
+
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        process = context.Process(target=child_gets_own_connection, args=(redis_client, parent_redis, results))
+        process.start()
+        process.join(10)
+        self.assertTrue(results.get(timeout=1))
+        self.assertIs(redis_client.redis, parent_redis)
+
+    def test_command_counter(self):
+        counter = RedisCommandCounter()
+        counter.record(1, 0.002)
+        counter.record(10, 0.003)
+        self.assertEqual(counter.take(), (2, 11, 0.005))
+        self.assertEqual(counter.take(), (0, 0, 0.0))
@@ -0,0 +1,63 @@
+import unittest
+
+from internal.utils import RENDITIONS, build_relay_command, rendition_url
+
+
+class TestRelayCommand(unittest.TestCase):
+    def option(self, command, name):
+        return command[command.index(name) + 1]
+
+    def test_single_rendition(self):
+        command = build_relay_command("rtmp://server/live/id?key=k", "sink", ":100")
+        self.assertEqual(self.option(command, "-filter_complex"), "[0:v]fps=24,split=1[s0];[s0]null[v0]")
+        self.assertEqual(self.option(command, "-f"), "x11grab")
+        self.assertEqual(command[-2:], ["tee", "[select='v:0,a:0':f=flv]rtmp://server/live/id?key=k"])
+
+    def test_ladder_is_encoded_once(self):
+        command = build_relay_command(
+            "rtmp://server/live/id?key=k",
+            "sink",
+            ":100",
+            [RENDITIONS["720p"], RENDITIONS["480p"], RENDITIONS["audio"]],
+            "/srv/hls/id/index.m3u8",
+        )
+        self.assertEqual(command.count("ffmpeg"), 1)
+        self.assertEqual(
+            self.option(command, "-filter_complex"),
+            "[0:v]fps=24,split=2[s0][s1];[s0]null[v0];[s1]scale=-2:480[v1]",
+        )
+        self.assertEqual(self.option(command, "-b:v:0"), "2M")
+        self.assertEqual(self.option(command, "-b:v:1"), "900k")
+        # one audio encode shared by every output
+        self.assertEqual(command.count("1:a"), 1)
+        self.assertEqual(
+            command[-1].split("|"),
+            [
+                "[select='v:0,a:0':f=flv]rtmp://server/live/id?key=k",
+                "[select='v:0,a:0':f=hls:hls_time=2:hls_list_size=6:hls_flags=delete_segments:onfail=ignore]/srv/hls/id/index.m3u8",
+                "[select='v:1,a:0':f=flv:onfail=ignore]rtmp://server/live/id_480p?key=k",
+                "[select='a:0':f=flv:onfail=ignore]rtmp://server/live/id_audio?key=k",
+            ],
+        )
+
+    def test_rendition_url(self):
+        self.assertEqual(rendition_url("rtmp://s/live/id", RENDITIONS["480p"], False), "rtmp://s/live/id_480p")
+        self.assertEqual(rendition_url("rtmp://s/live/id", RENDITIONS["720p"], True), "rtmp://s/live/id")
+
+    def test_capture_region_and_decimate(self):
+        command = build_relay_command(
+            "rtmp://server/live/id",
+            "sink",
+            ":100",
+            [RENDITIONS["720p"], RENDITIONS["480p"]],
+            capture_region=(10, 80, 960, 540),
+            decimate=True,
+        )
+        self.assertEqual(self.option(command, "-video_size"), "960x540")
+        self.assertEqual(self.option(command, "-i"), ":100+10,80")
+        self.assertEqual(
+            self.option(command, "-filter_complex"),
+            "[0:v]fps=24,mpdecimate=max=23,split=2[s0][s1];"
+            "[s0]scale=-2:min(720\\,ih)[v0];[s1]scale=-2:min(480\\,ih)[v1]",
+        )
+        self.assertEqual(self.option(command, "-fps_mode"), "vfr")
@@ -0,0 +1,110 @@
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from internal.relay_supervisor import FFmpegProgressParser, RelaySupervisor
+
+PROGRESS_BLOCK = """frame=240
+fps=24.01
+stream_0_0_q=28.0
+bitrate=2010.5kbits/s
+total_size=2512345
+out_time_us=10000000
+out_time_ms=10000000
+out_time=00:00:10.000000
+dup_frames=3
+drop_frames=1
+speed=%s
+progress=continue
+"""
+
+
+def fake_ffmpeg(speed: str, blocks: int) -> subprocess.Popen:
+    script = "import sys\nfor _ in range(%d):\n    sys.stdout.write(%r)\n    sys.stdout.flush()\n" % (
+        blocks, PROGRESS_BLOCK % speed,
+    )
+    return subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True)
+
+
+def real_time_ffmpeg(speed: str, blocks: int, interval: float) -> subprocess.Popen:
+    """Progress of a real-time input, out_time advances with the wall clock."""
+    script = (
+        "import sys, time\n"
+        "for i in range(%d):\n"
+        "    sys.stdout.write('out_time_us=%%d\\nspeed=%s\\nprogress=continue\\n' %% (i * %d))\n"
+        "    sys.stdout.flush()\n"
+        "    time.sleep(%r)\n"
+    ) % (blocks, speed, int(interval * 1_000_000), interval)
+    return subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True)
+
+
+class TestFFmpegProgressParser(unittest.TestCase):
+    def test_parses_block(self):
+        parser = FFmpegProgressParser()
+        lines = (PROGRESS_BLOCK % "1.01x").splitlines()
+        for line in lines[:-1]:
+            self.assertIsNone(parser.feed(line))
+        stats = parser.feed(lines[-1])
+        self.assertEqual(stats.fps, 24.01)
+        self.assertEqual(stats.speed, 1.01)
+        self.assertEqual(stats.bitrate_kbps, 2010.5)
+        self.assertEqual(stats.frames, 240)
+        self.assertEqual(stats.dup_frames, 3)
+        self.assertEqual(stats.drop_frames, 1)
+        self.assertEqual(stats.out_time_seconds, 10)
+
+    def test_not_available_values(self):
+        parser = FFmpegProgressParser()
+        for line in ["frame=0", "fps=0.00", "bitrate=N/A", "speed=N/A"]:
+            parser.feed(line)
+        stats = parser.feed("progress=continue")
+        self.assertIsNone(stats.bitrate_kbps)
+        self.assertIsNone(stats.speed)
+        self.assertEqual(stats.frames, 0)
+
+
+class TestRelaySupervisor(unittest.TestCase):
+    def supervise(self, speed: str, blocks: int, starts_wanted: int):
+        starts = []
+        stats = []
+        done = threading.Event()
+
+        def start_relay():
+            starts.append(1)
+            if len(starts) == starts_wanted:
+                done.set()
+            return fake_ffmpeg(speed, blocks)
+
+        supervisor = RelaySupervisor(start_relay, stats.append, slow_grace=0, backoff=0)
+        supervisor.start()
+        self.assertTrue(done.wait(10))
+        supervisor.stop()
+        return supervisor, stats
+
+    def test_restarts_when_relay_exits(self):
+        supervisor, stats = self.supervise("1.00x", 2, 3)
+        self.assertGreaterEqual(supervisor.restarts, 2)
+        self.assertEqual(stats[0].speed, 1.0)
+
+    def test_restarts_when_relay_is_slow(self):
+        # a slow relay is restarted after its first update, before it writes the rest
+        supervisor, stats = self.supervise("0.80x", 1000, 2)
+        self.assertGreaterEqual(supervisor.restarts, 1)
+        self.assertLess(len(stats), 1000)
+        self.assertEqual(stats[0].restarts, 0)
+
+    def test_real_time_relay_is_not_restarted(self):
+        # ffmpeg's cumulative speed stays just under 1x for a healthy real-time capture
+        stats = []
+        supervisor = RelaySupervisor(
+            lambda: real_time_ffmpeg("0.99x", 25, 0.1), stats.append, slow_grace=0.5, backoff=0
+        )
+        supervisor.start()
+        deadline = time.monotonic() + 10
+        while len(stats) < 25 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        supervisor.stop()
+        self.assertEqual(len(stats), 25)
+        self.assertEqual({stat.restarts for stat in stats}, {0})
@@ -0,0 +1,116 @@
+import unittest
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from internal.models.base import Base
+from internal.models.hurawatch import HuraWatchMovie
+from internal.models.libgen import LibgenBook
+from internal.schemas import CatalogSource
+from internal.search import init_search_index, search_catalog
+from internal.stream_sources.hurawatch import upsert_movies
+from internal.stream_sources.libgen import get_or_create_libgen_topic, upsert_libgen_books
+
+
+def movie(hurawatch_id, title, storyline, directors, writers, stars, is_movie, genres):
+    return {
+        "hurawatch_id": hurawatch_id,
+        "title": title,
+        "movie_embed_url": None,
+        "thumbnail_url": "thumb",
+        "storyline": storyline,
+        "directors": directors,
+        "writers": writers,
+        "stars": stars,
+        "is_movie": is_movie,
+        "genres": genres,
+        "episode_embed_links": [],
+    }
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=self.engine)
+        init_search_index(self.engine)
+        self.session = Session(self.engine)
+        self.genre_ids = {}
+
+        upsert_movies(
+            self.session,
+            [
+                movie(
+                    1, "Interstellar", "A team travels through a wormhole in space.",
+                    "Christopher Nolan", "Jonathan Nolan", "Matthew McConaughey", True, ["drama"],
+                ),
+                movie(
+                    2, "Space Force", "A comedy about a new military branch.",
+                    "Greg Daniels", None, "Steve Carell", False, ["comedy"],
+                ),
+            ],
+            self.genre_ids,
+        )
+        self.interstellar, self.space_show = self.session.scalars(
+            select(HuraWatchMovie).order_by(HuraWatchMovie.hurawatch_id)
+        ).all()
+        algebra = get_or_create_libgen_topic(self.session, "Mathematics", "Algebra")
+        upsert_libgen_books(self.session, [{
+            "libgen_id": 100,
+            "title": "Linear Algebra Done Right",
+            "authors": "Sheldon Axler",
+            "publisher": "Springer",
+            "year": "2015",
+            "pages": "340",
+            "language": "English",
+            "size": "3 Mb",
+            "extension": "pdf",
+            "download_link": "https://example.com/1",
+            "topic_id": algebra.id,
+        }])
+        self.book = self.session.scalars(select(LibgenBook)).one()
+
+    def tearDown(self):
+        self.session.close()
+
+    def search(self, query, **filters):
+        return [(source, ref_id) for source, ref_id, _ in search_catalog(self.session, query, **filters)]
+
+    def test_prefix_match_across_catalogs(self):
+        self.assertEqual(self.search("interst"), [(CatalogSource.HURAWATCH, self.interstellar.id)])
+        self.assertEqual(self.search("axl"), [(CatalogSource.LIBGEN, self.book.id)])
+        self.assertEqual(self.search("nolan wormhole"), [(CatalogSource.HURAWATCH, self.interstellar.id)])
+        self.assertEqual(self.search("nothing matches"), [])
+        self.assertEqual(self.search("  "), [])
+
+    def test_title_matches_rank_first(self):
+        # "space" is in the title of one show and only in the storyline of the other movie
+        self.assertEqual(
+            self.search("space"),
+            [(CatalogSource.HURAWATCH, self.space_show.id), (CatalogSource.HURAWATCH, self.interstellar.id)],
+        )
+
+    def test_filters(self):
+        self.assertEqual(self.search("space", is_movie=True), [(CatalogSource.HURAWATCH, self.interstellar.id)])
+        self.assertEqual(self.search("space", genre="comedy"), [(CatalogSource.HURAWATCH, self.space_show.id)])
+        self.assertEqual(self.search("space", source=CatalogSource.LIBGEN), [])
+        self.assertEqual(self.search("algebra", topic="Mathematics"), [(CatalogSource.LIBGEN, self.book.id)])
+        self.assertEqual(self.search("algebra", subtopic="Geometry"), [])
+        self.assertEqual(self.search("algebra", topic="Mathematics", is_movie=True), [])
+
+    def test_upsert_keeps_index_in_sync(self):
+        upsert_movies(
+            self.session,
+            [movie(1, "Tenet", "Time inversion.", "Christopher Nolan", None, "John David Washington", True, [])],
+            self.genre_ids,
+        )
+        self.assertEqual(self.search("interstellar"), [])
+        self.assertEqual(self.search("tenet"), [(CatalogSource.HURAWATCH, self.interstellar.id)])
+
+    def test_backfill_existing_rows(self):
+        self.session.execute(text("DELETE FROM catalog_search"))
+        self.session.commit()
+        init_search_index(self.engine)
+        self.assertEqual(self.search("axler"), [(CatalogSource.LIBGEN, self.book.id)])
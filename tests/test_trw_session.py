@@ -0,0 +1,47 @@
+import json
+import os
+import stat
+import tempfile
+import unittest
+
+from internal.trw_session import TRWSessionStore
+
+
+class TestTRWSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = TRWSessionStore(os.path.join(self.directory.name, "session", "trw.json"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_and_load(self):
+        self.assertIsNone(self.store.load())
+        rauth = json.dumps({"token": "abc"})
+        self.store.save(rauth, [{"name": "cf", "value": "1"}])
+
+        session = self.store.load()
+        self.assertEqual(session.rauth, rauth)
+        self.assertEqual(session.token, "abc")
+        self.assertEqual(session.cookies, [{"name": "cf", "value": "1"}])
+        self.assertEqual(stat.S_IMODE(os.stat(self.store.path).st_mode), 0o600)
+
+    def test_discard_only_removes_rejected_session(self):
+        rejected = self.store.save(json.dumps({"token": "old"}), [])
+        self.store.save(json.dumps({"token": "new"}), [])
+        self.store.discard(rejected)
+        self.assertEqual(self.store.load().token, "new")
+
+        self.store.discard(self.store.load())
+        self.assertIsNone(self.store.load())
+
+    def test_unreadable_file_is_ignored(self):
+        os.makedirs(os.path.dirname(self.store.path))
+        with open(self.store.path, "w") as f:
+            f.write("not json")
+        self.assertIsNone(self.store.load())
+
+    def test_login_lock(self):
+        with self.store.login_lock():
+            self.store.save("{}", [])
+        self.assertIsNone(self.store.load().token)
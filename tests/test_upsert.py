@@ -0,0 +1,122 @@
+import unittest
+
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from internal.database import init_db
+from internal.models.base import Base
+from internal.models.hurawatch import HuraWatchEpisode, HuraWatchMovie, HuraWatchGenre
+from internal.models.libgen import LibgenBook
+from internal.schemas import CatalogSource
+from internal.search import init_search_index, search_catalog
+from internal.stream_sources.hurawatch import upsert_movies, movie_row
+from internal.stream_sources.libgen import upsert_libgen_books, get_or_create_libgen_topic
+
+
+def movie_info(title, genres):
+    return {
+        "title": title,
+        "genres": genres,
+        "directors": None,
+        "writers": None,
+        "stars": None,
+        "storyline": None,
+        "thumbnail_url": "thumb",
+    }
+
+
+class TestUpsert(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=self.engine)
+        init_search_index(self.engine)
+        self.session = Session(self.engine)
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", lambda *args: self.statements.append(args[2]))
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_upsert_movies_page(self):
+        genre_ids = {}
+        upsert_movies(
+            self.session,
+            [
+                movie_row(1, movie_info("Show", ["drama", "comedy"]), None, False, ["e1", "e2", "e3"]),
+                movie_row(2, movie_info("Film", ["drama"]), "embed", True),
+            ],
+            genre_ids,
+        )
+        # one statement per table, however many rows and episodes the page has
+        self.assertLessEqual(len(self.statements), 8)
+        self.assertEqual(set(genre_ids), {"drama", "comedy"})
+
+        self.statements.clear()
+        upsert_movies(
+            self.session,
+            [movie_row(1, movie_info("Show renamed", ["comedy"]), None, False, ["e1", "e2 fixed"])],
+            genre_ids,
+        )
+        self.assertFalse(any("hurawatch_genres" in statement for statement in self.statements))
+
+        self.session.expire_all()
+        show = self.session.scalars(select(HuraWatchMovie).where(HuraWatchMovie.hurawatch_id == 1)).one()
+        self.assertEqual(show.title, "Show renamed")
+        self.assertEqual([genre.name for genre in show.genres], ["comedy"])
+        self.assertEqual([episode.embed_url for episode in show.episodes], ["e1", "e2 fixed", "e3"])
+        self.assertEqual(len(self.session.scalars(select(HuraWatchGenre)).all()), 2)
+        self.assertEqual(
+            [ref_id for _, ref_id, _ in search_catalog(self.session, "renamed")], [show.id]
+        )
+
+    def test_upsert_libgen_books(self):
+        topic_id = get_or_create_libgen_topic(self.session, "Mathematics", "Algebra").id
+        book = {
+            "libgen_id": 7,
+            "title": "Algebra",
+            "authors": "Artin",
+            "publisher": "Pearson",
+            "year": "2010",
+            "pages": "560",
+            "language": "English",
+            "size": "5 Mb",
+            "extension": "pdf",
+            "download_link": "https://example.com/old",
+            "topic_id": topic_id,
+        }
+        upsert_libgen_books(self.session, [book, {**book, "libgen_id": 8, "title": "Topology"}])
+        upsert_libgen_books(self.session, [{**book, "download_link": "https://example.com/new"}])
+
+        self.session.expire_all()
+        books = self.session.scalars(select(LibgenBook).order_by(LibgenBook.libgen_id)).all()
+        self.assertEqual([book.libgen_id for book in books], [7, 8])
+        self.assertEqual(books[0].download_link, "https://example.com/new")
+        self.assertEqual(
+            search_catalog(self.session, "topol")[0][:2], (CatalogSource.LIBGEN, books[1].id)
+        )
+
+    def test_init_db_removes_duplicate_episodes(self):
+        # a database from before the unique index, with an episode scraped twice
+        self.session.execute(text("DROP INDEX hurawatch_episodes_show_number_idx"))
+        upsert_movies(self.session, [movie_row(1, movie_info("Show", []), None, False)], {})
+        self.session.execute(
+            HuraWatchEpisode.__table__.insert(),
+            [
+                {"tv_show_id": 1, "episode_number": 1, "embed_url": "e1"},
+                {"tv_show_id": 1, "episode_number": 2, "embed_url": "e2"},
+                {"tv_show_id": 1, "episode_number": 2, "embed_url": "e2 again"},
+            ],
+        )
+        self.session.commit()
+
+        init_db(self.engine)
+
+        self.session.expire_all()
+        show = self.session.scalars(select(HuraWatchMovie)).one()
+        self.assertEqual([episode.embed_url for episode in show.episodes], ["e1", "e2 again"])
+        upsert_movies(self.session, [movie_row(1, movie_info("Show", []), None, False, ["e1", "e2", "e3"])], {})
+        self.session.expire_all()
+        self.assertEqual([episode.embed_url for episode in show.episodes], ["e1", "e2", "e3"])
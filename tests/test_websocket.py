@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+
+from fastapi.websockets import WebSocketState
+
+from internal import websocket as websocket_module
+from internal.websocket import ConnectionManager, entry_id_order
+from internal.schemas import TRWStreamChatMessage
+
+
+def chat_message(id):
+    return TRWStreamChatMessage(id=id, message="GM", author="Student", time="10:00", reply_to=None)
+
+
+class FakeRedisClient:
+    """Chat of one stream as a list of (entry id, message), new entries wake up readers."""
+
+    def __init__(self, count):
+        self.entries = [(f"{i}-0", chat_message(str(i))) for i in range(1, count + 1)]
+        self.added = asyncio.Event()
+        self.read_errors = 0
+
+    def add(self, count):
+        start = len(self.entries) + 1
+        self.entries += [(f"{i}-0", chat_message(str(i))) for i in range(start, start + count)]
+        self.added.set()
+
+    async def get_trw_stream_last_message_id(self, stream_id):
+        return self.entries[-1][0] if self.entries else "0-0"
+
+    async def get_trw_stream_messages(self, stream_id, count, after_id=None):
+        if after_id:
+            return [entry for entry in self.entries if entry_id_order(entry[0]) > entry_id_order(after_id)][:count]
+        return self.entries[-count:]
+
+    async def read_trw_stream_messages(self, stream_id, after_id, block_ms):
+        if self.read_errors:
+            self.read_errors -= 1
+            raise ConnectionError("connection reset")
+        while True:
+            entries = await self.get_trw_stream_messages(stream_id, 100, after_id)
+            if entries:
+                return entries
+            self.added.clear()
+            await self.added.wait()
+
+
+class FakeWebSocket:
+    application_state = WebSocketState.CONNECTED
+
+    def __init__(self):
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, payload):
+        self.received.append(payload["entry_id"])
+
+
+class TestConnectionManager(unittest.IsolatedAsyncioTestCase):
+    async def test_replay_then_live(self):
+        redis_client = FakeRedisClient(10)
+        manager = ConnectionManager(redis_client)
+        websocket = FakeWebSocket()
+        await manager.connect("stream", websocket, replay=3)
+        self.assertEqual(websocket.received, ["8-0", "9-0", "10-0"])
+
+        redis_client.add(2)
+        await asyncio.sleep(0.05)
+        self.assertEqual(websocket.received, ["8-0", "9-0", "10-0", "11-0", "12-0"])
+        manager.disconnect("stream", websocket)
+        self.assertEqual(manager.stream_subscribers, {})
+
+    async def test_resume_after_reconnect(self):
+        redis_client = FakeRedisClient(10)
+        manager = ConnectionManager(redis_client)
+        watching = FakeWebSocket()
+        await manager.connect("stream", watching, replay=0)
+
+        reconnected = FakeWebSocket()
+        await manager.connect("stream", reconnected, last_id="7-0")
+        redis_client.add(1)
+        await asyncio.sleep(0.05)
+        # every message once and in order, whether it came from the replay or the subscriber
+        self.assertEqual(reconnected.received, ["8-0", "9-0", "10-0", "11-0"])
+        self.assertEqual(watching.received, ["11-0"])
+        self.assertEqual(len(manager.stream_subscribers), 1)
+        manager.disconnect("stream", watching)
+        manager.disconnect("stream", reconnected)
+
+    async def test_subscriber_survives_read_error(self):
+        retry_delay = websocket_module.CHAT_READ_RETRY_DELAY
+        websocket_module.CHAT_READ_RETRY_DELAY = 0.01
+        self.addCleanup(setattr, websocket_module, "CHAT_READ_RETRY_DELAY", retry_delay)
+        redis_client = FakeRedisClient(2)
+        redis_client.read_errors = 1
+        manager = ConnectionManager(redis_client)
+        websocket = FakeWebSocket()
+        await manager.connect("stream", websocket, replay=0)
+
+        redis_client.add(2)
+        await asyncio.sleep(0.1)
+        self.assertEqual(websocket.received, ["3-0", "4-0"])
+        self.assertIn("stream", manager.stream_subscribers)
+        manager.disconnect("stream", websocket)